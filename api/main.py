@@ -1,49 +1,81 @@
+import time
+
+# Début de l'import du module : mesure du temps d'import (IMPORT_BUDGET_SECONDS)
+IMPORT_STARTED = time.perf_counter()
+
 import asyncio
-import base64
 import json
+import logging
 import os
 import re
-import tempfile
-import wave
+import uuid
 from datetime import datetime
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, WebSocket, UploadFile, File, Form
-from kasa import Discover
-import magic
 
 from pydantic import BaseModel
-import httpx
-from starlette.responses import StreamingResponse, JSONResponse
-from llama_index.tools.mcp import BasicMCPClient, McpToolSpec
-from llama_index.llms.ollama import Ollama
-from llama_index.core.agent.workflow import (
-    FunctionAgent,
-    ToolCall)
-from llama_index.core.agent.workflow.workflow_events import (
-    ToolCallResult,
-)
-from llama_index.core.workflow import Context
+from starlette.requests import HTTPConnection, Request
+from starlette.responses import JSONResponse, Response
 from starlette.websockets import WebSocketDisconnect
-from faster_whisper import WhisperModel
 from api.models.discussion import DiscussionRequest
-
-# Load faster-whisper model (only once)
+from api.services import metrics
+from api.services.agent_cache import AgentCache
+from api.services.asr import segmenter_from_env
+from api.services.batch_translation import BatchTranslator, translation_prompt
+from api.services.asr_pool import AsrQueueFull, AsrWorkerPool
+from api.services.http_clients import UpstreamClients
+from api.services.intent_router import Intent, IntentRouter
+from api.services.llm_pool import GenerationFailed, OllamaPool
+from api.services.logging_setup import configure_logging
+from api.services.model_residency import ModelResidency
+from api.services.n8n_upload import FORM_OVERHEAD, BodySizeLimitMiddleware, UploadRejected, inspect_upload
+from api.services.offload import Offloader
+from api.services.readiness import Readiness
+from api.services.scheduler import Lease, Rejected, Scheduler
+from api.services.sessions import SessionStore
+from api.services.streaming import EventStreamer
+from api.services.translation_cache import TranslationCache, cache_key
+from api.services.translation_parser import TranslationStreamParser
+from api.services.voice_session import VoiceSession
+from api.services.webhook_queue import WebhookQueue
+from mcp_tools.kasa_registry import KasaRegistry
+
+if TYPE_CHECKING:
+    # llama_index (~2 s d'import) est chargé en tâche de fond au démarrage, voir load_agent_stack()
+    from llama_index.core.agent.workflow import FunctionAgent
+    from llama_index.core.workflow import Context
 
 load_dotenv()
 
-model_size = "small"
-asr_model = WhisperModel(model_size, compute_type="int8")
+# Logs structurés (LOG_LEVEL, LOG_FORMAT), métriques Prometheus sur /metrics
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Service ASR partagé par toutes les sessions /ws/speak (modèle, compute type, langue, workers : ASR_*)
+asr_service = AsrWorkerPool.from_env()
+# Débordement des jobs lourds hors du processus de l'API : pool de processus local ou Modal (OFFLOAD_*)
+offloader = Offloader.from_env()
+# Files entre les étapes d'une session vocale (énoncés en attente d'ASR / d'agent, événements à envoyer)
+VOICE_QUEUE_SIZE = int(os.getenv("VOICE_QUEUE_SIZE", "4"))
+VOICE_SEND_QUEUE_SIZE = int(os.getenv("VOICE_SEND_QUEUE_SIZE", "64"))
 
 MODEL_NAME = "mistral-small:latest"  # ou mistral, gemma, etc.
 
 app = FastAPI()
+app.add_middleware(metrics.RequestMetricsMiddleware)
 
-mcp_port = os.getenv("MCP_PORT")
-mcp_client = BasicMCPClient("http://localhost:" + mcp_port + "/sse")
+# Outils MCP : serveur séparé joint en SSE (MCP_URL, par défaut localhost:MCP_PORT) ou, avec
+# MCP_TRANSPORT=inprocess, outils de mcp_server.py chargés dans l'API et appelés directement
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "sse").casefold()
+MCP_URL = os.getenv("MCP_URL") or f"http://localhost:{os.getenv('MCP_PORT')}/sse"
+inprocess_server = None  # module mcp_server en mode inprocess
 
-mcp_tools = McpToolSpec(client=mcp_client)
+# Client MCP, LLM de l'agent et exécution des outils (délais TOOL_*) : créés par load_agent_stack() au démarrage
+mcp_client = None
+mcp_tools = None
+tool_runner = None
 
 SYSTEM_PROMPT = (
     "You are a helpful assistant. "
@@ -60,198 +92,550 @@ SYSTEM_PROMPT = (
     "The weather tool only result will be sent directly to the client in JSON format for processing."
 )
 
-llm = Ollama(model=MODEL_NAME, request_timeout=360.0)
+# docker-compose fournit OLLAMA_HOST (ex: http://ollama:11434) ; OLLAMA_HOSTS pour plusieurs instances
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434").rstrip("/")
+
+# Durée pendant laquelle Ollama garde le modèle (et son cache de prompt) en mémoire après une requête
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Instances Ollama : répartition de charge, health checks, bascule sur une autre instance
+ollama_pool = OllamaPool.from_env(OLLAMA_HOST)
+for _backend in ollama_pool.backends:
+    metrics.OLLAMA_OUTSTANDING.set_function(lambda b=_backend: b.outstanding, backend=_backend.url)
+
+# Modèles gardés en mémoire : préchargement au démarrage, heartbeat pendant les heures d'utilisation
+model_residency = ModelResidency.from_env(ollama_pool, MODEL_NAME, OLLAMA_KEEP_ALIVE)
+for _backend in ollama_pool.backends:
+    for _model in model_residency.models:
+        metrics.OLLAMA_MODEL_LOADED.set_function(lambda b=_backend, m=_model: float(model_residency.is_loaded(b, m)),
+                                                 backend=_backend.url, model=_model)
+
+llm = None
+
+
+def load_agent_stack():
+    """Importe llama_index et crée le LLM et le client MCP (appelé dans un thread au démarrage)."""
+    global llm, mcp_client, mcp_tools, tool_runner, inprocess_server
+    from llama_index.llms.ollama import Ollama
+    from llama_index.tools.mcp import BasicMCPClient, McpToolSpec
+
+    from api.services.tool_runner import ToolRunner
+
+    if llm is None:
+        llm = Ollama(model=MODEL_NAME, base_url=ollama_pool.primary, request_timeout=360.0,
+                     keep_alive=OLLAMA_KEEP_ALIVE, async_client=ollama_pool.ollama_async_client())
+    if mcp_tools is None and MCP_TRANSPORT == "inprocess":
+        import mcp_server
+        from api.services.inprocess_mcp import InProcessToolSpec
+
+        # Un seul registre Kasa pour l'API et les outils (mêmes connexions aux appareils)
+        mcp_server.use_kasa_registry(kasa_registry)
+        inprocess_server = mcp_server
+        mcp_tools = InProcessToolSpec(mcp_server.mcp)
+    elif mcp_tools is None:
+        mcp_client = BasicMCPClient(MCP_URL)
+        mcp_tools = McpToolSpec(client=mcp_client)
+    if tool_runner is None:
+        tool_runner = ToolRunner.from_env()
+    # Modules utilisés par run_agent_stream : importés ici plutôt qu'à la première requête
+    import llama_index.core.agent.workflow  # noqa: F401
+
+# Clients HTTP poolés (Ollama via le pool, n8n), ouverts au démarrage et fermés à l'arrêt
+upstreams = UpstreamClients(ollama_pool)
+
+# Appareils Kasa : handles réutilisés entre les requêtes
+kasa_registry = KasaRegistry.from_env()
+
+# Routage rapide des commandes simples vers les outils MCP (heure, appareils de deviceMap, météo)
+intent_router = IntentRouter([*kasa_registry.device_map, *kasa_registry.groups])
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").casefold() == "true"
+
+# Sessions de conversation (session_id sur /discuss, /ask et /ws/speak)
+sessions = SessionStore.from_env()
+
+# Cache des traductions (LRU + TTL, SQLite optionnel via TRANSLATION_CACHE_DB)
+translation_cache = TranslationCache.from_env()
+
+# Réponses streamées : SSE ou NDJSON, tokens fusionnés (STREAM_FORMAT, STREAM_FLUSH_MS, STREAM_FLUSH_BYTES)
+streamer = EventStreamer.from_env()
+
+
+def translation_delta(event: dict) -> Optional[str]:
+    return "delta" if "delta" in event else None
+
+
+def discussion_delta(event: dict) -> Optional[str]:
+    return "content" if event.get("type") == "final_response" else None
+
+
+def agent_delta(event: dict) -> Optional[str]:
+    # Le placeholder et la réponse finale (type final_response) restent des événements distincts
+    return "content" if event.get("type") == "agent_response" else None
 
 async def handle_user_message(
     message_content: str,
-    agent: FunctionAgent,
-    agent_context: Context,
+    agent: "FunctionAgent",
+    agent_context: "Context",
     verbose: bool = False,
 ):
+    from llama_index.core.agent.workflow import ToolCall, ToolCallResult
+
     handler = agent.run(message_content, ctx=agent_context)
     async for event in handler.stream_events():
         if verbose and type(event) == ToolCall:
-            print(f"Calling tool {event.tool_name} with kwargs {event.tool_kwargs}")
+            logger.debug("Appel d'outil", extra={"tool": event.tool_name, "tool_kwargs": event.tool_kwargs})
         elif verbose and type(event) == ToolCallResult:
-            print(f"Tool {event.tool_name} returned {event.tool_output}")
+            logger.debug("Résultat d'outil", extra={"tool": event.tool_name, "tool_output": str(event.tool_output)})
 
     response = await handler
     return str(response)
 
-async def get_agent(tools: McpToolSpec):
-    tools = await tools.to_tool_list_async()
-    return FunctionAgent(
-        name="Agent",
-        description="An agent that can do everything",
-        tools=tools,
-        llm=llm,
-        system_prompt=SYSTEM_PROMPT,
-    )
+def build_agent(tools: list) -> "FunctionAgent":
+    from llama_index.core.agent.workflow import FunctionAgent
+
+    with metrics.stage("agent.build", metrics.AGENT_BUILD_SECONDS):
+        return FunctionAgent(
+            name="Agent",
+            description="An agent that can do everything",
+            # Appels d'un même tour exécutés en parallèle, chacun avec son délai (ToolRunner)
+            tools=tool_runner.wrap(tools),
+            llm=llm,
+            system_prompt=SYSTEM_PROMPT,
+        )
+
+# Agent et liste d'outils MCP partagés par toutes les requêtes /ask et /ws/speak
+agent_cache = AgentCache(
+    list_tools=lambda: mcp_tools.to_tool_list_async(),
+    build_agent=build_agent,
+    ttl_seconds=float(os.getenv("AGENT_CACHE_TTL_SECONDS", "300")),
+    poll_interval_seconds=float(os.getenv("MCP_TOOLS_POLL_SECONDS", "30")),
+)
+
+async def get_agent() -> "FunctionAgent":
+    agent, status = await agent_cache.get()
+    logger.debug("Agent cache", extra={"status": status})
+    return agent
 
 async def get_tools():
-    tools = await mcp_tools.to_tool_list_async()
-    for tool in tools:
-        print(tool.metadata.name, tool.metadata.description)
+    await agent_cache.refresh(force=True)
+    logger.info("Outils MCP chargés", extra={"tools": [tool.metadata.name for tool in agent_cache.tools]})
+
+# Files internes exposées sur /metrics (lues au moment du scrape)
+metrics.QUEUE_DEPTH.set_function(asr_service.queue_depth, queue="asr")
+metrics.QUEUE_DEPTH.set_function(lambda: len(asr_service._sessions), queue="asr_sessions_waiting")
+metrics.QUEUE_DEPTH.set_function(lambda: translation_cache.stats()["in_flight"], queue="translation_in_flight")
+metrics.QUEUE_DEPTH.set_function(lambda: sessions.stats()["active"], queue="sessions_active")
+for _backend in ("local", "modal"):
+    metrics.QUEUE_DEPTH.set_function(lambda backend=_backend: offloader.queue_depth(backend), queue=f"offload_{_backend}")
+for voice_stage in ("asr", "agent", "send"):
+    metrics.QUEUE_DEPTH.set_function(lambda stage=voice_stage: VoiceSession.total_depth(stage), queue=f"voice_{voice_stage}")
+
+# Budgets de démarrage : dépassement signalé dans les logs, /readyz et /metrics
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "1.5"))
+READY_BUDGET_SECONDS = float(os.getenv("READY_BUDGET_SECONDS", "30"))
+
+# Chaque capacité est servie dès que ses sous-systèmes sont prêts (503 + Retry-After sinon)
+readiness = Readiness(
+    capabilities={
+        "translation": ("ollama", "models"),
+        "discussion": ("ollama", "models"),
+        "agent": ("ollama", "models", "agent"),
+        "speech": ("asr", "ollama", "models", "agent"),
+        "uploads": ("http", "uploads"),
+    },
+    retry_seconds=float(os.getenv("STARTUP_RETRY_SECONDS", "1")),
+    max_retry_seconds=float(os.getenv("STARTUP_MAX_RETRY_SECONDS", "30")),
+)
 
-@app.on_event("startup")
-async def startup_event():
+
+async def start_ollama():
+    await asyncio.gather(*(ollama_pool.check(backend) for backend in ollama_pool.backends))
+    if not ollama_available():
+        raise ConnectionError("Aucune instance Ollama joignable")
+
+
+def ollama_available() -> bool:
+    now = time.monotonic()
+    return any(backend.available(now) for backend in ollama_pool.backends)
+
+
+async def start_agent():
+    await asyncio.to_thread(load_agent_stack)
     await get_tools()
+    agent_cache.start()
+
+
+async def start_kasa():
+    # Import de python-kasa hors de la boucle ; les appareils injoignables se reconnectent à la demande
+    await asyncio.to_thread(__import__, "kasa")
+    await kasa_registry.start()
+
+
+# Clients HTTP (pool Ollama, n8n) ouverts avant tout sous-système qui s'en sert
+readiness.add("http", upstreams.open)
+readiness.add("ollama", start_ollama, depends=("http",), probe=ollama_available)
+# Les routes LLM attendent le préchargement : le chargement du modèle ne retombe jamais sur une requête
+readiness.add("models", model_residency.start, depends=("ollama",))
+readiness.add("agent", start_agent)
+readiness.add("asr", lambda: asr_service.start())
+readiness.add("uploads", lambda: webhook_queue.start(), depends=("http",), probe=lambda: upstreams.n8n_open)
+readiness.add("kasa", start_kasa)
+for _name in readiness.names:
+    metrics.SUBSYSTEM_READY.set_function(lambda n=_name: float(readiness.is_ready(n)), subsystem=_name)
+
+
+def require(capability: str):
+    """503 avec Retry-After tant que la capacité n'est pas prête."""
+    if not readiness.capability_ready(capability):
+        raise HTTPException(status_code=503, headers={"Retry-After": "1"},
+                            detail=f"Service en cours de démarrage ({capability}): "
+                                   f"{', '.join(readiness.missing(capability))}")
+
+
+# Ordonnanceur LLM / ASR : priorités voice > ask > discuss > translate > batch, file bornée, limites par client (SCHED_*)
+scheduler = Scheduler.from_env()
+for resource in ("llm", "asr"):
+    metrics.SCHED_ACTIVE.set_function(lambda resource=resource: scheduler.active(resource), resource=resource)
+    for priority_class in scheduler.priorities:
+        metrics.QUEUE_DEPTH.set_function(lambda resource=resource, priority_class=priority_class:
+                                         scheduler.queue_depth(resource, priority_class),
+                                         queue=f"scheduler_{resource}_{priority_class}")
+
+
+def client_id(connection: HTTPConnection) -> str:
+    return connection.headers.get("x-client-id") or (connection.client.host if connection.client else "inconnu")
+
+
+def request_timeout(request: Request) -> Optional[float]:
+    try:
+        return float(request.headers["x-request-timeout"]) if "x-request-timeout" in request.headers else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="X-Request-Timeout invalide")
+
+
+async def admit(request: Request, priority_class: str, resource: Optional[str] = "llm") -> Optional[Lease]:
+    """
+    Admission par l'ordonnanceur ; 429/503 avec Retry-After plutôt qu'une attente sans fin.
+    None : le client est parti pendant l'attente, il n'y a plus personne à qui répondre.
+    """
+    timeout = request_timeout(request)
+    try:
+        return await scheduler.admit(client_id(request), priority_class, resource, timeout=timeout,
+                                     is_disconnected=request.is_disconnected)
+    except Rejected as e:
+        if e.status_code == 499:
+            logger.info("Client parti avant l'admission", extra={"priority_class": priority_class})
+            return None
+        raise HTTPException(status_code=e.status_code, headers={"Retry-After": str(e.retry_after)},
+                            detail=f"Service saturé ({e.reason}), réessayer dans {e.retry_after} s")
+
+
+def client_gone() -> Response:
+    # Réponse jamais lue (connexion fermée) : seulement pour terminer la requête côté ASGI et la compter
+    return Response(status_code=499)
 
-OLLAMA_URL = "http://localhost:11434/api/generate"
+
+@app.on_event("startup")
+async def startup_event():
+    # Le serveur accepte les connexions tout de suite : les sous-systèmes s'initialisent en tâche de fond
+    readiness.start()
+    app.state.ready_watch = asyncio.create_task(watch_ready_budget())
+
+
+async def watch_ready_budget():
+    async def watch(name: str):
+        await readiness.wait(name)
+        metrics.TIME_TO_READY_SECONDS.set(readiness.ready_after(name), subsystem=name)
+
+    await asyncio.gather(*(watch(name) for name in readiness.names))
+    total = max(readiness.ready_after(name) for name in readiness.names)
+    logger.info("Démarrage terminé", extra={"ready_seconds": total, "import_seconds": IMPORT_SECONDS})
+    if total > READY_BUDGET_SECONDS:
+        logger.warning("Budget de démarrage dépassé", extra={"ready_seconds": total,
+                                                             "budget_seconds": READY_BUDGET_SECONDS})
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.ready_watch.cancel()
+    await readiness.stop()
+    await model_residency.close()
+    await agent_cache.stop()
+    if inprocess_server is not None:
+        await inprocess_server.aclose()
+    await webhook_queue.close()
+    await upstreams.close()
+    await asr_service.stop()
+    offloader.close()
+    translation_cache.close()
+    await kasa_registry.close()
+
+@app.get("/stats")
+async def stats():
+    return {"agent_cache": agent_cache.stats(), "asr": asr_service.stats(),
+            "offload": offloader.stats(),
+            "translation_cache": translation_cache.stats(),
+            "translate_batch": batch_translator.stats(),
+            "scheduler": scheduler.stats(),
+            "kasa": kasa_registry.stats(),
+            "sessions": sessions.stats(),
+            "voice": VoiceSession.stats(),
+            "intent_router": intent_router.stats(),
+            "tools": tool_runner.stats() if tool_runner else None,
+            "n8n_webhook": webhook_queue.stats(),
+            "ollama": ollama_pool.stats(),
+            "models": model_residency.status()}
+
+@app.get("/models")
+async def models_status():
+    """Modèles gardés en mémoire : chargés ou non sur chaque instance, expiration, dernier préchargement"""
+    return model_residency.status()
+
+@app.get("/healthz")
+async def healthz():
+    """Le processus répond (sans préjuger des dépendances)"""
+    return {"status": "ok", "uptime_seconds": readiness.report()["uptime_seconds"]}
+
+@app.get("/readyz")
+async def readyz():
+    """État de chaque sous-système et capacité ; 503 tant que tout n'est pas prêt"""
+    report = readiness.report()
+    report["import_seconds"] = IMPORT_SECONDS
+    report["budgets"] = {"import_seconds": IMPORT_BUDGET_SECONDS, "ready_seconds": READY_BUDGET_SECONDS}
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session inconnue")
+    return {"deleted": session_id}
 
 class TranslationRequest(BaseModel):
     source_lang: str
     target_lang: str
     text: str
 
+class BatchTranslationRequest(BaseModel):
+    source_lang: str
+    target_langs: list[str]
+    texts: list[str]
+
+async def switch_devices(target: str, on: bool):
+    try:
+        return await kasa_registry.set_state(target, on)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Appareil ou groupe inconnu: {e}")
+
 @app.get("/turn_on_devices")
-async def turn_on_devices():
-    dev = await Discover.discover_single(os.getenv("KASA_FIRST_DEVICE_IP"), username=os.getenv("KASA_USERNAME"), password=os.getenv("KASA_PASSWORD"))
-    print(dev.mac)
-    await dev.turn_on()
-    await dev.update()
+async def turn_on_devices(target: str = "salon"):
+    """target : appareil, groupe ("all", "lumières") ou liste séparée par des virgules"""
+    return await switch_devices(target, True)
 
 @app.get("/turn_off_devices")
-async def turn_off_devices():
-    dev = await Discover.discover_single(os.getenv("KASA_FIRST_DEVICE_IP"), username=os.getenv("KASA_USERNAME"), password=os.getenv("KASA_PASSWORD"))
-    await dev.turn_off()
-    await dev.update()
+async def turn_off_devices(target: str = "salon"):
+    return await switch_devices(target, False)
 
 @app.post("/translate")
-async def translate(req: TranslationRequest):
-    prompt = (
-        f"Traduis en '{req.target_lang}' la phrase en '{req.source_lang}' : \"{req.text}\".\n"
-        "Réponds uniquement avec la traduction, suivi du séparateur de ligne suivant : |||, "
-        f"suivie en '{req.source_lang}' de la langue réelle de la phrase à traduire en majuscules suivie du séparateur de ligne suivant : |||, "
-        f"suivie d'une explication en '{req.source_lang}', suivie du séparateur de ligne suivant : |||, "
-        f"suivie de la version corrigée de la phrase s'il y a des fautes en '{req.source_lang}'."
-    )
+async def translate(req: TranslationRequest, request: Request):
+    require("translation")
+    prompt = translation_prompt(req.source_lang, req.target_lang, req.text)
 
-    async def event_stream():
+    async def generate():
         payload = {
             "model": MODEL_NAME,
             "prompt": prompt,
-            "stream": True
-        }
-
-        numbreOfSeparationsCounter = 0
-        breaklineContainer = ""
-        result = {
-            "translation": "",
-            "language": None,
-            "explanation": None,
-            "correction": None
+            "stream": True,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
         }
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            async with client.stream("POST", OLLAMA_URL, json=payload) as response:
-                async for line in response.aiter_lines():
-                    try:
-                        data = json.loads(line)
-                        content = data.get("response", "")
-
-                        tmpContent = content
-
-                        print(f"LINE: {content}")
-
-                        hasBreakline = False
-
-                        tmpContent = tmpContent.replace(" ", "").replace("\n", "")
-                        print(f"REPLACED CONTENT: {tmpContent}")
-                        if "|" in tmpContent:
-                            hasBreakline = True
-                            breaklineContainer += tmpContent
-
-                        if hasBreakline and breaklineContainer.strip() is not "|||":
-                            print(f"BREAKLINE CONTAINER: {breaklineContainer}")
-                            continue
-                        elif hasBreakline:
-                            content = content.replace("|", "")
-
-                        if "|||" in breaklineContainer:
-                            numbreOfSeparationsCounter += 1
-                            breaklineContainer = ""
-                            result = {
-                                "translation": "",
-                                "language": None,
-                                "explanation": None,
-                                "correction": None
-                            }
-
-                        # Traitement selon compteur
-                        if numbreOfSeparationsCounter == 0:
-                            result["translation"] = content
-                        elif numbreOfSeparationsCounter == 1:
-                            result["language"] = content
-                        elif numbreOfSeparationsCounter == 2:
-                            result["explanation"] = content
-                        elif numbreOfSeparationsCounter == 3:
-                            result["correction"] = content
-
-                        print(f"RESULT: {result}")
-
-                        yield f"{json.dumps(result)}\n\n"
-
-                        await asyncio.sleep(0.01)  # Ajout explicite pour laisser la boucle rescheduler
-
-
-                    except Exception as e:
-                        print("Erreur parsing:", e)
-                        continue
-
-    headers = {
-        "Cache-Control": "no-cache",
-        "Content-Type": "text/event-stream",
-        "X-Accel-Buffering": "no",  # Pour nginx reverse proxy
-    }
-    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
+        # Deltas {"field", "delta"} au fil des tokens, séparateurs "|||" gérés même s'ils sont coupés
+        parser = TranslationStreamParser()
+        meter = metrics.TokenMeter("translate")
+        final_chunk = None
+
+        async with upstreams.ollama.stream("POST", "/api/generate", json=payload) as response:
+            if response.is_error:
+                await response.aread()
+                raise GenerationFailed(f"Ollama {response.status_code}: {response.text[:200]}")
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.warning("Réponse Ollama illisible", extra={"endpoint": "translate", "error": str(e)})
+                    continue
+                if "error" in data:
+                    raise GenerationFailed(f"Ollama: {data['error']}")
+
+                meter.token(data.get("response", ""))
+                for event in parser.feed(data.get("response", "")):
+                    yield event
+
+                if data.get("done"):
+                    final_chunk = data
+                    break
+        if final_chunk is None:
+            # Stream coupé : traduction partielle, ni terminée ni mise en cache
+            raise GenerationFailed("Stream Ollama interrompu avant le chunk final")
+        meter.finish(final_chunk)
+
+        for event in parser.finish():
+            yield event
+
+    async def generate_with_slot():
+        # Le slot LLM suit la génération partagée, pas le client admis : il reste occupé tant qu'Ollama génère,
+        # même si ce client se déconnecte alors que des requêtes identiques suivent encore le flux
+        ticket, lease.ticket = lease.ticket, None
+        if ticket is None or ticket.released:
+            # Cache ou génération disparus depuis l'admission : nouveau slot, dans le délai restant du client
+            remaining = None if timeout is None else max(0.0, admitted_at + timeout - time.monotonic())
+            try:
+                ticket = await scheduler.acquire("llm", "translate", remaining)
+            except Rejected as e:
+                # En-têtes déjà envoyés : refus rendu comme dernier événement {"type": "error"} du stream
+                raise GenerationFailed(f"Service saturé ({e.reason}), réessayer dans {e.retry_after} s") from e
+        try:
+            async for event in generate():
+                yield event
+        finally:
+            scheduler.release(ticket)
+
+    # Les traductions déjà connues sont rejouées depuis le cache ; les requêtes identiques
+    # simultanées partagent une seule génération
+    key = cache_key(MODEL_NAME, req.source_lang, req.target_lang, req.text)
+    # Pas de slot LLM pour une traduction déjà en cache ou en cours de génération
+    timeout, admitted_at = request_timeout(request), time.monotonic()
+    lease = await admit(request, "translate", None if translation_cache.peek(key) else "llm")
+    if lease is None:
+        return client_gone()
+    return streamer.response(request, translation_cache.stream(key, generate_with_slot), translation_delta,
+                             "translate", on_close=lease.release)
+
+async def complete_translation(prompt: str) -> str:
+    if offloader.accepts("translate", scheduler.queue_depth("llm")):
+        # File LLM trop longue : génération sur l'instance Ollama de débordement, sans slot local
+        try:
+            return await offloader.complete(prompt, MODEL_NAME, OLLAMA_KEEP_ALIVE)
+        except Exception as e:
+            logger.warning("Traduction déportée en échec, génération locale", extra={"error": f"{type(e).__name__}: {e}"})
+    payload = {"model": MODEL_NAME, "prompt": prompt, "stream": False, "keep_alive": OLLAMA_KEEP_ALIVE}
+    # Chaque génération d'un lot attend un slot LLM, derrière toutes les autres classes
+    async with scheduler.slot("llm", "batch"):
+        response = await upstreams.ollama.post("/api/generate", json=payload)
+    response.raise_for_status()
+    return response.json().get("response", "")
+
+# Traductions par lot (TRANSLATE_BATCH_CONCURRENCY, TRANSLATE_PACK_SIZE, TRANSLATE_PACK_MAX_CHARS)
+batch_translator = BatchTranslator.from_env(complete_translation, translation_cache, MODEL_NAME)
+TRANSLATE_BATCH_MAX_TEXTS = int(os.getenv("TRANSLATE_BATCH_MAX_TEXTS", "2000"))
+
+@app.post("/translate/batch")
+async def translate_batch(req: BatchTranslationRequest, request: Request):
+    """Un événement par (phrase, langue cible) dès qu'il est prêt, avec son index, puis un résumé {"type": "done"}"""
+    require("translation")
+    if not req.texts or not req.target_langs:
+        raise HTTPException(status_code=400, detail="texts et target_langs ne peuvent pas être vides")
+    if len(req.texts) * len(req.target_langs) > TRANSLATE_BATCH_MAX_TEXTS:
+        raise HTTPException(status_code=413, detail=f"Lot limité à {TRANSLATE_BATCH_MAX_TEXTS} traductions")
+    lease = await admit(request, "batch", resource=None)
+    if lease is None:
+        return client_gone()
+    return streamer.response(request, batch_translator.run(req.source_lang, req.target_langs, req.texts),
+                             endpoint="translate_batch", on_close=lease.release)
+
+def render_history_prompt(history: list[dict], text: str) -> str:
+    lines = [f"{'Utilisateur' if m['role'] == 'user' else 'Assistant'} : {m['content']}" for m in history]
+    lines.append(f"Utilisateur : {text}")
+    lines.append("Assistant :")
+    return "\n".join(lines)
 
 @app.post("/discuss")
-async def discuss(req: DiscussionRequest):
+async def discuss(req: DiscussionRequest, request: Request):
+    require("discussion")
+    session = sessions.get(req.session_id) if req.session_id else None
     payload = {
         "model": MODEL_NAME,
         "prompt": req.text,
-        "stream": True
+        "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
     }
+    if session:
+        context = sessions.usable_context(session)
+        if context:
+            # Le contexte du tour précédent est déjà évalué côté Ollama : seul le nouveau message l'est
+            payload["context"] = context
+        elif session.history:
+            sessions.trim(session)
+            payload["prompt"] = render_history_prompt(session.history, req.text)
 
     async def event_stream():
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            async with client.stream("POST", OLLAMA_URL, json=payload) as response:
-                async for line in response.aiter_lines():
-                    try:
-                        data = json.loads(line)
-                        content = data.get("response", "")
-                        result = {
-                            "type": "final_response",
-                            "content": content,
-                        }
-                        print("Response:", result)
-                        yield f"{json.dumps(result)}\n\n"
-                        await asyncio.sleep(0.01)  # Ajout explicite pour laisser la boucle rescheduler
-
-                    except Exception as e:
-                        print("Erreur parsing:", e)
-                        continue
-
-    headers = {
-        "Cache-Control": "no-cache",
-        "Content-Type": "text/event-stream",
-        "X-Accel-Buffering": "no",  # Pour nginx reverse proxy
-    }
-    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
+        answer = []
+        meter = metrics.TokenMeter("discuss")
+        final_chunk = None
+        async with upstreams.ollama.stream("POST", "/api/generate", json=payload) as response:
+            if response.is_error:
+                await response.aread()
+                raise GenerationFailed(f"Ollama {response.status_code}: {response.text[:200]}")
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.warning("Réponse Ollama illisible", extra={"endpoint": "discuss", "error": str(e)})
+                    continue
+                if "error" in data:
+                    raise GenerationFailed(f"Ollama: {data['error']}")
+
+                content = data.get("response", "")
+                meter.token(content)
+                answer.append(content)
+                yield {
+                    "type": "final_response",
+                    "content": content,
+                }
 
-@app.post("/ask")
-async def ask(req: DiscussionRequest):
-    async def event_stream():
-        async for event in run_agent_stream(req):
-            yield f"{json.dumps(event)}\n\n"
+                if data.get("done"):
+                    final_chunk = data
+                    break
+        if final_chunk is None:
+            # Réponse coupée : rien n'est ajouté à la session
+            raise GenerationFailed("Stream Ollama interrompu avant le chunk final")
+        meter.finish(final_chunk)
+
+        if session:
+            measure = session.record_prompt_eval(final_chunk)
+            session.add_turn(req.text, "".join(answer), final_chunk.get("context"))
+            sessions.trim(session)
+            yield {'type': 'session', 'session_id': session.session_id, **(measure or {})}
+
+    lease = await admit(request, "discuss")
+    if lease is None:
+        return client_gone()
+    return streamer.response(request, event_stream(), discussion_delta, "discuss", on_close=lease.release)
 
-    headers = {
-        "Cache-Control": "no-cache",
-        "Content-Type": "text/event-stream",
-        "X-Accel-Buffering": "no",
-    }
-    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
+@app.post("/ask")
+async def ask(req: DiscussionRequest, request: Request):
+    require("agent")
+    lease = await admit(request, "ask")
+    if lease is None:
+        return client_gone()
+    return streamer.response(request, run_agent_stream(req), agent_delta, "ask", on_close=lease.release)
+
+def tool_output_data(tool_output):
+    """Résultat d'outil sous forme d'objet : direct en mode inprocess, extrait du texte MCP sinon."""
+    if isinstance(tool_output.raw_output, (dict, list)):
+        return tool_output.raw_output
+    try:
+        return extract_json_from_tool_output_content(tool_output.content)
+    except Exception as e:
+        logger.debug("Sortie d'outil non JSON", extra={"tool": tool_output.tool_name, "error": str(e)})
+        return {"raw": tool_output.content}
 
 def extract_json_from_tool_output_content(content_str: str):
     # Essayer d'abord de parser directement comme JSON
@@ -267,131 +651,194 @@ def extract_json_from_tool_output_content(content_str: str):
 
     json_str = match.group(1)
     return json.loads(json_str)
-# Paramètres audio (doivent correspondre à ceux du client Ktor)
-SAMPLE_RATE = 16000  # Hz
-AUDIO_FORMAT = "PCM_16BIT" # Le client envoie du PCM 16-bit
-CHANNELS = 1 # Mono
+# Paramètres audio (doivent correspondre à ceux du client Ktor) : PCM 16-bit, 16 kHz, mono.
+# Le découpage en segments se fait par détection d'activité vocale, voir api/services/asr.py
+# (variables ASR_VAD_THRESHOLD, ASR_VAD_SILENCE_MS, ASR_PARTIAL_INTERVAL_SECONDS,
+# ASR_MAX_SEGMENT_SECONDS, ASR_OVERLAP_SECONDS).
 
-# Taille du segment audio à envoyer à Whisper pour transcription (en secondes)
-# Un segment trop court peut réduire la précision, un trop long augmente la latence.
-TRANSCRIPTION_SEGMENT_DURATION_SECONDS = 2.0
-BYTES_PER_SAMPLE = 2 # 16-bit PCM = 2 bytes per sample
-BYTES_PER_SECOND = SAMPLE_RATE * BYTES_PER_SAMPLE * CHANNELS
-BUFFER_SIZE_FOR_TRANSCRIPTION = int(BYTES_PER_SECOND * TRANSCRIPTION_SEGMENT_DURATION_SECONDS)
 
+async def run_fast_path(req: DiscussionRequest, intent: Intent):
+    """Appel direct de l'outil MCP pour une intention reconnue, avec les mêmes événements que l'agent."""
+    await get_agent()  # garantit une liste d'outils à jour
+    tool = next((t for t in agent_cache.tools if t.metadata.name == intent.tool_name), None)
+    if tool is None:
+        return None
 
-async def run_agent_stream(req: DiscussionRequest):
-    agent = await get_agent(mcp_tools)
-    ctx = Context(agent)
-    handler = agent.run(req.text, ctx=ctx)
+    events = [{'type': 'tool_call', 'tool_name': intent.tool_name, 'tool_kwargs': intent.tool_kwargs}]
+    tool_output = await tool_runner.call(tool, intent.tool_kwargs, route="fast_path")
+    data = tool_output_data(tool_output)
+    events.append({'type': 'tool_result', 'tool_name': intent.tool_name, 'tool_output': data})
 
-    yield {'type': 'final_response', 'content': 'Thinking...\n'}
+    raw_text = data.get("raw", tool_output.content) if isinstance(data, dict) else tool_output.content
+    content = intent.reply(data, str(raw_text), tool_output.is_error)
+    events.append({'type': 'final_response', 'content': content})
+    return events
 
-    print("Début du stream des événements")
 
-    async for event in handler.stream_events():
-        print(f"Event reçu: {type(event).__name__}")
-        event_type = type(event).__name__
-
-        if isinstance(event, ToolCallResult):
-            try:
-                tool_output_data = extract_json_from_tool_output_content(event.tool_output.content)
-            except Exception as e:
-                print(f"Erreur extraction JSON tool_output: {e}")
-                tool_output_data = {"raw": event.tool_output.content}
-            yield {'type': 'tool_result', 'tool_name': event.tool_name, 'tool_output': tool_output_data}
+# Envoyé dès le début d'une réponse de l'agent, avant le premier token
+THINKING_EVENT = {'type': 'final_response', 'content': 'Thinking...\n'}
 
-        elif isinstance(event, ToolCall):
-            yield {'type': 'tool_call', 'tool_name': event.tool_name, 'tool_kwargs': event.tool_kwargs}
 
-        elif event_type == "AgentStream":
-            # Stream la réponse de l'agent en temps réel
-            if hasattr(event, 'delta') and event.delta:
-                print(f"AgentStream delta: {event.delta}")
-                yield {'type': 'agent_response', 'content': event.delta}
+async def run_agent_stream(req: DiscussionRequest):
+    started = time.perf_counter()
+
+    # Commandes simples reconnues sans ambiguïté : appel direct de l'outil, sans LLM
+    intent = intent_router.match(req.text) if FAST_PATH_ENABLED else None
+    if intent:
+        events = await run_fast_path(req, intent)
+        if events is not None:
+            for event in events:
+                yield event
+            intent_router.record(intent.route, time.perf_counter() - started)
+            if req.session_id:
+                session = sessions.get(req.session_id)
+                session.add_turn(req.text, events[-1]["content"])
+                sessions.trim(session)
+            return
+
+    from llama_index.core.agent.workflow import ToolCall, ToolCallResult
+    from llama_index.core.llms import ChatMessage
+    from llama_index.core.workflow import Context
+
+    agent = await get_agent()
+    ctx = Context(agent)
+    session = sessions.get(req.session_id) if req.session_id else None
+    chat_history = None
+    if session:
+        # Historique borné, toujours dans le même ordre : Ollama réutilise le préfixe déjà évalué
+        sessions.trim(session)
+        chat_history = [ChatMessage(role=m["role"], content=m["content"]) for m in session.history]
+    handler = agent.run(req.text, chat_history=chat_history, ctx=ctx)
+    prompt_eval = None
+    meter = metrics.TokenMeter("agent")
 
-        await asyncio.sleep(0.01)
+    try:
+        yield dict(THINKING_EVENT)
+
+        async for event in handler.stream_events():
+            event_type = type(event).__name__
+
+            # Résultats publiés dans l'ordre où les appels se terminent ; Ollama ne fournit pas d'identifiant
+            # d'appel (tool_id = nom de l'outil), tool_kwargs permet d'associer un résultat à son appel
+            if isinstance(event, ToolCallResult):
+                yield {'type': 'tool_result', 'tool_name': event.tool_name, 'tool_kwargs': event.tool_kwargs,
+                       'tool_output': tool_output_data(event.tool_output)}
+
+            elif isinstance(event, ToolCall):
+                logger.debug("Appel d'outil", extra={"tool": event.tool_name, "tool_kwargs": event.tool_kwargs})
+                yield {'type': 'tool_call', 'tool_name': event.tool_name, 'tool_kwargs': event.tool_kwargs}
+
+            elif event_type == "AgentStream":
+                # Stream la réponse de l'agent en temps réel
+                if hasattr(event, 'delta') and event.delta:
+                    meter.token(event.delta)
+                    yield {'type': 'agent_response', 'content': event.delta}
+                if isinstance(getattr(event, 'raw', None), dict) and event.raw.get("done"):
+                    prompt_eval = event.raw
+
+        final_response = await handler
+    finally:
+        if not handler.is_done():
+            # Client parti ou réponse interrompue (barge-in) : arrêt du flux LLM et des appels d'outils en cours
+            await asyncio.shield(handler.cancel_run())
 
-    print("Fin du stream des événements")
-    final_response = await handler
-    print(f"Final response: {final_response}")
+    meter.finish(prompt_eval)
     yield {'type': 'final_response', 'content': str(final_response)}
+    intent_router.record("agent", time.perf_counter() - started)
 
+    if session:
+        measure = session.record_prompt_eval(prompt_eval or {})
+        session.add_turn(req.text, str(final_response))
+        sessions.trim(session)
+        yield {'type': 'session', 'session_id': session.session_id, **(measure or {})}
 
-# Client HTTP asynchrone pour Ollama
-ollama_client = httpx.AsyncClient(timeout=60.0)
 
 @app.websocket("/ws/speak")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    print("Connexion WebSocket acceptée.")
-
-    audio_buffer = bytearray()  # Buffer pour accumuler les chunks audio
-    processing_task = None  # Tâche pour le traitement asynchrone des chunks
-
-    async def process_audio_buffer():
-        nonlocal audio_buffer
-        print(f"Audio buffer size: {len(audio_buffer)} bytes")
-        print(f"First 10 bytes: {audio_buffer[:10]}")
-        # Créer un fichier WAV temporaire à partir du buffer audio brut
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_wav:
-            tmp_path = tmp_wav.name
-            with wave.open(tmp_wav, "wb") as wf:
-                wf.setnchannels(1)          # mono
-                wf.setsampwidth(2)          # 16-bit
-                wf.setframerate(16000)      # 16kHz
-                wf.writeframes(audio_buffer)
-
-        audio_buffer = bytearray()  # Réinitialiser le buffer après extraction
-        print(f"Audio buffer size: {len(audio_buffer)} bytes")
-        print(f"First 10 bytes: {audio_buffer[:10]}")
+    if not readiness.capability_ready("speech"):
+        # 1013 : réessayer plus tard
+        await websocket.close(code=1013, reason="Service en cours de démarrage")
+        return
+    try:
+        lease = await scheduler.admit(client_id(websocket), "voice")
+    except Rejected as e:
+        await websocket.close(code=1013, reason=f"Service saturé ({e.reason}), réessayer dans {e.retry_after} s")
+        return
+
+    # Découpage du flux PCM par détection d'activité vocale, en mémoire (pas de fichier WAV)
+    session_id = uuid.uuid4().hex
+    logger.info("Connexion WebSocket acceptée", extra={"session_id": session_id})
+
+    async def transcribe(audio, final: bool) -> str:
+        if not final:
+            # Hypothèse partielle facultative : seulement si un slot ASR est libre tout de suite
+            ticket = scheduler.try_acquire("asr", "voice")
+            if ticket is None:
+                return ""
+            try:
+                return await asr_service.transcribe(audio, session_id=session_id, wait=False)
+            except AsrQueueFull:
+                return ""  # hypothèse partielle abandonnée, ASR saturée
+            finally:
+                scheduler.release(ticket)
+        if offloader.accepts("transcribe", scheduler.queue_depth("asr") + asr_service.queue_depth()):
+            # ASR locale saturée : segment final transcrit hors du processus de l'API
+            try:
+                return await offloader.transcribe(audio)
+            except Exception as e:
+                logger.warning("Transcription déportée en échec, ASR locale",
+                               extra={"session_id": session_id, "error": f"{type(e).__name__}: {e}"})
+        async with scheduler.slot("asr", "voice"):
+            return await asr_service.transcribe(audio, session_id=session_id)
+
+    async def respond(text: str):
+        try:
+            ticket = await scheduler.acquire("llm", "voice")
+        except Rejected as e:
+            yield {"type": "error", "content": f"Service saturé ({e.reason}), réessayer dans {e.retry_after} s"}
+            return
         try:
-            segments, _info = asr_model.transcribe(tmp_path, language="fr", beam_size=1)
-
-            for segment in segments:
-                transcription = segment.text.strip()
-                print(f"Transcription: {transcription}")
-                if transcription:
-                    ask_req = DiscussionRequest(text=segment.text)
-                    async for event in run_agent_stream(ask_req):
-                        print("Event reçu dans WebSocket :", event)
-                        await websocket.send_json(event)
-                    await websocket.send_json({
-                        "content": segment.text
-                    })
-
-                    # await websocket.send_json({
-                    #     "response": extract_json_from_tool_output_content(response.content)
-                    # })
+            async for event in run_agent_stream(DiscussionRequest(text=text, session_id=f"ws-{session_id}")):
+                yield event
         finally:
-            print(f"WAV temp saved at: {tmp_path}")
-            os.unlink(tmp_path)  # Nettoyer le fichier temporaire
+            scheduler.release(ticket)
+
+    # Réception, ASR, agent et envoi en parallèle, reliés par des files bornées (VOICE_*)
+    voice = VoiceSession(
+        segmenter_from_env(),
+        transcribe,
+        respond,
+        websocket.send_json,
+        queue_size=VOICE_QUEUE_SIZE,
+        send_queue_size=VOICE_SEND_QUEUE_SIZE,
+        placeholder=THINKING_EVENT,
+        session_id=session_id,
+    )
+    voice.start()
 
-    try:
+    async def receive():
         while True:
             # Réception d'un chunk audio
-            audio_chunk = await websocket.receive_bytes()
-            audio_buffer.extend(audio_chunk)
+            await voice.feed(await websocket.receive_bytes())
 
-            # Déclencher traitement si le buffer atteint ~1s
-            if len(audio_buffer) > 32000:  # 16000 samples/sec * 2 bytes/sample = ~32Ko
-                if processing_task and not processing_task.done():
-                    await processing_task
-                processing_task = asyncio.create_task(process_audio_buffer())
-
-    except WebSocketDisconnect:
-        print("Connexion WebSocket déconnectée.")
+    receiver = asyncio.create_task(receive())
+    stages = asyncio.create_task(voice.wait_closed())
+    try:
+        # Fin de session : client parti (réception) ou envoi impossible (étape d'envoi)
+        await asyncio.wait({receiver, stages}, return_when=asyncio.FIRST_COMPLETED)
+        if receiver.done() and not isinstance(receiver.exception(), WebSocketDisconnect):
+            raise receiver.exception()
+        logger.info("Connexion WebSocket déconnectée", extra={"session_id": session_id})
     except Exception as e:
-        print(f"Erreur WebSocket: {e}")
+        logger.exception("Erreur WebSocket", extra={"session_id": session_id, "error": str(e)})
     finally:
-        if processing_task:
-            processing_task.cancel()
-            try:
-                await processing_task
-            except asyncio.CancelledError:
-                pass
-
-        print("Fermeture de la connexion WebSocket.")
+        for task in (receiver, stages):
+            task.cancel()
+        await asyncio.gather(receiver, stages, return_exceptions=True)
+        await voice.close()
+        lease.release()
+        logger.debug("Fermeture de la connexion WebSocket", extra={"session_id": session_id})
 
 # Configuration
 N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL")
@@ -399,94 +846,78 @@ N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL")
 ALLOWED_IMAGE_TYPES = ["image/jpeg", "image/png", "image/gif", "image/webp"]
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
+# Corps trop gros refusés avant d'être lus en entier
+app.add_middleware(BodySizeLimitMiddleware, limits={"/upload-image": MAX_FILE_SIZE + FORM_OVERHEAD})
+
+
+# Envois au webhook n8n en tâche de fond (spool disque, retries avec backoff : N8N_*)
+webhook_queue = WebhookQueue.from_env(N8N_WEBHOOK_URL, lambda: upstreams.n8n)
+metrics.QUEUE_DEPTH.set_function(webhook_queue.queue_depth, queue="n8n_webhook")
+
 
-@app.post("/upload-image")
+@app.post("/upload-image", status_code=202)
 async def upload_image(
         file: UploadFile = File(...),
         message_text: Optional[str] = Form(""),
         source: Optional[str] = Form("FastAPI Upload")
 ):
     """
-    Upload une image et l'envoie au webhook n8n
+    Upload une image et planifie son envoi au webhook n8n (réponse 202 avec un identifiant de job)
 
     - **file**: Fichier image à uploader
     - **message_text**: Texte accompagnant l'image (laisser vide pour "image seule")
     - **source**: Source du message (par défaut: "FastAPI Upload")
+
+    Le statut de l'envoi est consultable sur `/upload-image/{job_id}`.
     """
+    if not N8N_WEBHOOK_URL:
+        raise HTTPException(status_code=503, detail="Webhook n8n non configuré (N8N_WEBHOOK_URL)")
+    require("uploads")
 
+    # Taille et type MIME vérifiés sans charger le fichier en mémoire (premier morceau seulement pour magic)
     try:
-        # Vérifier la taille du fichier
-        content = await file.read()
-        if len(content) > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=413,
-                detail=f"Fichier trop volumineux. Maximum: {MAX_FILE_SIZE / 1024 / 1024}MB"
-            )
-
-        # Vérifier le type MIME
-        mime_type = magic.from_buffer(content, mime=True)
-        if mime_type not in ALLOWED_IMAGE_TYPES:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Type de fichier non supporté. Types autorisés: {ALLOWED_IMAGE_TYPES}"
-            )
-
-        # Encoder l'image en base64
-        base64_content = base64.b64encode(content).decode('utf-8')
-
-        # Préparer les données pour n8n
-        webhook_data = {
-            "hasAttachment": True,
-            "messageText": message_text.strip(),
-            "timestamp": datetime.now().isoformat(),
-            "source": source,
-            "attachments": [
-                {
-                    "filename": file.filename,
-                    "content": base64_content,
-                    "contentType": mime_type,
-                    "size": len(content)
-                }
-            ]
+        mime_type, size = await inspect_upload(file, MAX_FILE_SIZE, ALLOWED_IMAGE_TYPES)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    webhook_fields = {
+        "hasAttachment": True,
+        "messageText": message_text.strip(),
+        "timestamp": datetime.now().isoformat(),
+        "source": source,
+    }
+    try:
+        job = await webhook_queue.enqueue(file.file, webhook_fields,
+                                          {"filename": file.filename, "contentType": mime_type}, size)
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la mise en file: {str(e)}")
+
+    return JSONResponse(
+        status_code=202,
+        content={
+            "success": True,
+            "message": "Image acceptée, envoi au webhook n8n en cours",
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "status_url": f"/upload-image/{job['job_id']}",
+            "file_info": job["file_info"],
+            "will_send_email": message_text.strip() == ""
         }
+    )
 
-        # Envoyer au webhook n8n
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                N8N_WEBHOOK_URL,
-                json=webhook_data,
-                headers={"Content-Type": "application/json"},
-                timeout=30.0
-            )
-
-            if response.status_code == 200:
-                return JSONResponse(
-                    status_code=200,
-                    content={
-                        "success": True,
-                        "message": "Image envoyée avec succès au webhook n8n",
-                        "file_info": {
-                            "filename": file.filename,
-                            "size": len(content),
-                            "mime_type": mime_type
-                        },
-                        "webhook_response": response.status_code,
-                        "will_send_email": message_text.strip() == ""
-                    }
-                )
-            else:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Erreur webhook n8n: {response.status_code} - {response.text}"
-                )
-
-    except httpx.TimeoutException:
-        raise HTTPException(
-            status_code=504,
-            detail="Timeout lors de l'envoi au webhook n8n"
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Erreur lors du traitement: {str(e)}"
-        )
\ No newline at end of file
+
+@app.get("/upload-image/{job_id}")
+async def upload_image_status(job_id: str):
+    """Statut de l'envoi : queued, sending, retrying, delivered ou failed"""
+    job = webhook_queue.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job inconnu")
+    return job
+
+
+# Temps d'import du module (dépendances lourdes exclues, chargées au démarrage)
+IMPORT_SECONDS = round(time.perf_counter() - IMPORT_STARTED, 3)
+metrics.IMPORT_SECONDS.set(IMPORT_SECONDS)
+if IMPORT_SECONDS > IMPORT_BUDGET_SECONDS:
+    logger.warning("Budget d'import dépassé", extra={"import_seconds": IMPORT_SECONDS,
+                                                     "budget_seconds": IMPORT_BUDGET_SECONDS})
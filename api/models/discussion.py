@@ -1,5 +1,9 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 
 class DiscussionRequest(BaseModel):
-    text: str
\ No newline at end of file
+    text: str
+    # Conversation suivie côté serveur : l'historique et le contexte Ollama sont réutilisés d'un tour à l'autre
+    session_id: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from api.services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def tools_signature(tools) -> tuple:
+    """Empreinte de la liste d'outils MCP (nom, description, schéma) pour détecter un changement."""
+    signature = []
+    for tool in tools:
+        metadata = tool.metadata
+        try:
+            schema = json.dumps(metadata.get_parameters_dict(), sort_keys=True)
+        except Exception:
+            schema = ""
+        signature.append((metadata.name, metadata.description, schema))
+    return tuple(sorted(signature))
+
+
+class AgentCache:
+    """
+    Garde en mémoire la liste d'outils MCP et l'agent construit dessus, partagés par toutes les requêtes.
+
+    - le premier appel construit l'agent (statut "rebuild")
+    - tant que le TTL n'est pas dépassé, l'agent est servi tel quel (statut "hit")
+    - après expiration, l'ancien agent est encore servi (statut "stale") pendant qu'un
+      rafraîchissement tourne en tâche de fond
+    - une tâche de fond interroge périodiquement le serveur MCP et reconstruit l'agent
+      dès que l'ensemble des outils change
+    """
+
+    def __init__(
+            self,
+            list_tools: Callable[[], Awaitable[list]],
+            build_agent: Callable[[list], Any],
+            ttl_seconds: float = 300.0,
+            poll_interval_seconds: float = 30.0,
+    ):
+        self._list_tools = list_tools
+        self._build_agent = build_agent
+        self.ttl_seconds = ttl_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+
+        self.agent = None
+        self.tools: list = []
+        self._signature: Optional[tuple] = None
+        self._built_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._poll_task: Optional[asyncio.Task] = None
+
+        self.counters = {"hit": 0, "stale": 0, "rebuild": 0, "background_refresh": 0,
+                         "background_rebuild": 0, "refresh_error": 0}
+        self.last_build_seconds: Optional[float] = None
+
+    def _is_fresh(self) -> bool:
+        return self.agent is not None and (time.monotonic() - self._built_at) < self.ttl_seconds
+
+    def _install(self, tools: list):
+        started = time.perf_counter()
+        self.agent = self._build_agent(tools)
+        self.tools = tools
+        self._signature = tools_signature(tools)
+        self._built_at = time.monotonic()
+        self.last_build_seconds = time.perf_counter() - started
+
+    async def refresh(self, force: bool = False) -> bool:
+        """Recharge la liste d'outils ; reconstruit l'agent si elle a changé (ou si force). Retourne True si reconstruit."""
+        async with self._lock:
+            tools = await self._list_tools()
+            if force or self.agent is None or tools_signature(tools) != self._signature:
+                self._install(tools)
+                return True
+            # Même ensemble d'outils : on prolonge simplement la durée de vie de l'agent
+            self._built_at = time.monotonic()
+            return False
+
+    def _schedule_refresh(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._background_refresh())
+
+    async def _background_refresh(self):
+        try:
+            if await self.refresh():
+                self.counters["background_rebuild"] += 1
+            self.counters["background_refresh"] += 1
+        except Exception as e:
+            self.counters["refresh_error"] += 1
+            logger.warning("Erreur rafraîchissement des outils MCP", extra={"error": str(e)})
+
+    def _served(self, status: str):
+        self.counters[status] += 1
+        metrics.AGENT_CACHE_TOTAL.inc(status=status)
+        return self.agent, status
+
+    async def get(self):
+        """Retourne (agent, statut) avec statut parmi "hit", "stale" ou "rebuild"."""
+        if self._is_fresh():
+            return self._served("hit")
+
+        if self.agent is not None:
+            self._schedule_refresh()
+            return self._served("stale")
+
+        async with self._lock:
+            # Une autre requête a pu construire l'agent pendant l'attente du verrou
+            if self.agent is not None:
+                return self._served("hit")
+            self._install(await self._list_tools())
+        return self._served("rebuild")
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval_seconds)
+            await self._background_refresh()
+
+    def start(self):
+        if self.poll_interval_seconds > 0 and (self._poll_task is None or self._poll_task.done()):
+            self._poll_task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        for task in (self._poll_task, self._refresh_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "tools": [tool.metadata.name for tool in self.tools],
+            "age_seconds": round(time.monotonic() - self._built_at, 1) if self.agent is not None else None,
+            "ttl_seconds": self.ttl_seconds,
+            "last_build_seconds": self.last_build_seconds,
+        }
@@ -0,0 +1,184 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+SAMPLE_RATE = 16000  # Hz, PCM 16-bit mono (client Ktor)
+FRAME_MS = 30
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+
+def pcm16_to_float32(pcm: bytes) -> np.ndarray:
+    """Convertit du PCM 16-bit little-endian en float32 [-1, 1], sans passer par un fichier WAV."""
+    usable = len(pcm) - (len(pcm) % 2)
+    return np.frombuffer(pcm[:usable], dtype="<i2").astype(np.float32) / 32768.0
+
+
+def merge_overlap(previous: str, current: str, max_words: int = 8) -> str:
+    """Retire du début de `current` les mots déjà présents à la fin de `previous` (recouvrement de fenêtre)."""
+    prev_words = previous.split()
+    cur_words = current.split()
+    normalize = lambda w: w.strip(".,;:!?…").casefold()
+    for size in range(min(max_words, len(prev_words), len(cur_words)), 0, -1):
+        if [normalize(w) for w in prev_words[-size:]] == [normalize(w) for w in cur_words[:size]]:
+            return " ".join(cur_words[size:])
+    return current
+
+
+class OverlapJoiner:
+    """
+    Texte des segments finaux d'une session. Le recouvrement n'est retiré qu'après un segment découpé de
+    force ("cut"), dont la fin audio est reprise au début du segment suivant : après une fin de parole
+    normale, une commande répétée à l'identique ("oui", "Allume le salon.") est gardée telle quelle.
+    """
+
+    def __init__(self):
+        self._cut_text = ""  # transcription brute du segment découpé précédent
+
+    def join(self, kind: str, text: str) -> str:
+        merged = merge_overlap(self._cut_text, text) if self._cut_text else text
+        self._cut_text = text if kind == "cut" else ""
+        return merged
+
+
+class EnergyVAD:
+    """
+    Détection d'activité vocale par énergie, trame par trame (30 ms).
+    Le seuil s'adapte au bruit de fond mesuré pendant les silences.
+    """
+
+    def __init__(self, threshold: float = 0.015, noise_ratio: float = 3.0, start_frames: int = 3,
+                 silence_ms: int = 600):
+        self.threshold = threshold
+        self.noise_ratio = noise_ratio
+        self.start_frames = start_frames
+        self.end_frames = max(1, silence_ms // FRAME_MS)
+        self.noise_floor = threshold / noise_ratio
+        self.in_speech = False
+        self._voiced_run = 0
+        self._silent_run = 0
+
+    def _is_voiced(self, frame: np.ndarray) -> bool:
+        rms = float(np.sqrt(np.mean(frame * frame))) if frame.size else 0.0
+        voiced = rms > max(self.threshold, self.noise_floor * self.noise_ratio)
+        if not voiced:
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+        return voiced
+
+    def process(self, frame: np.ndarray) -> Optional[str]:
+        """Retourne "start" ou "end" lors d'une transition, None sinon."""
+        voiced = self._is_voiced(frame)
+        if not self.in_speech:
+            self._voiced_run = self._voiced_run + 1 if voiced else 0
+            if self._voiced_run >= self.start_frames:
+                self.in_speech = True
+                self._silent_run = 0
+                return "start"
+        else:
+            self._silent_run = 0 if voiced else self._silent_run + 1
+            if self._silent_run >= self.end_frames:
+                self.in_speech = False
+                self._voiced_run = 0
+                return "end"
+        return None
+
+
+class StreamingSegmenter:
+    """
+    Découpe le flux PCM d'une session en segments de parole.
+
+    `feed()` retourne une liste d'événements (kind, audio float32) :
+    - ("start", audio vide) : début de parole détecté (permet d'interrompre la réponse en cours)
+    - ("partial", audio) : fenêtre glissante de l'énoncé en cours, à transcrire pour une hypothèse partielle
+    - ("final", audio) : énoncé terminé (fin de parole détectée)
+    - ("cut", audio) : énoncé découpé car trop long ; ses `overlap_seconds` finales sont reprises au début
+      du segment suivant (recouvrement à retirer du texte, voir OverlapJoiner)
+    """
+
+    def __init__(
+            self,
+            vad: Optional[EnergyVAD] = None,
+            partial_interval_seconds: float = 1.0,
+            partial_window_seconds: float = 8.0,
+            max_segment_seconds: float = 15.0,
+            overlap_seconds: float = 0.5,
+            pre_roll_seconds: float = 0.3,
+    ):
+        self.vad = vad or EnergyVAD()
+        self.partial_interval = int(partial_interval_seconds * SAMPLE_RATE)
+        self.partial_window = int(partial_window_seconds * SAMPLE_RATE)
+        self.max_segment = int(max_segment_seconds * SAMPLE_RATE)
+        self.overlap = int(overlap_seconds * SAMPLE_RATE)
+        self.pre_roll = int(pre_roll_seconds * SAMPLE_RATE)
+
+        self._pending = bytearray()  # octets pas encore découpés en trames
+        self._pre_roll = np.zeros(0, dtype=np.float32)  # début de mot précédant la détection
+        self._speech: list[np.ndarray] = []
+        self._speech_len = 0
+        self._since_partial = 0
+
+    def _speech_audio(self) -> np.ndarray:
+        return np.concatenate(self._speech) if self._speech else np.zeros(0, dtype=np.float32)
+
+    def _reset_speech(self, keep: Optional[np.ndarray] = None):
+        self._speech = [keep] if keep is not None and keep.size else []
+        self._speech_len = sum(a.size for a in self._speech)
+        self._since_partial = 0
+
+    def feed(self, chunk: bytes) -> list[tuple[str, np.ndarray]]:
+        events = []
+        self._pending.extend(chunk)
+        frame_bytes = FRAME_SAMPLES * 2
+        usable = len(self._pending) - (len(self._pending) % frame_bytes)
+        if not usable:
+            return events
+        samples = pcm16_to_float32(bytes(self._pending[:usable]))
+        del self._pending[:usable]
+
+        for start in range(0, samples.size, FRAME_SAMPLES):
+            frame = samples[start:start + FRAME_SAMPLES]
+            transition = self.vad.process(frame)
+
+            if transition == "start":
+                self._reset_speech(self._pre_roll)
+                events.append(("start", np.zeros(0, dtype=np.float32)))
+
+            if self.vad.in_speech or transition == "end":
+                self._speech.append(frame)
+                self._speech_len += frame.size
+                self._since_partial += frame.size
+            else:
+                self._pre_roll = np.concatenate((self._pre_roll, frame))[-self.pre_roll:]
+
+            if transition == "end":
+                events.append(("final", self._speech_audio()))
+                self._reset_speech()
+            elif self.vad.in_speech and self._speech_len >= self.max_segment:
+                audio = self._speech_audio()
+                events.append(("cut", audio))
+                self._reset_speech(audio[-self.overlap:] if self.overlap else None)
+            elif self.vad.in_speech and self._since_partial >= self.partial_interval:
+                self._since_partial = 0
+                events.append(("partial", self._speech_audio()[-self.partial_window:]))
+        return events
+
+    def flush(self) -> Optional[np.ndarray]:
+        """Retourne la parole en cours (fin de flux), ou None."""
+        if not self.vad.in_speech or not self._speech_len:
+            return None
+        audio = self._speech_audio()
+        self._reset_speech()
+        return audio
+
+
+def segmenter_from_env() -> StreamingSegmenter:
+    return StreamingSegmenter(
+        vad=EnergyVAD(
+            threshold=float(os.getenv("ASR_VAD_THRESHOLD", "0.015")),
+            silence_ms=int(os.getenv("ASR_VAD_SILENCE_MS", "600")),
+        ),
+        partial_interval_seconds=float(os.getenv("ASR_PARTIAL_INTERVAL_SECONDS", "1.0")),
+        max_segment_seconds=float(os.getenv("ASR_MAX_SEGMENT_SECONDS", "15")),
+        overlap_seconds=float(os.getenv("ASR_OVERLAP_SECONDS", "0.5")),
+    )
+
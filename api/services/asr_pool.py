@@ -0,0 +1,317 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+from api.services import metrics
+from api.services.asr import SAMPLE_RATE
+
+# Whisper encode des fenêtres de 30 s : au-delà, on retombe sur transcribe() classique
+MAX_BATCHED_SECONDS = 30.0
+NO_SPEECH_THRESHOLD = 0.6
+
+
+class AsrQueueFull(Exception):
+    """La file ASR est pleine et la requête ne peut pas attendre (hypothèse partielle)."""
+
+
+@dataclass
+class AsrJob:
+    session_id: str
+    audio: np.ndarray
+    beam_size: int
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class AsrWorker:
+    """Un modèle Whisper chargé dans son propre thread, épinglé sur ses propres cœurs CPU."""
+
+    def __init__(self, index: int, model_size: str, compute_type: str, language: str, cpu_threads: int,
+                 cores: Optional[list[int]] = None):
+        self.index = index
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.language = language
+        self.cpu_threads = cpu_threads
+        self.cores = cores
+        self.model = None
+        self.busy = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"asr-{index}",
+                                            initializer=self._pin_thread)
+
+    def _pin_thread(self):
+        # Sous Linux, pid 0 = thread appelant ; les threads CTranslate2 créés ensuite héritent de l'affinité
+        if self.cores and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, self.cores)
+
+    def _load_sync(self):
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(self.model_size, compute_type=self.compute_type,
+                                  cpu_threads=self.cpu_threads, num_workers=1)
+
+    def _transcribe_one(self, audio: np.ndarray, beam_size: int) -> str:
+        segments, _info = self.model.transcribe(audio, language=self.language, beam_size=beam_size)
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+    def _transcribe_batch_sync(self, audios: list[np.ndarray], beam_size: int) -> list[str]:
+        """Une seule passe encodeur/décodeur pour plusieurs segments (de sessions différentes)."""
+        if len(audios) == 1 or any(a.size > MAX_BATCHED_SECONDS * SAMPLE_RATE for a in audios):
+            return [self._transcribe_one(audio, beam_size) for audio in audios]
+
+        from faster_whisper.audio import pad_or_trim
+        from faster_whisper.tokenizer import Tokenizer
+
+        model = self.model
+        tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe",
+                              language=self.language)
+        features = np.stack([pad_or_trim(model.feature_extractor(audio)[..., :-1]) for audio in audios])
+        prompt = model.get_prompt(tokenizer, previous_tokens=[], without_timestamps=True)
+        encoder_output = model.encode(features)
+        results = model.model.generate(
+            encoder_output,
+            [list(prompt) for _ in audios],
+            beam_size=beam_size,
+            max_length=model.max_length,
+            suppress_blank=True,
+            return_no_speech_prob=True,
+        )
+        texts = []
+        for result in results:
+            if result.no_speech_prob > NO_SPEECH_THRESHOLD:
+                texts.append("")
+            else:
+                texts.append(tokenizer.decode(result.sequences_ids[0]).strip())
+        return texts
+
+    async def load(self):
+        if self.model is not None:
+            return  # déjà chargé (nouvelle tentative de démarrage après l'échec d'un autre worker)
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._load_sync)
+
+    async def run(self, audios: list[np.ndarray], beam_size: int) -> list[str]:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._transcribe_batch_sync, audios, beam_size
+        )
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AsrWorkerPool:
+    """
+    Service ASR partagé par toutes les sessions /ws/speak.
+
+    - N workers, chacun avec son modèle, son thread et ses cœurs CPU
+    - une file bornée par session ; le planificateur prend les segments à tour de rôle
+      (une session bavarde ne passe pas devant les autres) et regroupe ceux de sessions
+      différentes dans un même appel d'inférence
+    - quand la file est pleine, les transcriptions finales attendent (contre-pression)
+      et les hypothèses partielles sont refusées (AsrQueueFull)
+    """
+
+    def __init__(
+            self,
+            model_size: str = "small",
+            compute_type: str = "int8",
+            language: str = "fr",
+            workers: int = 1,
+            cpu_threads: int = 0,
+            max_batch: int = 4,
+            max_queue: int = 32,
+            max_pending_per_session: int = 4,
+            batch_wait_ms: float = 10.0,
+    ):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.language = language
+        self.max_batch = max(1, max_batch)
+        self.max_queue = max(1, max_queue)
+        self.max_pending_per_session = max(1, max_pending_per_session)
+        self.batch_wait = batch_wait_ms / 1000.0
+
+        available = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(
+            range(os.cpu_count() or 1))
+        workers = max(1, workers)
+        per_worker = cpu_threads or max(1, len(available) // workers)
+        self.workers = [
+            AsrWorker(i, model_size, compute_type, language, per_worker,
+                      cores=available[i * per_worker:(i + 1) * per_worker] or None)
+            for i in range(workers)
+        ]
+
+        self._sessions: "OrderedDict[str, deque[AsrJob]]" = OrderedDict()
+        self._pending = 0
+        self._wakeup = asyncio.Event()
+        self._batch_full = asyncio.Event()  # assez de segments en file pour un lot complet
+        self._space = asyncio.Condition()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._running: set[asyncio.Task] = set()
+
+        self.counters = {"jobs": 0, "batches": 0, "batched_jobs": 0, "rejected": 0}
+
+    @classmethod
+    def from_env(cls) -> "AsrWorkerPool":
+        return cls(
+            model_size=os.getenv("ASR_MODEL_SIZE", "small"),
+            compute_type=os.getenv("ASR_COMPUTE_TYPE", "int8"),
+            language=os.getenv("ASR_LANGUAGE", "fr"),
+            workers=int(os.getenv("ASR_WORKERS", "1")),
+            cpu_threads=int(os.getenv("ASR_CPU_THREADS", "0")),
+            max_batch=int(os.getenv("ASR_MAX_BATCH", "4")),
+            max_queue=int(os.getenv("ASR_MAX_QUEUE", "32")),
+            max_pending_per_session=int(os.getenv("ASR_MAX_PENDING_PER_SESSION", "4")),
+            batch_wait_ms=float(os.getenv("ASR_BATCH_WAIT_MS", "10")),
+        )
+
+    async def start(self):
+        await asyncio.gather(*(worker.load() for worker in self.workers))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+        for task in list(self._running):
+            task.cancel()
+        for queue in self._sessions.values():
+            for job in queue:
+                if not job.future.done():
+                    job.future.cancel()
+        self._sessions.clear()
+        self._pending = 0
+        for worker in self.workers:
+            worker.shutdown()
+
+    def queue_depth(self) -> int:
+        return self._pending
+
+    async def transcribe(self, audio: np.ndarray, session_id: str = "default", beam_size: int = 1,
+                         wait: bool = True) -> str:
+        """Transcrit un segment. Avec wait=False (hypothèses partielles), lève AsrQueueFull au lieu d'attendre."""
+        if audio.size == 0:
+            return ""
+
+        async with self._space:
+            while self._is_full(session_id):
+                if not wait:
+                    self.counters["rejected"] += 1
+                    raise AsrQueueFull()
+                await self._space.wait()
+            job = AsrJob(session_id, audio, beam_size, asyncio.get_running_loop().create_future())
+            self._sessions.setdefault(session_id, deque()).append(job)
+            self._pending += 1
+            self.counters["jobs"] += 1
+        self._wakeup.set()
+        if self._pending >= self.max_batch:
+            self._batch_full.set()
+
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            await self._discard(job)
+            raise
+
+    def _is_full(self, session_id: str) -> bool:
+        session_queue = self._sessions.get(session_id)
+        return self._pending >= self.max_queue or (
+                session_queue is not None and len(session_queue) >= self.max_pending_per_session)
+
+    async def _discard(self, job: AsrJob):
+        queue = self._sessions.get(job.session_id)
+        if queue and job in queue:
+            queue.remove(job)
+            self._pending -= 1
+            if not queue:
+                del self._sessions[job.session_id]
+            # Place libérée : réveille les transcriptions finales en attente (contre-pression)
+            await self._notify_space()
+
+    def _next_batch(self) -> list[AsrJob]:
+        """Tourniquet sur les sessions : au plus un segment par session et par tour."""
+        batch: list[AsrJob] = []
+        while self._sessions and len(batch) < self.max_batch:
+            session_id, queue = next(iter(self._sessions.items()))
+            job = queue.popleft()
+            self._pending -= 1
+            del self._sessions[session_id]
+            if queue:
+                self._sessions[session_id] = queue  # la session repasse en fin de tourniquet
+            if not job.future.done():
+                batch.append(job)
+        return batch
+
+    async def _notify_space(self):
+        async with self._space:
+            self._space.notify_all()
+
+    async def _dispatch(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            while self._pending:
+                worker = next((w for w in self.workers if not w.busy), None)
+                if worker is None:
+                    break
+                if self._pending < self.max_batch and self.batch_wait:
+                    # Lot incomplet : petite fenêtre pour laisser arriver les segments d'autres sessions,
+                    # écourtée dès que le lot est complet
+                    self._batch_full.clear()
+                    try:
+                        await asyncio.wait_for(self._batch_full.wait(), self.batch_wait)
+                    except asyncio.TimeoutError:
+                        pass
+                batch = self._next_batch()
+                if not batch:
+                    continue
+                worker.busy = True
+                task = asyncio.create_task(self._run(worker, batch))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+                await self._notify_space()
+
+    async def _run(self, worker: AsrWorker, batch: list[AsrJob]):
+        try:
+            beam_size = max(job.beam_size for job in batch)
+            started = time.monotonic()
+            for job in batch:
+                metrics.ASR_QUEUE_WAIT_SECONDS.observe(started - job.enqueued_at)
+            with metrics.stage("asr.transcribe", metrics.ASR_SEGMENT_SECONDS, batch_size=len(batch)):
+                texts = await worker.run([job.audio for job in batch], beam_size)
+            audio_seconds = sum(job.audio.size for job in batch) / SAMPLE_RATE
+            for job in batch:
+                metrics.ASR_AUDIO_SECONDS.observe(job.audio.size / SAMPLE_RATE)
+            if audio_seconds:
+                metrics.ASR_REALTIME_FACTOR.observe((time.monotonic() - started) / audio_seconds)
+            self.counters["batches"] += 1
+            self.counters["batched_jobs"] += len(batch)
+            for job, text in zip(batch, texts):
+                if not job.future.done():
+                    job.future.set_result(text)
+        except Exception as e:
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_exception(e)
+        finally:
+            worker.busy = False
+            self._wakeup.set()
+
+    def stats(self) -> dict:
+        batches = self.counters["batches"]
+        return {
+            **self.counters,
+            "model_size": self.model_size,
+            "compute_type": self.compute_type,
+            "language": self.language,
+            "workers": len(self.workers),
+            "busy_workers": sum(1 for w in self.workers if w.busy),
+            "queue_depth": self._pending,
+            "sessions_waiting": len(self._sessions),
+            "avg_batch_size": round(self.counters["batched_jobs"] / batches, 2) if batches else None,
+        }
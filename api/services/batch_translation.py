@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import AsyncIterator, Awaitable, Callable, Union
+
+from api.services.translation_cache import TranslationCache, cache_key
+from api.services.translation_parser import FIELDS, SEPARATOR, TranslationStreamParser
+
+logger = logging.getLogger(__name__)
+
+Complete = Callable[[str], Awaitable[str]]
+
+PACKED_LINE = re.compile(r"^\s*\[(\d+)\]\s*(.*)$")
+
+
+def translation_prompt(source_lang: str, target_lang: str, text: str) -> str:
+    return (
+        f"Traduis en '{target_lang}' la phrase en '{source_lang}' : \"{text}\".\n"
+        "Réponds uniquement avec la traduction, suivi du séparateur de ligne suivant : |||, "
+        f"suivie en '{source_lang}' de la langue réelle de la phrase à traduire en majuscules suivie du séparateur de ligne suivant : |||, "
+        f"suivie d'une explication en '{source_lang}', suivie du séparateur de ligne suivant : |||, "
+        f"suivie de la version corrigée de la phrase s'il y a des fautes en '{source_lang}'."
+    )
+
+
+def packed_prompt(source_lang: str, target_lang: str, texts: list[str]) -> str:
+    """Plusieurs phrases courtes dans un seul prompt : une ligne de réponse par phrase, préfixée de son numéro."""
+    lines = "\n".join(f"[{number}] {text}" for number, text in enumerate(texts, start=1))
+    return (
+        f"Traduis en '{target_lang}' chacune des phrases numérotées suivantes, écrites en '{source_lang}'.\n"
+        "Pour chaque phrase, réponds sur une seule ligne commençant par son numéro entre crochets, avec : "
+        "la traduction, le séparateur |||, "
+        f"la langue réelle de la phrase en majuscules (en '{source_lang}'), le séparateur |||, "
+        f"une explication courte en '{source_lang}', le séparateur |||, "
+        f"la version corrigée de la phrase s'il y a des fautes en '{source_lang}'.\n"
+        "N'ajoute aucune autre ligne.\n"
+        f"{lines}"
+    )
+
+
+def parse_fields(text: str) -> dict:
+    parser = TranslationStreamParser()
+    parser.feed(text)
+    parser.finish()
+    return parser.values
+
+
+def parse_packed(text: str, count: int) -> dict[int, dict]:
+    """Réponse d'un prompt groupé -> {position: champs} ; les lignes incomplètes ou en double sont ignorées."""
+    results: dict[int, dict] = {}
+    for line in text.splitlines():
+        match = PACKED_LINE.match(line)
+        if not match:
+            continue
+        position = int(match.group(1)) - 1
+        body = match.group(2)
+        if not 0 <= position < count or position in results or body.count(SEPARATOR) < len(FIELDS) - 1:
+            continue
+        values = parse_fields(body)
+        if values["translation"]:
+            results[position] = values
+    return results
+
+
+class BatchTranslator:
+    """
+    Traduction de nombreuses phrases vers une ou plusieurs langues (/translate/batch).
+
+    - cache et clés partagés avec /translate : phrases déjà traduites rejouées, doublons traduits une fois
+    - au plus `concurrency` générations Ollama simultanées par lot
+    - phrases courtes (une ligne, sans séparateur) regroupées par `pack_size` dans un même prompt ;
+      une phrase absente ou mal formée dans la réponse groupée est retraduite seule
+    - chaque résultat est publié dès qu'il est prêt, avec son index
+    """
+
+    def __init__(
+            self,
+            complete: Complete,
+            cache: TranslationCache,
+            model: str,
+            concurrency: int = 4,
+            pack_size: int = 8,
+            pack_max_chars: int = 120,
+    ):
+        self.complete = complete
+        self.cache = cache
+        self.model = model
+        self.concurrency = concurrency
+        self.pack_size = pack_size
+        self.pack_max_chars = pack_max_chars
+        self.counters = {"batches": 0, "texts": 0, "cached": 0, "prompts": 0, "packed_prompts": 0,
+                         "unpacked_fallbacks": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls, complete: Complete, cache: TranslationCache, model: str) -> "BatchTranslator":
+        return cls(
+            complete,
+            cache,
+            model,
+            concurrency=int(os.getenv("TRANSLATE_BATCH_CONCURRENCY", "4")),
+            pack_size=int(os.getenv("TRANSLATE_PACK_SIZE", "8")),
+            pack_max_chars=int(os.getenv("TRANSLATE_PACK_MAX_CHARS", "120")),
+        )
+
+    def packable(self, text: str) -> bool:
+        return (self.pack_size > 1 and len(text) <= self.pack_max_chars and "\n" not in text
+                and SEPARATOR not in text and not PACKED_LINE.match(text))
+
+    async def _generate(self, semaphore: asyncio.Semaphore, usage: dict, prompt: str, packed: bool) -> str:
+        async with semaphore:
+            usage["prompts"] += 1
+            self.counters["prompts"] += 1
+            if packed:
+                self.counters["packed_prompts"] += 1
+            return await self.complete(prompt)
+
+    async def _single(self, semaphore, usage: dict, source_lang: str, target_lang: str, text: str) -> dict:
+        prompt = translation_prompt(source_lang, target_lang, text)
+        return parse_fields(await self._generate(semaphore, usage, prompt, False))
+
+    async def _pack(self, semaphore, usage: dict, source_lang: str, target_lang: str,
+                    texts: list[str]) -> list[Union[dict, BaseException]]:
+        """Champs de chaque phrase, ou l'erreur de sa retraduction seule (les autres résultats sont gardés)."""
+        if len(texts) == 1:
+            return [await self._single(semaphore, usage, source_lang, target_lang, texts[0])]
+        prompt = packed_prompt(source_lang, target_lang, texts)
+        parsed: dict[int, Union[dict, BaseException]] = parse_packed(
+            await self._generate(semaphore, usage, prompt, True), len(texts))
+        missing = [position for position in range(len(texts)) if position not in parsed]
+        if missing:
+            # Le slot de concurrence est rendu avant de retraduire : pas d'attente imbriquée sur le sémaphore
+            self.counters["unpacked_fallbacks"] += len(missing)
+            retried = await asyncio.gather(*(self._single(semaphore, usage, source_lang, target_lang, texts[p])
+                                             for p in missing), return_exceptions=True)
+            parsed.update(zip(missing, retried))
+        return [parsed[position] for position in range(len(texts))]
+
+    async def run(self, source_lang: str, target_langs: list[str], texts: list[str]) -> AsyncIterator[dict]:
+        started = time.perf_counter()
+        self.counters["batches"] += 1
+        self.counters["texts"] += len(texts) * len(target_langs)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        summary = {"type": "done", "results": 0, "cached": 0, "errors": 0}
+        usage = {"prompts": 0}
+
+        def result(index: int, target_lang: str, values: dict, cached: bool) -> dict:
+            summary["results"] += 1
+            return {"index": index, "target_lang": target_lang, **{f: values.get(f, "") for f in FIELDS},
+                    "cached": cached}
+
+        # Par langue : phrases à générer (texte -> index concernés), les doublons ne sont traduits qu'une fois
+        work: list[tuple[str, str, list[int]]] = []
+        for target_lang in target_langs:
+            pending: dict[str, list[int]] = {}
+            for index, text in enumerate(texts):
+                key = cache_key(self.model, source_lang, target_lang, text)
+                if key in pending:
+                    pending[key].append(index)
+                    continue
+                cached = await self.cache.get(key)
+                if cached is not None:
+                    summary["cached"] += 1
+                    self.counters["cached"] += 1
+                    yield result(index, target_lang, cached, True)
+                else:
+                    pending[key] = [index]
+            work.extend((target_lang, key, indexes) for key, indexes in pending.items())
+
+        async def translate(target_lang: str, group: list[tuple[str, list[int]]]):
+            group_texts = [texts[indexes[0]] for _, indexes in group]
+            try:
+                values = await self._pack(semaphore, usage, source_lang, target_lang, group_texts)
+            except Exception as e:  # Ollama injoignable, réponse illisible, file de l'ordonnanceur pleine
+                return target_lang, group, [e] * len(group)
+            for (key, _), value in zip(group, values):
+                # Ni les erreurs ni les réponses vides ne sont mises en cache
+                if isinstance(value, dict) and value.get("translation", "").strip():
+                    await self.cache.set(key, value)
+            return target_lang, group, values
+
+        # Unités de travail : groupes de phrases courtes de même langue cible, ou phrase seule
+        tasks = []
+        for target_lang in target_langs:
+            entries = [(key, indexes) for lang, key, indexes in work if lang == target_lang]
+            packable = [e for e in entries if self.packable(texts[e[1][0]])]
+            single = [e for e in entries if not self.packable(texts[e[1][0]])]
+            groups = [packable[i:i + self.pack_size] for i in range(0, len(packable), self.pack_size)]
+            groups += [[entry] for entry in single]
+            tasks += [asyncio.create_task(translate(target_lang, group)) for group in groups]
+
+        try:
+            for finished in asyncio.as_completed(tasks):
+                target_lang, group, values = await finished
+                for (_, indexes), value in zip(group, values):
+                    if isinstance(value, BaseException):
+                        self.counters["errors"] += 1
+                        logger.warning("Traduction échouée", extra={"target_lang": target_lang, "error": str(value)})
+                        for index in indexes:
+                            summary["errors"] += 1
+                            yield {"index": index, "target_lang": target_lang,
+                                   "error": f"{type(value).__name__}: {value}"}
+                        continue
+                    for index in indexes:
+                        yield result(index, target_lang, value, False)
+        finally:
+            # Client parti : les générations restantes sont abandonnées
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        yield {**summary, **usage,
+               "seconds": round(time.perf_counter() - started, 3)}
+
+    def stats(self) -> dict:
+        return {**self.counters, "concurrency": self.concurrency, "pack_size": self.pack_size,
+                "pack_max_chars": self.pack_max_chars}
@@ -0,0 +1,8 @@
+def parse_seconds(value: str) -> dict[str, float]:
+    """Délais par nom lus dans l'environnement : "voice=5,batch=600" -> {"voice": 5.0, "batch": 600.0}"""
+    seconds = {}
+    for part in (p.strip() for p in value.split(",")):
+        if part:
+            name, _, number = part.partition("=")
+            seconds[name.strip()] = float(number)
+    return seconds
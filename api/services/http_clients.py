@@ -0,0 +1,77 @@
+import os
+from typing import Optional
+
+import httpx
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def build_client(
+        prefix: str,
+        base_url: str = "",
+        max_connections: int = 20,
+        max_keepalive: int = 10,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        write_timeout: float = 30.0,
+        pool_timeout: float = 10.0,
+) -> httpx.AsyncClient:
+    """
+    Construit un client HTTP poolé pour un upstream. Chaque valeur peut être surchargée
+    par une variable d'environnement préfixée, ex: OLLAMA_MAX_CONNECTIONS, N8N_READ_TIMEOUT.
+    """
+    limits = httpx.Limits(
+        max_connections=_env_int(f"{prefix}_MAX_CONNECTIONS", max_connections),
+        max_keepalive_connections=_env_int(f"{prefix}_MAX_KEEPALIVE", max_keepalive),
+        keepalive_expiry=_env_float(f"{prefix}_KEEPALIVE_EXPIRY", keepalive_expiry),
+    )
+    timeout = httpx.Timeout(
+        connect=_env_float(f"{prefix}_CONNECT_TIMEOUT", connect_timeout),
+        read=_env_float(f"{prefix}_READ_TIMEOUT", read_timeout),
+        write=_env_float(f"{prefix}_WRITE_TIMEOUT", write_timeout),
+        pool=_env_float(f"{prefix}_POOL_TIMEOUT", pool_timeout),
+    )
+    return httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout)
+
+
+class UpstreamClients:
+    """
+    Clients HTTP des upstreams, ouverts au démarrage de l'app et fermés à l'arrêt :
+    Ollama via le pool d'instances (api/services/llm_pool.py), n8n via un client poolé.
+    """
+
+    def __init__(self, ollama_pool):
+        self.ollama_pool = ollama_pool
+        self._n8n: Optional[httpx.AsyncClient] = None
+
+    async def open(self):
+        await self.ollama_pool.open()
+        if self._n8n is None:
+            self._n8n = build_client("N8N", max_connections=10, max_keepalive=5, read_timeout=30.0)
+
+    async def close(self):
+        await self.ollama_pool.close()
+        if self._n8n is not None:
+            await self._n8n.aclose()
+        self._n8n = None
+
+    @property
+    def ollama(self) -> httpx.AsyncClient:
+        return self.ollama_pool.client
+
+    @property
+    def n8n_open(self) -> bool:
+        return self._n8n is not None
+
+    @property
+    def n8n(self) -> httpx.AsyncClient:
+        if self._n8n is None:
+            raise RuntimeError("Client n8n non initialisé (startup non exécuté)")
+        return self._n8n
@@ -0,0 +1,82 @@
+import json
+from typing import Any
+
+from llama_index.core.async_utils import asyncio_run
+from llama_index.core.tools import AsyncBaseTool, ToolMetadata, ToolOutput
+from llama_index.tools.mcp import McpToolSpec
+from mcp.server import FastMCP
+from mcp.types import CallToolResult, TextContent
+
+
+def structured_result(result: Any) -> Any:
+    """Les outils de mcp_server.py retournent des dict ou du JSON sérialisé : on rend un objet Python."""
+    if isinstance(result, str):
+        try:
+            return json.loads(result)
+        except ValueError:
+            return result
+    return result
+
+
+def content_text(result: Any) -> tuple[str, bool]:
+    """
+    Résultat de FastMCP.call_tool -> (texte, is_error). Selon l'outil, call_tool retourne des blocs de
+    contenu, un couple (blocs, contenu structuré) ou un CallToolResult : on garde le texte des blocs,
+    comme le client MCP en mode SSE.
+    """
+    is_error = False
+    if isinstance(result, CallToolResult):
+        result, is_error = result.content, result.isError
+    elif isinstance(result, tuple):
+        result = result[0]
+    text = "\n".join(block.text if isinstance(block, TextContent) else block.model_dump_json(exclude_none=True)
+                     for block in result)
+    return text, is_error
+
+
+class InProcessTool(AsyncBaseTool):
+    """Outil FastMCP appelé directement comme une fonction Python, sans session MCP ni transport réseau."""
+
+    def __init__(self, server: FastMCP, metadata: ToolMetadata):
+        self.server = server
+        self._metadata = metadata
+
+    @property
+    def metadata(self) -> ToolMetadata:
+        return self._metadata
+
+    def call(self, **kwargs: Any) -> ToolOutput:
+        # Appel synchrone (agents non async) : même chemin que acall, sur une boucle dédiée si besoin
+        return asyncio_run(self.acall(**kwargs))
+
+    async def acall(self, **kwargs: Any) -> ToolOutput:
+        name = self._metadata.name
+        try:
+            # API publique de FastMCP (validation des arguments, conversion en blocs de contenu MCP)
+            text, is_error = content_text(await self.server.call_tool(name, kwargs))
+        except Exception as e:
+            return ToolOutput(content=str(e), tool_name=name, raw_input=kwargs, raw_output=str(e),
+                              is_error=True, exception=e)
+        data = structured_result(text)
+        content = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+        return ToolOutput(content=content, tool_name=name, raw_input=kwargs, raw_output=data, is_error=is_error)
+
+
+class InProcessToolSpec:
+    """
+    Même interface que McpToolSpec (to_tool_list_async) pour les outils d'un serveur FastMCP chargé
+    dans le processus de l'API : mêmes noms, descriptions et schémas que via SSE, résultats structurés.
+    """
+
+    def __init__(self, server: FastMCP):
+        self.server = server
+        # Conversion schéma JSON -> modèle pydantic identique au mode SSE (même empreinte d'outils)
+        self._schemas = McpToolSpec(client=None)
+
+    async def to_tool_list_async(self) -> list[InProcessTool]:
+        tools = []
+        for info in await self.server.list_tools():
+            schema = self._schemas.create_model_from_json_schema(info.inputSchema, model_name=f"{info.name}_Schema")
+            tools.append(InProcessTool(self.server, ToolMetadata(name=info.name, description=info.description,
+                                                                 fn_schema=schema)))
+        return tools
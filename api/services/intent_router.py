@@ -0,0 +1,138 @@
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Optional
+
+
+def normalize(text: str) -> str:
+    """Minuscules, sans accents ni ponctuation finale, espaces simples."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.replace("’", "'")
+    return " ".join(text.strip(" .!?¿¡,;:\n\t").split())
+
+
+def device_response(data, text: str) -> str:
+    """Message renvoyé par home_automation_toggle_device, succès comme échec (appareil injoignable...)."""
+    result = data.get("result") if isinstance(data, dict) else None
+    if isinstance(result, dict) and result.get("message"):
+        return str(result["message"])
+    return text
+
+
+def weather_response(data, text: str) -> str:
+    # Même consigne que le prompt système : "Done" quand le client reçoit le JSON météo, sinon le message de l'outil
+    if isinstance(data, dict) and data.get("type") == "raw_weather_data":
+        return "Done"
+    return text
+
+
+@dataclass
+class Intent:
+    route: str
+    tool_name: str
+    tool_kwargs: dict
+    # Réponse finale à partir du résultat de l'outil (objet JSON décodé, texte brut)
+    final_response: Callable[[object, str], str] = lambda data, text: text
+
+    def reply(self, data, text: str, is_error: bool = False) -> str:
+        """Réponse lue dans le résultat de l'outil ; une erreur d'outil (délai, exception) est rendue telle quelle."""
+        return text if is_error else self.final_response(data, text)
+
+
+@dataclass
+class RouteStats:
+    hits: int = 0
+    latencies_ms: list = field(default_factory=list)
+
+    def record(self, seconds: float):
+        self.hits += 1
+        self.latencies_ms = (self.latencies_ms + [seconds * 1000])[-500:]
+
+    def summary(self) -> dict:
+        ordered = sorted(self.latencies_ms)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1) if ordered else None
+        return {"hits": self.hits, "p50_ms": pick(0.5), "p95_ms": pick(0.95)}
+
+
+TIME_PATTERN = re.compile(
+    r"^(quelle heure (est-il|il est|est il)|il est quelle heure|donne(-| )moi l'heure|l'heure"
+    r"|what time is it|what's the time)$"
+)
+DEVICE_PATTERN = re.compile(
+    r"^(?P<verb>allume|eteins|eteint|active|desactive|coupe|turn on|turn off|switch on|switch off)"
+    r"(?: moi)? (?P<target>.+)$"
+)
+WEATHER_PATTERN = re.compile(
+    r"^(?:quelle est la |quel |donne(?:-| )moi la )?(?:meteo|temps)(?: qu'il fait| fait-il| fait il| prevue?)?"
+    r" (?:a|au|aux|sur|pour|de|en) (?P<city>[a-z' -]{2,40})$"
+    r"|^(?:what's the |what is the )?weather (?:in|for|at) (?P<city_en>[a-z' -]{2,40})$"
+)
+# Mots qui ne désignent pas un lieu ("meteo pour demain", "meteo de la semaine") : laissés à l'agent
+NOT_A_PLACE = {
+    "aujourd", "hui", "demain", "apres", "hier", "soir", "matin", "midi", "nuit", "journee", "semaine", "week",
+    "end", "weekend", "mois", "jour", "jours", "heure", "heures", "maintenant", "prochain", "prochaine",
+    "prochains", "prochaines", "lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche", "ce",
+    "cet", "cette", "ces", "ici", "chez", "moi", "nous", "dehors", "coin", "ville", "quartier", "actuel",
+    "actuelle", "today", "tomorrow", "tonight", "now", "morning", "evening", "next", "this", "here", "my",
+}
+ARTICLES = re.compile(r"^(?:(?:la|le|les|l'|the|du|de la|de l'|des)\s*)+")
+ON_VERBS = {"allume", "active", "turn on", "switch on"}
+
+
+class IntentRouter:
+    """
+    Routage rapide avant l'agent : les commandes simples et sans ambiguïté (heure, allumer/éteindre
+    un appareil de deviceMap, météo d'une ville) appellent directement l'outil MCP, sans passer par le LLM.
+    Tout le reste est laissé à l'agent. Les hits et latences sont mesurés par route.
+    """
+
+    def __init__(self, device_names: Iterable[str]):
+        # Nom normalisé -> nom attendu par l'outil home_automation_toggle_device
+        self.devices = {normalize(name): name for name in device_names}
+        self.stats_by_route: dict[str, RouteStats] = {}
+
+    def _match_device(self, target: str) -> Optional[str]:
+        target = normalize(target)
+        candidates = [target, ARTICLES.sub("", target)]
+        for prefix in ("lumiere ", "lampe ", "light ", "prise "):
+            candidates += [c[len(prefix):] for c in list(candidates) if c.startswith(prefix)]
+        candidates += [ARTICLES.sub("", c) for c in list(candidates)]
+        for candidate in candidates:
+            if candidate in self.devices:
+                return self.devices[candidate]
+        return None
+
+    def match(self, text: str) -> Optional[Intent]:
+        normalized = normalize(text)
+
+        if TIME_PATTERN.match(normalized):
+            return Intent("time", "time", {})
+
+        device_match = DEVICE_PATTERN.match(normalized)
+        if device_match:
+            device = self._match_device(device_match.group("target"))
+            if device is not None:
+                state = "on" if device_match.group("verb") in ON_VERBS else "off"
+                return Intent("home_automation", "home_automation_toggle_device",
+                              {"device_name": device, "state": state}, final_response=device_response)
+
+        weather_match = WEATHER_PATTERN.match(normalized)
+        if weather_match:
+            city = (weather_match.group("city") or weather_match.group("city_en")).strip()
+            words = re.split(r"[ '-]+", city)
+            if len(city.split()) <= 4 and not NOT_A_PLACE.intersection(words):
+                return Intent("weather", "weather", {"location": city.title()}, final_response=weather_response)
+
+        return None
+
+    def record(self, route: str, seconds: float):
+        self.stats_by_route.setdefault(route, RouteStats()).record(seconds)
+
+    def stats(self) -> dict:
+        total = sum(s.hits for s in self.stats_by_route.values())
+        agent_hits = self.stats_by_route.get("agent", RouteStats()).hits
+        return {
+            "routes": {route: s.summary() for route, s in self.stats_by_route.items()},
+            "fast_path_ratio": round((total - agent_hits) / total, 3) if total else None,
+        }
@@ -0,0 +1,322 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+import httpx
+
+from api.services import metrics
+from api.services.http_clients import build_client
+
+logger = logging.getLogger(__name__)
+
+# Hôte fictif des requêtes passant par le pool : le transport le remplace par l'instance choisie
+POOL_HOST = "http://ollama-pool"
+
+
+class NoBackendAvailable(httpx.TransportError):
+    """Aucune instance Ollama saine (toutes en échec ou circuit ouvert)."""
+
+
+class GenerationFailed(Exception):
+    """Ollama a répondu une erreur (statut HTTP, ligne {"error": ...}) ou le stream s'est arrêté avant le chunk final."""
+
+
+class OllamaBackend:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.client: Optional[httpx.AsyncClient] = None
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.circuit_open_until = 0.0
+        self.loaded_models: set[str] = set()
+        self.model_expires: dict[str, str] = {}  # modèle -> expires_at de /api/ps
+        self.last_used: dict[str, float] = {}  # modèle -> dernière requête réussie (time.monotonic)
+        self.last_check: Optional[float] = None
+        self.counters = {"requests": 0, "failures": 0}
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.circuit_open_until
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            **self.counters,
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit_open": now < self.circuit_open_until,
+            "outstanding": self.outstanding,
+            "loaded_models": sorted(self.loaded_models),
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class _PeekedStream(httpx.AsyncByteStream):
+    """Flux de réponse dont le premier morceau a déjà été lu ; libère l'instance à la fermeture."""
+
+    def __init__(self, first: bytes, chunks, response: httpx.Response, pool: "OllamaPool", backend: OllamaBackend):
+        self.first = first
+        self.chunks = chunks
+        self.response = response
+        self.pool = pool
+        self.backend = backend
+        self._released = False
+
+    async def __aiter__(self):
+        if self.first:
+            yield self.first
+        try:
+            async for chunk in self.chunks:
+                yield chunk
+        except httpx.TransportError:
+            self.pool.record_failure(self.backend)
+            raise
+
+    async def aclose(self):
+        await self.response.aclose()
+        if not self._released:
+            self._released = True
+            self.pool.release(self.backend)
+
+
+class PoolTransport(httpx.AsyncBaseTransport):
+    """
+    Transport httpx qui envoie chaque requête à l'instance Ollama choisie par le pool.
+    Utilisable par httpx.AsyncClient (/translate, /discuss) et par ollama.AsyncClient (agent llama_index).
+    """
+
+    def __init__(self, pool: "OllamaPool"):
+        self.pool = pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.pool.dispatch(request)
+
+
+class OllamaPool:
+    """
+    Plusieurs instances Ollama derrière un même client.
+
+    - routage vers l'instance ayant le moins de requêtes en cours, en privilégiant celles où le modèle
+      demandé est déjà chargé (d'après /api/ps et les requêtes précédentes) : une instance froide n'est
+      choisie que si les autres ont `cold_penalty` requêtes de plus en attente
+    - health check actif (GET /api/ps) toutes les `health_interval_seconds`
+    - disjoncteur : après `failure_threshold` échecs consécutifs, l'instance est écartée
+      pendant `circuit_open_seconds`, puis réessayée
+    - une requête qui échoue avant son premier morceau de réponse (connexion, 5xx, coupure avant
+      le premier token) est relancée sur une autre instance
+    """
+
+    def __init__(
+            self,
+            urls: list[str],
+            health_interval_seconds: float = 10.0,
+            health_timeout_seconds: float = 2.0,
+            failure_threshold: int = 3,
+            circuit_open_seconds: float = 30.0,
+            max_attempts: int = 2,
+            cold_penalty: float = 4.0,
+    ):
+        if not urls:
+            raise ValueError("Au moins une instance Ollama est nécessaire")
+        self.backends = [OllamaBackend(url) for url in urls]
+        self.health_interval_seconds = health_interval_seconds
+        self.health_timeout_seconds = health_timeout_seconds
+        self.failure_threshold = failure_threshold
+        self.circuit_open_seconds = circuit_open_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.cold_penalty = cold_penalty
+        self._client: Optional[httpx.AsyncClient] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self.counters = {"failovers": 0, "no_backend": 0}
+
+    @classmethod
+    def from_env(cls, default_host: str) -> "OllamaPool":
+        # OLLAMA_HOSTS : liste séparée par des virgules ; à défaut, OLLAMA_HOST seul
+        hosts = [h.strip() for h in os.getenv("OLLAMA_HOSTS", "").split(",") if h.strip()] or [default_host]
+        return cls(
+            hosts,
+            health_interval_seconds=float(os.getenv("OLLAMA_HEALTH_INTERVAL_SECONDS", "10")),
+            failure_threshold=int(os.getenv("OLLAMA_FAILURE_THRESHOLD", "3")),
+            circuit_open_seconds=float(os.getenv("OLLAMA_CIRCUIT_OPEN_SECONDS", "30")),
+            max_attempts=int(os.getenv("OLLAMA_MAX_ATTEMPTS", str(min(len(hosts), 3)))),
+            cold_penalty=float(os.getenv("OLLAMA_COLD_PENALTY", "4")),
+        )
+
+    @property
+    def primary(self) -> str:
+        return self.backends[0].url
+
+    # --- cycle de vie ---
+
+    async def open(self):
+        for backend in self.backends:
+            if backend.client is None:
+                backend.client = build_client("OLLAMA", base_url=backend.url)
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=POOL_HOST, transport=PoolTransport(self), timeout=None)
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        for backend in self.backends:
+            if backend.client is not None:
+                await backend.client.aclose()
+                backend.client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Client httpx à utiliser comme un client Ollama classique (chemins /api/...)."""
+        if self._client is None:
+            raise RuntimeError("Pool Ollama non initialisé (startup non exécuté)")
+        return self._client
+
+    def ollama_async_client(self):
+        """Client `ollama.AsyncClient` pour llama_index, routé par le pool."""
+        from ollama import AsyncClient
+
+        return AsyncClient(host=POOL_HOST, transport=PoolTransport(self))
+
+    # --- sélection ---
+
+    def pick(self, model: Optional[str], exclude: set) -> OllamaBackend:
+        now = time.monotonic()
+        candidates = [b for b in self.backends if b not in exclude and b.available(now)]
+        if not candidates:
+            # Toutes les instances sont écartées : on tente quand même la moins récemment coupée
+            candidates = sorted((b for b in self.backends if b not in exclude), key=lambda b: b.circuit_open_until)[:1]
+        if not candidates:
+            self.counters["no_backend"] += 1
+            raise NoBackendAvailable("Aucune instance Ollama disponible")
+        # Une instance sans le modèle chargé compte comme `cold_penalty` requêtes en cours de plus
+        return min(candidates, key=lambda b: b.outstanding + (
+            self.cold_penalty if model and model not in b.loaded_models else 0))
+
+    def release(self, backend: OllamaBackend):
+        backend.outstanding -= 1
+
+    def record_success(self, backend: OllamaBackend, model: Optional[str] = None):
+        backend.consecutive_failures = 0
+        backend.healthy = True
+        backend.circuit_open_until = 0.0
+        if model:
+            backend.loaded_models.add(model)
+            backend.last_used[model] = time.monotonic()
+
+    def record_failure(self, backend: OllamaBackend):
+        backend.counters["failures"] += 1
+        backend.consecutive_failures += 1
+        if backend.consecutive_failures >= self.failure_threshold:
+            if time.monotonic() >= backend.circuit_open_until:
+                logger.warning("Instance Ollama écartée", extra={"backend": backend.url,
+                                                                "failures": backend.consecutive_failures})
+            backend.circuit_open_until = time.monotonic() + self.circuit_open_seconds
+
+    # --- envoi ---
+
+    @staticmethod
+    def _model_of(request: httpx.Request) -> Optional[str]:
+        try:
+            return json.loads(request.content or b"{}").get("model")
+        except (ValueError, AttributeError):
+            return None
+
+    async def dispatch(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        model = self._model_of(request)
+        tried: set = set()
+        last_error: Optional[Exception] = None
+
+        for attempt in range(self.max_attempts):
+            try:
+                backend = self.pick(model, tried)
+            except NoBackendAvailable:
+                if last_error is not None:
+                    raise last_error
+                raise
+            tried.add(backend)
+            if attempt:
+                self.counters["failovers"] += 1
+                metrics.OLLAMA_FAILOVERS_TOTAL.inc()
+
+            forwarded = httpx.Request(request.method, backend.url + request.url.raw_path.decode(),
+                                      headers=[(k, v) for k, v in request.headers.raw if k.lower() != b"host"],
+                                      content=request.content)
+            backend.outstanding += 1
+            backend.counters["requests"] += 1
+            response = None
+            try:
+                response = await backend.client.send(forwarded, stream=True)
+                if response.status_code >= 500:
+                    body = await response.aread()
+                    raise httpx.HTTPStatusError(f"Ollama {response.status_code}: {body[:200]!r}",
+                                                request=forwarded, response=response)
+                # Premier morceau lu ici : une coupure avant le premier token est encore rattrapable
+                chunks = response.aiter_raw()
+                try:
+                    first = await chunks.__anext__()
+                except StopAsyncIteration:
+                    first = b""
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if response is not None:
+                    await response.aclose()
+                backend.outstanding -= 1
+                self.record_failure(backend)
+                last_error = e if isinstance(e, httpx.TransportError) else httpx.RemoteProtocolError(str(e))
+                logger.warning("Requête Ollama échouée", extra={"backend": backend.url, "attempt": attempt + 1,
+                                                               "error": str(e)})
+                continue
+            except BaseException:
+                if response is not None:
+                    await response.aclose()
+                backend.outstanding -= 1
+                raise
+
+            if response.status_code < 400:
+                self.record_success(backend, model)
+            return httpx.Response(
+                status_code=response.status_code,
+                headers=response.headers.raw,
+                stream=_PeekedStream(first, chunks, response, self, backend),
+                extensions=response.extensions,
+                request=request,
+            )
+
+        raise last_error or NoBackendAvailable("Aucune instance Ollama disponible")
+
+    # --- health checks ---
+
+    async def check(self, backend: OllamaBackend):
+        try:
+            response = await backend.client.get("/api/ps", timeout=self.health_timeout_seconds)
+            response.raise_for_status()
+            models = response.json().get("models") or []
+        except (httpx.HTTPError, ValueError) as e:
+            backend.healthy = False
+            self.record_failure(backend)
+            logger.debug("Health check Ollama en échec", extra={"backend": backend.url, "error": str(e)})
+        else:
+            backend.loaded_models = {m.get("name") or m.get("model") for m in models}
+            backend.model_expires = {m.get("name") or m.get("model"): m.get("expires_at") for m in models}
+            self.record_success(backend)
+        backend.last_check = time.monotonic()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.gather(*(self.check(backend) for backend in self.backends))
+            await asyncio.sleep(self.health_interval_seconds)
+
+    def stats(self) -> dict:
+        return {**self.counters, "backends": [backend.stats() for backend in self.backends]}
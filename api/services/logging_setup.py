@@ -0,0 +1,53 @@
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+# Attributs standard d'un LogRecord : tout le reste vient de `extra=` et est sérialisé tel quel
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par événement : ts, level, logger, message, puis les champs passés via `extra`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RESERVED})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Format lisible pour le développement, champs `extra` ajoutés en clé=valeur."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        extra = " ".join(f"{key}={value}" for key, value in vars(record).items() if key not in _RESERVED)
+        return f"{text} {extra}" if extra else text
+
+
+def configure_logging():
+    """
+    LOG_LEVEL : debug, info (défaut), warning, error ou off (aucun log applicatif).
+    LOG_FORMAT : json (défaut) ou text.
+    """
+    level_name = os.getenv("LOG_LEVEL", "info").upper()
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(TextFormatter() if os.getenv("LOG_FORMAT", "json").casefold() == "text" else JsonFormatter())
+
+    for name in ("api", "mcp_tools"):
+        logger = logging.getLogger(name)
+        logger.handlers = [handler]
+        logger.propagate = False
+        # "off" : niveau au-dessus de CRITICAL, hérité par les loggers enfants (api.main, ...)
+        logger.setLevel(logging.CRITICAL + 1 if level_name == "OFF" else getattr(logging, level_name, logging.INFO))
@@ -0,0 +1,354 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} attend les labels {self.labelnames}, reçu {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Jauge classique (set/inc/dec) ou calculée au moment du scrape (set_function)."""
+
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple, float] = {}
+        self._functions: dict[tuple, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels):
+        self._functions[self._key(labels)] = function
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        for key, function in self._functions.items():
+            try:
+                values[key] = float(function())
+            except Exception as e:
+                logger.warning("Jauge %s illisible: %s", self.name, e)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Par combinaison de labels : [compte par bucket (non cumulé), somme, nombre]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrique déjà déclarée: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Format texte d'exposition Prometheus (version 0.0.4)."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Requêtes HTTP / WebSocket
+REQUESTS_IN_FLIGHT = REGISTRY.gauge("myai_requests_in_flight", "Requêtes en cours (streams compris)", ["path"])
+REQUESTS_TOTAL = REGISTRY.counter("myai_requests_total", "Requêtes terminées", ["path", "status"])
+REQUEST_SECONDS = REGISTRY.histogram("myai_request_seconds", "Durée totale des requêtes (streams compris)", ["path"])
+QUEUE_DEPTH = REGISTRY.gauge("myai_queue_depth", "Profondeur des files internes", ["queue"])
+
+# Étapes du pipeline
+ASR_SEGMENT_SECONDS = REGISTRY.histogram(
+    "myai_asr_segment_seconds", "Durée de transcription d'un lot de segments", ["batch_size"])
+ASR_AUDIO_SECONDS = REGISTRY.histogram(
+    "myai_asr_audio_seconds", "Durée audio des segments transcrits", buckets=(0.5, 1, 2, 4, 8, 15, 30))
+ASR_REALTIME_FACTOR = REGISTRY.histogram(
+    "myai_asr_realtime_factor", "Temps de calcul / durée audio (< 1 : plus rapide que le temps réel)",
+    buckets=(0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0))
+ASR_QUEUE_WAIT_SECONDS = REGISTRY.histogram("myai_asr_queue_wait_seconds", "Attente d'un segment dans la file ASR")
+AGENT_BUILD_SECONDS = REGISTRY.histogram("myai_agent_build_seconds", "Construction de l'agent (FunctionAgent)")
+AGENT_CACHE_TOTAL = REGISTRY.counter("myai_agent_cache_total", "Accès au cache de l'agent", ["status"])
+LLM_TTFT_SECONDS = REGISTRY.histogram("myai_llm_time_to_first_token_seconds", "Temps jusqu'au premier token",
+                                      ["endpoint"])
+LLM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "myai_llm_tokens_per_second", "Débit de génération", ["endpoint"],
+    buckets=(1, 2, 5, 10, 20, 40, 80, 160, 320))
+LLM_TOKENS_TOTAL = REGISTRY.counter("myai_llm_tokens_total", "Tokens générés", ["endpoint"])
+TOOL_CALL_SECONDS = REGISTRY.histogram("myai_tool_call_seconds", "Durée des appels d'outils MCP", ["tool", "route"])
+TOOL_CALLS_TOTAL = REGISTRY.counter("myai_tool_calls_total", "Appels d'outils MCP", ["tool", "route", "status"])
+OLLAMA_OUTSTANDING = REGISTRY.gauge("myai_ollama_outstanding", "Requêtes en cours par instance Ollama", ["backend"])
+OLLAMA_FAILOVERS_TOTAL = REGISTRY.counter("myai_ollama_failovers_total", "Requêtes relancées sur une autre instance Ollama")
+OLLAMA_MODEL_LOADED = REGISTRY.gauge("myai_ollama_model_loaded", "Modèle chargé en mémoire (1) ou non (0)",
+                                     ["backend", "model"])
+MODEL_WARMUP_SECONDS = REGISTRY.histogram("myai_model_warmup_seconds", "Préchargement d'un modèle au démarrage",
+                                          ["model"])
+N8N_WEBHOOK_SECONDS = REGISTRY.histogram("myai_n8n_webhook_seconds", "Envoi au webhook n8n", ["status"])
+IMPORT_SECONDS = REGISTRY.gauge("myai_import_seconds", "Temps d'import de api.main")
+TIME_TO_READY_SECONDS = REGISTRY.gauge("myai_time_to_ready_seconds", "Délai entre le démarrage et l'initialisation",
+                                       ["subsystem"])
+SUBSYSTEM_READY = REGISTRY.gauge("myai_subsystem_ready", "Sous-système prêt (1) ou non (0)", ["subsystem"])
+VOICE_LATENCY_SECONDS = REGISTRY.histogram(
+    "myai_voice_latency_seconds", "Délai entre la fin de parole et la transcription / la première réponse", ["stage"])
+VOICE_BARGE_INS_TOTAL = REGISTRY.counter("myai_voice_barge_ins_total", "Réponses interrompues par une nouvelle parole")
+SCHED_QUEUE_WAIT_SECONDS = REGISTRY.histogram("myai_scheduler_queue_wait_seconds", "Attente d'un slot LLM / ASR",
+                                              ["resource", "priority_class"])
+SCHED_REJECTIONS_TOTAL = REGISTRY.counter("myai_scheduler_rejections_total", "Requêtes refusées ou abandonnées",
+                                          ["resource", "priority_class", "reason"])
+SCHED_ACTIVE = REGISTRY.gauge("myai_scheduler_active", "Slots occupés par ressource", ["resource"])
+STREAM_FRAMES_TOTAL = REGISTRY.counter("myai_stream_frames_total", "Événements envoyés (deltas fusionnés)", ["endpoint"])
+STREAM_DISCONNECTS_TOTAL = REGISTRY.counter("myai_stream_disconnects_total", "Streams annulés par déconnexion du client",
+                                            ["endpoint"])
+STREAM_ERRORS_TOTAL = REGISTRY.counter("myai_stream_errors_total", "Streams terminés par un événement d'erreur",
+                                       ["endpoint"])
+OFFLOAD_JOBS_TOTAL = REGISTRY.counter("myai_offload_jobs_total", "Jobs déportés (pool local / Modal)",
+                                      ["job", "backend", "status"])
+OFFLOAD_SECONDS = REGISTRY.histogram("myai_offload_seconds", "Durée d'un job déporté, transfert compris",
+                                     ["job", "backend"])
+OFFLOAD_FALLBACKS_TOTAL = REGISTRY.counter("myai_offload_fallbacks_total", "Jobs Modal relancés sur le pool local",
+                                           ["job"])
+
+
+def _load_tracer():
+    """Tracer OpenTelemetry si OTEL_ENABLED=true et le paquet est installé, sinon None (aucun coût)."""
+    if os.getenv("OTEL_ENABLED", "false").casefold() != "true":
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("OTEL_ENABLED=true mais opentelemetry-api n'est pas installé : spans désactivés")
+        return None
+    try:
+        # Export OTLP si le SDK et l'exporteur sont présents (configuration via les variables OTEL_EXPORTER_OTLP_*)
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "myai-api")}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        trace.set_tracer_provider(provider)
+    except ImportError:
+        pass  # fournisseur global (ex: opentelemetry-instrument)
+    return trace.get_tracer("myai")
+
+
+tracer = _load_tracer()
+
+
+@contextmanager
+def stage(name: str, histogram: Optional[Histogram] = None, **labels):
+    """
+    Mesure une étape : observation dans `histogram` (avec `labels`) et span OpenTelemetry optionnel.
+    Le span n'est pas rendu courant, ce qui permet de l'utiliser à travers les `yield` des générateurs.
+    """
+    span = tracer.start_span(name, attributes={k: str(v) for k, v in labels.items()}) if tracer else None
+    started = time.perf_counter()
+    try:
+        yield span
+    except BaseException as e:
+        if span is not None:
+            span.record_exception(e)
+        raise
+    finally:
+        if histogram is not None:
+            histogram.observe(time.perf_counter() - started, **labels)
+        if span is not None:
+            span.end()
+
+
+class TokenMeter:
+    """
+    Temps jusqu'au premier token et débit d'une génération LLM. Le span est créé à finish() avec
+    l'heure de début réelle : une génération abandonnée (client parti) ne laisse pas de span ouvert.
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.started_ns = time.time_ns()
+        self.first_token_at: Optional[float] = None
+        self.tokens = 0
+
+    def token(self, text: str):
+        if not text:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            LLM_TTFT_SECONDS.observe(self.first_token_at - self.started, endpoint=self.endpoint)
+        self.tokens += 1
+
+    def finish(self, final_chunk: Optional[dict] = None):
+        """`final_chunk` : dernier chunk Ollama (eval_count / eval_duration exacts) s'il est disponible."""
+        final_chunk = final_chunk or {}
+        rate = None
+        if final_chunk.get("eval_count") and final_chunk.get("eval_duration"):
+            rate = final_chunk["eval_count"] / (final_chunk["eval_duration"] / 1e9)
+        elif self.first_token_at is not None and self.tokens > 1:
+            elapsed = time.perf_counter() - self.first_token_at
+            rate = (self.tokens - 1) / elapsed if elapsed > 0 else None
+        if rate is not None:
+            LLM_TOKENS_PER_SECOND.observe(rate, endpoint=self.endpoint)
+        LLM_TOKENS_TOTAL.inc(self.tokens, endpoint=self.endpoint)
+        if tracer is not None:
+            attributes = {"endpoint": self.endpoint, "tokens": self.tokens}
+            if self.first_token_at is not None:
+                attributes["time_to_first_token_ms"] = round((self.first_token_at - self.started) * 1000, 1)
+            tracer.start_span("llm.generate", start_time=self.started_ns, attributes=attributes).end()
+
+
+class RequestMetricsMiddleware:
+    """Middleware ASGI : requêtes en cours, total et durée par route (streams et WebSocket compris)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _route_path(scope) -> str:
+        from starlette.routing import Match
+
+        router = getattr(scope.get("app"), "router", None)
+        for route in getattr(router, "routes", []):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", "other")
+        return "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+
+        path = self._route_path(scope)
+        status = {"code": "ws" if scope["type"] == "websocket" else "500"}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = str(message["status"])
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(path=path)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec(path=path)
+            REQUEST_SECONDS.observe(time.perf_counter() - started, path=path)
+            REQUESTS_TOTAL.inc(path=path, status=status["code"])
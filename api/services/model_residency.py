@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+import httpx
+
+from api.services import metrics
+from api.services.llm_pool import OllamaBackend, OllamaPool
+
+logger = logging.getLogger(__name__)
+
+
+def parse_usage_hours(value: str) -> list[tuple[int, int]]:
+    """"07:00-23:00,23:30-01:00" -> [(420, 1380), (1410, 60)] en minutes ; vide = toute la journée."""
+    ranges = []
+    for part in (p.strip() for p in value.split(",")):
+        if not part:
+            continue
+        start, end = (_minutes(bound) for bound in part.split("-"))
+        ranges.append((start, end))
+    return ranges
+
+
+def _minutes(bound: str) -> int:
+    hours, _, minutes = bound.strip().partition(":")
+    return int(hours) * 60 + int(minutes or 0)
+
+
+class ModelResidency:
+    """
+    Garde les modèles Ollama en mémoire pour qu'aucune requête utilisateur ne paie leur chargement.
+
+    - au démarrage, chaque modèle est chargé sur chaque instance par une génération minimale (1 token)
+    - pendant les heures d'utilisation, un heartbeat renvoie une requête de chargement (prompt vide,
+      `keep_alive`) aux instances où le modèle n'a pas servi depuis `heartbeat_seconds` ; un modèle
+      déchargé entre-temps est rechargé
+    - hors de ces heures, le modèle expire normalement après `keep_alive`
+    """
+
+    def __init__(
+            self,
+            pool: OllamaPool,
+            models: list[str],
+            keep_alive: str = "30m",
+            heartbeat_seconds: float = 300.0,
+            usage_hours: Optional[list[tuple[int, int]]] = None,
+            warmup_timeout_seconds: float = 600.0,
+    ):
+        self.pool = pool
+        self.models = models
+        self.keep_alive = keep_alive
+        self.heartbeat_seconds = heartbeat_seconds
+        self.usage_hours = usage_hours or []
+        self.warmup_timeout_seconds = warmup_timeout_seconds
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        # (instance, modèle) -> dernier chargement réussi / dernière erreur
+        self._warmed: dict[tuple[str, str], dict] = {}
+        self.counters = {"warmups": 0, "heartbeats": 0, "reloads": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls, pool: OllamaPool, default_model: str, keep_alive: str) -> "ModelResidency":
+        models = [m.strip() for m in os.getenv("OLLAMA_WARM_MODELS", default_model).split(",") if m.strip()]
+        return cls(
+            pool,
+            models,
+            keep_alive=keep_alive,
+            heartbeat_seconds=float(os.getenv("OLLAMA_HEARTBEAT_SECONDS", "300")),
+            usage_hours=parse_usage_hours(os.getenv("OLLAMA_USAGE_HOURS", "")),
+            warmup_timeout_seconds=float(os.getenv("OLLAMA_WARMUP_TIMEOUT_SECONDS", "600")),
+        )
+
+    def in_usage_hours(self, moment: Optional[datetime] = None) -> bool:
+        if not self.usage_hours:
+            return True
+        moment = moment or datetime.now()
+        minute = moment.hour * 60 + moment.minute
+        for start, end in self.usage_hours:
+            if start <= end and start <= minute < end:
+                return True
+            if start > end and (minute >= start or minute < end):  # plage à cheval sur minuit
+                return True
+        return False
+
+    # --- chargement ---
+
+    async def load(self, backend: OllamaBackend, model: str, generate: bool = False) -> float:
+        """
+        Charge `model` sur l'instance et repousse son expiration de `keep_alive`.
+        generate=True : génération d'un token (initialise aussi les buffers de calcul), sinon prompt vide.
+        """
+        payload = {"model": model, "prompt": "", "stream": False, "keep_alive": self.keep_alive}
+        if generate:
+            payload.update(prompt="ok", options={"num_predict": 1})
+        started = time.perf_counter()
+        try:
+            response = await backend.client.post("/api/generate", json=payload, timeout=self.warmup_timeout_seconds)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            self.counters["errors"] += 1
+            self._warmed[(backend.url, model)] = {**self._warmed.get((backend.url, model), {}),
+                                                  "error": f"{type(e).__name__}: {e}"}
+            raise
+        elapsed = time.perf_counter() - started
+        self._warmed[(backend.url, model)] = {"warmed_at": time.time(), "load_seconds": round(elapsed, 3),
+                                              "error": None}
+        self.pool.record_success(backend, model)
+        return elapsed
+
+    async def warm_all(self):
+        """Génération minimale de chaque modèle sur chaque instance joignable ; échoue si un modèle n'est chargé nulle part."""
+        now = time.monotonic()
+        backends = [b for b in self.pool.backends if b.available(now)]
+
+        async def warm(backend: OllamaBackend, model: str) -> bool:
+            try:
+                elapsed = await self.load(backend, model, generate=True)
+            except httpx.HTTPError as e:
+                logger.warning("Préchargement du modèle échoué", extra={"backend": backend.url, "model": model,
+                                                                        "error": str(e)})
+                return False
+            self.counters["warmups"] += 1
+            metrics.MODEL_WARMUP_SECONDS.observe(elapsed, model=model)
+            logger.info("Modèle préchargé", extra={"backend": backend.url, "model": model,
+                                                   "load_seconds": round(elapsed, 3)})
+            return True
+
+        results = await asyncio.gather(*(warm(b, m) for b in backends for m in self.models))
+        for index, model in enumerate(self.models):
+            if not any(results[i * len(self.models) + index] for i in range(len(backends))):
+                raise ConnectionError(f"Modèle {model} chargé sur aucune instance Ollama")
+
+    async def heartbeat(self):
+        if not self.in_usage_hours():
+            return
+        now = time.monotonic()
+        for backend in self.pool.backends:
+            if not backend.available(now):
+                continue
+            for model in self.models:
+                # Une requête utilisateur récente a déjà repoussé l'expiration
+                if now - backend.last_used.get(model, 0.0) < self.heartbeat_seconds:
+                    continue
+                evicted = model not in backend.loaded_models
+                try:
+                    await self.load(backend, model)
+                except httpx.HTTPError as e:
+                    logger.warning("Heartbeat du modèle échoué", extra={"backend": backend.url, "model": model,
+                                                                        "error": str(e)})
+                    continue
+                self.counters["heartbeats"] += 1
+                if evicted:
+                    self.counters["reloads"] += 1
+                    logger.info("Modèle rechargé", extra={"backend": backend.url, "model": model})
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            await self.heartbeat()
+
+    # --- cycle de vie ---
+
+    async def start(self):
+        await self.warm_all()
+        if self.heartbeat_seconds > 0 and (self._heartbeat_task is None or self._heartbeat_task.done()):
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def close(self):
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+
+    def is_loaded(self, backend: OllamaBackend, model: str) -> bool:
+        return model in backend.loaded_models
+
+    def status(self) -> dict:
+        return {
+            **self.counters,
+            "keep_alive": self.keep_alive,
+            "heartbeat_seconds": self.heartbeat_seconds,
+            "in_usage_hours": self.in_usage_hours(),
+            "models": {
+                model: [
+                    {
+                        "backend": backend.url,
+                        "loaded": self.is_loaded(backend, model),
+                        "expires_at": backend.model_expires.get(model),
+                        **self._warmed.get((backend.url, model), {}),
+                    }
+                    for backend in self.pool.backends
+                ]
+                for model in self.models
+            },
+        }
@@ -0,0 +1,133 @@
+import base64
+import json
+from typing import AsyncIterator, BinaryIO, Callable, Optional
+
+from starlette.datastructures import UploadFile
+
+# Multiple de 3 : chaque morceau s'encode en base64 sans padding intermédiaire
+CHUNK_SIZE = 3 * 16 * 1024
+# En-têtes multipart et champs texte autour du fichier
+FORM_OVERHEAD = 64 * 1024
+
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+async def inspect_upload(file: UploadFile, max_size: int, allowed_types: list[str]) -> tuple[str, int]:
+    """
+    Taille et type MIME d'un fichier reçu, sans le charger en mémoire : Starlette l'a déjà
+    écrit dans un fichier temporaire, seul le premier morceau est lu pour `magic`.
+    """
+    import magic  # libmagic chargée au premier upload seulement
+
+    size = file.size
+    if size is None:
+        await file.seek(0, 2)
+        size = file.file.tell()
+    if size > max_size:
+        raise UploadRejected(413, f"Fichier trop volumineux. Maximum: {max_size / 1024 / 1024}MB")
+
+    await file.seek(0)
+    mime_type = magic.from_buffer(await file.read(CHUNK_SIZE), mime=True)
+    await file.seek(0)
+    if mime_type not in allowed_types:
+        raise UploadRejected(400, f"Type de fichier non supporté. Types autorisés: {allowed_types}")
+    return mime_type, size
+
+
+def base64_length(size: int) -> int:
+    return 4 * ((size + 2) // 3)
+
+
+def webhook_body(fields: dict, attachment: dict, size: int,
+                 open_file: Callable[[], BinaryIO]) -> tuple[int, Callable[[], AsyncIterator[bytes]]]:
+    """
+    Corps JSON du webhook n8n encodé au fil de l'eau :
+    {...fields, "attachments": [{...attachment, "size": size, "content": "<base64>"}]}
+
+    Retourne (Content-Length exact, fabrique du flux) ; la fabrique peut être rappelée pour un nouvel envoi.
+    La mémoire utilisée reste de l'ordre de CHUNK_SIZE quelle que soit la taille du fichier.
+    """
+    head = json.dumps({**fields, "attachments": [{**attachment, "size": size}]})
+    # On rouvre le dernier objet pour y ajouter "content" en flux
+    prefix = (head[:-3] + ', "content": "').encode()
+    suffix = b'"}]}'
+    content_length = len(prefix) + base64_length(size) + len(suffix)
+
+    async def stream() -> AsyncIterator[bytes]:
+        yield prefix
+        file = open_file()
+        file.seek(0)
+        sent = 0
+        pending = b""
+        while sent < size:
+            data = file.read(CHUNK_SIZE)
+            if not data:
+                break
+            data = pending + data[:size - sent]
+            sent += len(data) - len(pending)
+            usable = len(data) - len(data) % 3 if sent < size else len(data)
+            pending = data[usable:]
+            yield base64.b64encode(data[:usable])
+        if sent != size:
+            raise IOError(f"Fichier tronqué : {sent} octets lus sur {size}")
+        yield suffix
+
+    return content_length, stream
+
+
+class BodySizeLimitMiddleware:
+    """
+    Refuse (413) les corps de requête trop gros pour les chemins donnés : dès l'en-tête
+    Content-Length s'il est présent, sinon dès que les octets reçus dépassent la limite.
+    """
+
+    def __init__(self, app, limits: dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": "Requête trop volumineuse"}).encode()
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        limit: Optional[int] = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            return await self._reject(send)
+
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Réponse 413 tout de suite ; l'application voit ensuite une déconnexion du client
+                    rejected = True
+                    await self._reject(send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            if not rejected:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not rejected:
+                raise
@@ -0,0 +1,270 @@
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Optional
+
+import numpy as np
+
+from api.services import metrics
+from api.services.asr import SAMPLE_RATE, pcm16_to_float32
+
+logger = logging.getLogger(__name__)
+
+JOB_NAMES = ("transcribe", "translate")
+
+
+def encode_audio(audio: np.ndarray) -> bytes:
+    """float32 [-1, 1] -> PCM 16-bit little-endian : deux fois moins d'octets, sans perte pour l'audio du client."""
+    return np.clip(np.rint(audio * 32768.0), -32768, 32767).astype("<i2").tobytes()
+
+
+# Jobs : fonctions de module exécutées dans un processus du pool local ou dans un conteneur Modal.
+# Elles ne reçoivent que des types simples (dict, str, bytes) et n'importent rien de api.main.
+
+_models: dict[tuple, Any] = {}
+
+
+def _whisper_model(model_size: str, compute_type: str, cpu_threads: int):
+    key = (model_size, compute_type, cpu_threads)
+    if key not in _models:
+        # Chargé une fois par processus / conteneur, réutilisé par les jobs suivants
+        from faster_whisper import WhisperModel
+        _models[key] = WhisperModel(model_size, compute_type=compute_type, cpu_threads=cpu_threads, num_workers=1)
+    return _models[key]
+
+
+def transcribe_job(payload: dict) -> str:
+    audio = pcm16_to_float32(payload["audio"])
+    if audio.size == 0:
+        return ""
+    model = _whisper_model(payload["model_size"], payload["compute_type"], payload.get("cpu_threads", 0))
+    segments, _info = model.transcribe(audio, language=payload["language"], beam_size=payload.get("beam_size", 1))
+    return " ".join(segment.text.strip() for segment in segments).strip()
+
+
+def translate_job(payload: dict) -> str:
+    import httpx
+    body = {"model": payload["model"], "prompt": payload["prompt"], "stream": False}
+    if payload.get("keep_alive"):
+        body["keep_alive"] = payload["keep_alive"]
+    response = httpx.post(f"{payload['host']}/api/generate", json=body, timeout=payload.get("timeout", 120.0))
+    response.raise_for_status()
+    return response.json().get("response", "")
+
+
+JOBS = {"transcribe": transcribe_job, "translate": translate_job}
+
+
+def run_job(job: str, payload: dict) -> Any:
+    """Point d'entrée commun au pool de processus local et à la fonction Modal (main_modal.py)."""
+    return JOBS[job](payload)
+
+
+class LocalBackend:
+    """Pool de processus sur la machine de l'API, créé au premier job (spawn : ni threads ni boucle héritée)."""
+
+    name = "local"
+    interruptible = False  # un job lancé dans un processus du pool va jusqu'au bout, même abandonné
+
+    def __init__(self, workers: int = 1):
+        self.workers = max(1, workers)
+        self.pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def run(self, job: str, payload: dict) -> Any:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool(), run_job, job, payload)
+        except BrokenProcessPool:
+            self._executor = None  # worker tué (mémoire) : nouveau pool au prochain job
+            raise
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class ModalBackend:
+    """Fonction `run_job` de l'app Modal déployée par `modal deploy main_modal.py`, résolue au premier job."""
+
+    name = "modal"
+    interruptible = True
+
+    def __init__(self, app_name: str, function_name: str = "run_job"):
+        self.app_name = app_name
+        self.function_name = function_name
+        self.pending = 0
+        self._function = None
+
+    async def run(self, job: str, payload: dict) -> Any:
+        if self._function is None:
+            import modal
+            self._function = modal.Function.from_name(self.app_name, self.function_name)
+        return await self._function.remote.aio(job, payload)
+
+    def close(self):
+        pass
+
+
+class Offloader:
+    """
+    Exécution déportée des traitements lourds : transcription Whisper d'un segment, génération d'un prompt
+    de traduction par lot.
+
+    - l'appelant ne confie un job que si sa propre file atteint `thresholds[job]` (0 = jamais) ;
+      sinon le traitement reste dans le processus de l'API, comme avant
+    - backend local (pool de processus) par défaut ; Modal dès que `remote_depth` jobs attendent déjà en local
+    - audio transmis en PCM 16-bit (buffer NumPy compact) plutôt qu'en tableau float32
+    - Modal limité à `remote_timeout_seconds`, puis repli sur le pool local ; le pool local est limité
+      à `local_timeout_seconds` (le résultat tardif est ignoré, le processus n'est pas interrompu et le job
+      reste compté dans `pending` jusqu'à sa fin)
+    - les traductions partent vers `ollama_host`, une instance Ollama distincte de celle de l'API
+    """
+
+    def __init__(
+            self,
+            local: LocalBackend,
+            remote: Optional[ModalBackend] = None,
+            thresholds: Optional[dict[str, int]] = None,
+            remote_depth: int = 2,
+            remote_timeout_seconds: float = 30.0,
+            local_timeout_seconds: float = 120.0,
+            asr_options: Optional[dict] = None,
+            ollama_host: Optional[str] = None,
+    ):
+        self.local = local
+        self.remote = remote
+        self.thresholds = {job: 0 for job in JOB_NAMES} | (thresholds or {})
+        self.remote_depth = max(0, remote_depth)
+        self.remote_timeout_seconds = remote_timeout_seconds
+        self.local_timeout_seconds = local_timeout_seconds
+        self.asr_options = asr_options or {}
+        self.ollama_host = ollama_host.rstrip("/") if ollama_host else None
+        self.counters = {"jobs": 0, "local": 0, "modal": 0, "fallbacks": 0, "timeouts": 0, "errors": 0,
+                         "audio_bytes": 0}
+
+    @classmethod
+    def from_env(cls) -> "Offloader":
+        remote = None
+        if os.getenv("OFFLOAD_MODAL", "false").casefold() == "true":
+            if importlib.util.find_spec("modal") is None:
+                logger.warning("OFFLOAD_MODAL=true mais le paquet modal n'est pas installé : pool local uniquement")
+            else:
+                remote = ModalBackend(os.getenv("OFFLOAD_MODAL_APP", "myaibackend-offload"))
+        return cls(
+            LocalBackend(int(os.getenv("OFFLOAD_LOCAL_WORKERS", "1"))),
+            remote,
+            thresholds={
+                "transcribe": int(os.getenv("OFFLOAD_ASR_QUEUE_DEPTH", "0")),
+                "translate": int(os.getenv("OFFLOAD_TRANSLATE_QUEUE_DEPTH", "0")),
+            },
+            remote_depth=int(os.getenv("OFFLOAD_REMOTE_DEPTH", "2")),
+            remote_timeout_seconds=float(os.getenv("OFFLOAD_REMOTE_TIMEOUT_SECONDS", "30")),
+            local_timeout_seconds=float(os.getenv("OFFLOAD_LOCAL_TIMEOUT_SECONDS", "120")),
+            asr_options={
+                "model_size": os.getenv("ASR_MODEL_SIZE", "small"),
+                "compute_type": os.getenv("ASR_COMPUTE_TYPE", "int8"),
+                "language": os.getenv("ASR_LANGUAGE", "fr"),
+                "cpu_threads": int(os.getenv("OFFLOAD_ASR_CPU_THREADS", "0")),
+            },
+            ollama_host=os.getenv("OFFLOAD_OLLAMA_HOST"),
+        )
+
+    def accepts(self, job: str, depth: int) -> bool:
+        """Le job doit-il quitter le processus de l'API, vu la profondeur `depth` de la file de l'appelant ?"""
+        threshold = self.thresholds.get(job, 0)
+        if threshold <= 0 or depth < threshold:
+            return False
+        return job != "translate" or self.ollama_host is not None
+
+    def backend_for(self, job: str):
+        if self.remote is not None and self.local.pending >= self.remote_depth:
+            return self.remote
+        return self.local
+
+    def queue_depth(self, backend: str) -> int:
+        if backend == "modal":
+            return self.remote.pending if self.remote is not None else 0
+        return self.local.pending
+
+    async def _call(self, backend, job: str, payload: dict, timeout: float) -> Any:
+        self.counters[backend.name] += 1
+        backend.pending += 1  # compté dès le choix du backend, pour le job suivant
+        started = time.perf_counter()
+        status = "ok"
+        task = asyncio.ensure_future(backend.run(job, payload))
+        try:
+            return await asyncio.wait_for(task if backend.interruptible else asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            status = "timeout"
+            self.counters["timeouts"] += 1
+            raise
+        except Exception:
+            status = "error"
+            self.counters["errors"] += 1
+            raise
+        finally:
+            if task.done():
+                backend.pending -= 1
+            else:
+                # Délai dépassé ou appelant annulé : le processus travaille encore, le job reste compté
+                # dans `pending` (choix du backend, /stats) jusqu'à sa fin réelle
+                task.add_done_callback(lambda finished: self._abandoned(backend, finished))
+            metrics.OFFLOAD_JOBS_TOTAL.inc(job=job, backend=backend.name, status=status)
+            metrics.OFFLOAD_SECONDS.observe(time.perf_counter() - started, job=job, backend=backend.name)
+
+    @staticmethod
+    def _abandoned(backend, task: asyncio.Future):
+        backend.pending -= 1
+        if not task.cancelled():
+            task.exception()  # résultat ignoré ; évite l'avertissement « exception never retrieved »
+
+    async def run(self, job: str, payload: dict) -> Any:
+        self.counters["jobs"] += 1
+        backend = self.backend_for(job)
+        if backend is self.remote:
+            try:
+                return await self._call(backend, job, payload, self.remote_timeout_seconds)
+            except Exception as e:  # délai dépassé, app non déployée, conteneur en échec
+                self.counters["fallbacks"] += 1
+                metrics.OFFLOAD_FALLBACKS_TOTAL.inc(job=job)
+                logger.warning("Job Modal en échec, repli sur le pool local",
+                               extra={"job": job, "error": f"{type(e).__name__}: {e}"})
+        return await self._call(self.local, job, payload, self.local_timeout_seconds)
+
+    async def transcribe(self, audio: np.ndarray, beam_size: int = 1) -> str:
+        data = encode_audio(audio)
+        self.counters["audio_bytes"] += len(data)
+        with metrics.stage("offload.transcribe", audio_seconds=round(audio.size / SAMPLE_RATE, 2)):
+            return await self.run("transcribe", {**self.asr_options, "audio": data, "beam_size": beam_size})
+
+    async def complete(self, prompt: str, model: str, keep_alive: Optional[str] = None) -> str:
+        return await self.run("translate", {"host": self.ollama_host, "model": model, "prompt": prompt,
+                                            "keep_alive": keep_alive, "timeout": self.local_timeout_seconds})
+
+    def close(self):
+        self.local.close()
+        if self.remote is not None:
+            self.remote.close()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "local_workers": self.local.workers,
+            "local_pending": self.local.pending,
+            "modal_enabled": self.remote is not None,
+            "modal_pending": self.remote.pending if self.remote is not None else 0,
+            "thresholds": self.thresholds,
+            "remote_depth": self.remote_depth,
+            "translate_host": self.ollama_host,
+        }
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Subsystem:
+    name: str
+    init: Callable[[], Awaitable]
+    depends: tuple = ()
+    # Vérification à chaque appel de /readyz une fois initialisé (ex: au moins une instance Ollama saine)
+    probe: Optional[Callable[[], bool]] = None
+    state: str = "pending"  # pending, starting, ready, failed (nouvelle tentative en cours)
+    attempts: int = 0
+    error: Optional[str] = None
+    ready_after_seconds: Optional[float] = None
+    ready_event: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class Readiness:
+    """
+    Initialisation des sous-systèmes en tâche de fond, en parallèle, chacun dès que ses dépendances
+    sont prêtes. Une initialisation qui échoue est retentée avec un backoff exponentiel.
+    Une capacité (traduction, agent, ASR, uploads) est disponible dès que ses sous-systèmes le sont.
+    """
+
+    def __init__(self, capabilities: dict[str, tuple], retry_seconds: float = 1.0, max_retry_seconds: float = 30.0):
+        self.capabilities = capabilities
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.started_at = time.monotonic()
+        self._subsystems: dict[str, Subsystem] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    def add(self, name: str, init: Callable[[], Awaitable], depends: tuple = (),
+            probe: Optional[Callable[[], bool]] = None):
+        self._subsystems[name] = Subsystem(name, init, tuple(depends), probe)
+
+    def start(self, started_at: Optional[float] = None):
+        """`started_at` (time.monotonic) : référence des durées, par défaut l'appel à start()."""
+        self.started_at = started_at if started_at is not None else time.monotonic()
+        for subsystem in self._subsystems.values():
+            self._tasks.append(asyncio.create_task(self._run(subsystem)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _run(self, subsystem: Subsystem):
+        for name in subsystem.depends:
+            await self._subsystems[name].ready_event.wait()
+        delay = self.retry_seconds
+        while True:
+            subsystem.state = "starting"
+            subsystem.attempts += 1
+            try:
+                await subsystem.init()
+            except Exception as e:
+                subsystem.state = "failed"
+                subsystem.error = f"{type(e).__name__}: {e}"
+                logger.warning("Initialisation en échec, nouvel essai", extra={
+                    "subsystem": subsystem.name, "attempt": subsystem.attempts, "error": subsystem.error,
+                    "retry_in_seconds": delay})
+                await asyncio.sleep(delay)
+                delay = min(self.max_retry_seconds, delay * 2)
+                continue
+            subsystem.state = "ready"
+            subsystem.error = None
+            subsystem.ready_after_seconds = round(time.monotonic() - self.started_at, 3)
+            subsystem.ready_event.set()
+            logger.info("Sous-système prêt", extra={"subsystem": subsystem.name,
+                                                    "ready_after_seconds": subsystem.ready_after_seconds})
+            return
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._subsystems)
+
+    async def wait(self, name: str):
+        await self._subsystems[name].ready_event.wait()
+
+    def ready_after(self, name: str) -> Optional[float]:
+        return self._subsystems[name].ready_after_seconds
+
+    def is_ready(self, name: str) -> bool:
+        subsystem = self._subsystems[name]
+        if subsystem.state != "ready":
+            return False
+        if subsystem.probe is None:
+            return True
+        try:
+            return bool(subsystem.probe())
+        except Exception:
+            return False
+
+    def capability_ready(self, capability: str) -> bool:
+        return all(self.is_ready(name) for name in self.capabilities[capability])
+
+    def missing(self, capability: str) -> list[str]:
+        return [name for name in self.capabilities[capability] if not self.is_ready(name)]
+
+    def report(self) -> dict:
+        subsystems = {
+            name: {
+                "ready": self.is_ready(name),
+                "state": s.state,
+                "attempts": s.attempts,
+                "error": s.error,
+                "ready_after_seconds": s.ready_after_seconds,
+            }
+            for name, s in self._subsystems.items()
+        }
+        capabilities = {name: self.capability_ready(name) for name in self.capabilities}
+        return {
+            "ready": all(capabilities.values()),
+            "uptime_seconds": round(time.monotonic() - self.started_at, 3),
+            "capabilities": capabilities,
+            "subsystems": subsystems,
+        }
@@ -0,0 +1,328 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional
+
+from api.services import metrics
+from api.services.config import parse_seconds
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRIORITIES = ("voice", "ask", "discuss", "translate", "batch")
+
+
+class Rejected(Exception):
+    """Requête refusée ou abandonnée par l'ordonnanceur (429 : limite du client, 503 : surcharge)."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int = 1):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """Slot accordé sur une ressource (llm, asr), à rendre avec Scheduler.release."""
+
+    def __init__(self, resource: str, priority_class: str):
+        self.resource = resource
+        self.priority_class = priority_class
+        self.granted_at = time.monotonic()
+        self.released = False
+
+
+class _Waiter:
+    __slots__ = ("rank", "seq", "priority_class", "deadline", "enqueued_at", "future", "gone")
+
+    def __init__(self, rank: int, seq: int, priority_class: str, deadline: float):
+        self.rank = rank
+        self.seq = seq
+        self.priority_class = priority_class
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.gone = False  # abandonnée (annulée, délai dépassé) : ignorée quand elle sort du tas
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.rank, self.seq) < (other.rank, other.seq)
+
+
+class _Resource:
+    def __init__(self, name: str, slots: int):
+        self.name = name
+        self.slots = slots
+        self.active = 0
+        self.heap: list[_Waiter] = []
+        self.queued: dict[str, int] = {}  # attentes vivantes par classe
+        self.hold_seconds = 1.0  # durée moyenne (EWMA) d'occupation d'un slot, pour Retry-After
+
+    @property
+    def waiting(self) -> int:
+        return sum(self.queued.values())
+
+
+class Lease:
+    """Admission d'une requête : entrée du client et, si demandé, slot sur une ressource. release() idempotent."""
+
+    def __init__(self, scheduler: "Scheduler", client: Optional[str], ticket: Optional[Ticket]):
+        self.scheduler = scheduler
+        self.client = client
+        self.ticket = ticket
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        if self.ticket is not None:
+            self.scheduler.release(self.ticket)
+        self.scheduler.leave(self.client)
+
+
+class Scheduler:
+    """
+    Admission et ordonnancement du travail LLM et ASR.
+
+    - chaque ressource a un nombre de slots ; au-delà, les requêtes attendent dans une file bornée servie
+      par classe de priorité (voice > ask > discuss > translate > batch), puis par ordre d'arrivée
+    - file pleine : une attente de classe moins prioritaire est évincée au profit de la nouvelle, sinon
+      la nouvelle est refusée (503 + Retry-After estimé d'après la durée moyenne d'occupation)
+    - une requête qui attend au-delà de son délai (temps maximal de la classe ou X-Request-Timeout du
+      client) est abandonnée sans avoir occupé de slot : le client a déjà abandonné de son côté
+    - par client : requêtes simultanées et débit (seau à jetons) limités, 429 + Retry-After au-delà
+    """
+
+    def __init__(
+            self,
+            slots: dict[str, int],
+            priorities: tuple = DEFAULT_PRIORITIES,
+            max_queue: int = 64,
+            max_wait: Optional[dict[str, float]] = None,
+            client_concurrency: int = 8,
+            client_rate: float = 5.0,
+            client_burst: float = 20.0,
+            poll_seconds: float = 0.5,
+    ):
+        self.priorities = tuple(priorities)
+        self.max_queue = max_queue
+        self.max_wait = max_wait or {}
+        self.client_concurrency = client_concurrency
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.poll_seconds = poll_seconds
+        self._resources = {name: _Resource(name, count) for name, count in slots.items()}
+        self._seq = itertools.count()
+        self._clients: dict[str, int] = {}  # requêtes en cours par client
+        self._buckets: dict[str, tuple[float, float]] = {}  # client -> (jetons, dernière mise à jour)
+        self.counters = {"admitted": 0, "queued": 0, "evicted": 0, "expired": 0, "rejected": 0, "limited": 0}
+
+    @classmethod
+    def from_env(cls) -> "Scheduler":
+        priorities = tuple(p.strip() for p in os.getenv("SCHED_PRIORITIES", ",".join(DEFAULT_PRIORITIES)).split(",")
+                           if p.strip())
+        return cls(
+            slots={"llm": int(os.getenv("SCHED_LLM_SLOTS", "4")), "asr": int(os.getenv("SCHED_ASR_SLOTS", "8"))},
+            priorities=priorities,
+            max_queue=int(os.getenv("SCHED_MAX_QUEUE", "64")),
+            max_wait=parse_seconds(os.getenv("SCHED_MAX_WAIT", "voice=10,ask=60,discuss=60,translate=120,batch=600")),
+            client_concurrency=int(os.getenv("SCHED_CLIENT_CONCURRENCY", "8")),
+            client_rate=float(os.getenv("SCHED_CLIENT_RATE", "5")),
+            client_burst=float(os.getenv("SCHED_CLIENT_BURST", "20")),
+        )
+
+    def _rank(self, priority_class: str) -> int:
+        try:
+            return self.priorities.index(priority_class)
+        except ValueError:
+            raise ValueError(f"Classe de priorité inconnue: {priority_class}") from None
+
+    def retry_after(self, resource: str) -> int:
+        res = self._resources[resource]
+        return max(1, math.ceil((res.waiting + 1) * res.hold_seconds / max(res.slots, 1)))
+
+    def _reject(self, status_code: int, reason: str, resource: str, priority_class: str, retry_after: int) -> Rejected:
+        metrics.SCHED_REJECTIONS_TOTAL.inc(resource=resource, priority_class=priority_class, reason=reason)
+        return Rejected(status_code, reason, retry_after)
+
+    # --- clients ---
+
+    def enter(self, client: Optional[str], priority_class: str):
+        """Compte une requête du client ; 429 si trop de requêtes simultanées ou débit dépassé."""
+        if client is None:
+            return
+        if self._clients.get(client, 0) >= self.client_concurrency:
+            self.counters["limited"] += 1
+            raise self._reject(429, "client_concurrency", "client", priority_class, 1)
+        if self.client_rate > 0:
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(client, (self.client_burst, now))
+            tokens = min(self.client_burst, tokens + (now - updated) * self.client_rate)
+            if tokens < 1:
+                self.counters["limited"] += 1
+                raise self._reject(429, "client_rate", "client", priority_class,
+                                   max(1, math.ceil((1 - tokens) / self.client_rate)))
+            self._buckets[client] = (tokens - 1, now)
+            if len(self._buckets) > 4096:
+                self._prune_buckets(now)
+        self._clients[client] = self._clients.get(client, 0) + 1
+
+    def leave(self, client: Optional[str]):
+        if client is None:
+            return
+        count = self._clients.get(client, 0) - 1
+        if count > 0:
+            self._clients[client] = count
+        else:
+            self._clients.pop(client, None)
+
+    def _prune_buckets(self, now: float):
+        # Seaux pleins de clients inactifs : équivalents à un seau absent
+        for client, (tokens, updated) in list(self._buckets.items()):
+            if client not in self._clients and tokens + (now - updated) * self.client_rate >= self.client_burst:
+                del self._buckets[client]
+
+    # --- slots ---
+
+    def _grant(self, res: _Resource, priority_class: str, waited: float) -> Ticket:
+        res.active += 1
+        self.counters["admitted"] += 1
+        metrics.SCHED_QUEUE_WAIT_SECONDS.observe(waited, resource=res.name, priority_class=priority_class)
+        return Ticket(res.name, priority_class)
+
+    def _forget(self, res: _Resource, waiter: _Waiter):
+        if not waiter.gone:
+            waiter.gone = True
+            res.queued[waiter.priority_class] -= 1
+
+    def _dispatch(self, res: _Resource):
+        now = time.monotonic()
+        while res.heap and res.active < res.slots:
+            waiter = heapq.heappop(res.heap)
+            if waiter.gone:
+                continue
+            self._forget(res, waiter)
+            if now >= waiter.deadline:
+                # Le client a déjà abandonné : inutile de lui donner un slot
+                self.counters["expired"] += 1
+                waiter.future.set_exception(self._reject(503, "deadline", res.name, waiter.priority_class,
+                                                         self.retry_after(res.name)))
+                continue
+            waiter.future.set_result(self._grant(res, waiter.priority_class, now - waiter.enqueued_at))
+
+    def try_acquire(self, resource: str, priority_class: str) -> Optional[Ticket]:
+        """Slot immédiat ou rien (travail facultatif, ex : transcription partielle)."""
+        self._rank(priority_class)
+        res = self._resources[resource]
+        if res.active < res.slots and not res.waiting:
+            return self._grant(res, priority_class, 0.0)
+        return None
+
+    async def acquire(
+            self,
+            resource: str,
+            priority_class: str,
+            timeout: Optional[float] = None,
+            is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    ) -> Ticket:
+        rank = self._rank(priority_class)
+        res = self._resources[resource]
+        if res.active < res.slots and not res.waiting:
+            return self._grant(res, priority_class, 0.0)
+
+        limits = [t for t in (timeout, self.max_wait.get(priority_class)) if t is not None]
+        deadline = time.monotonic() + min(limits) if limits else math.inf
+
+        if res.waiting >= self.max_queue:
+            worst = max((w for w in res.heap if not w.gone), default=None, key=lambda w: (w.rank, w.seq))
+            if worst is None or worst.rank <= rank:
+                self.counters["rejected"] += 1
+                raise self._reject(503, "queue_full", resource, priority_class, self.retry_after(resource))
+            # File pleine : la requête la moins prioritaire (la plus récente) cède sa place
+            self._forget(res, worst)
+            self.counters["evicted"] += 1
+            worst.future.set_exception(self._reject(503, "evicted", resource, worst.priority_class,
+                                                    self.retry_after(resource)))
+
+        waiter = _Waiter(rank, next(self._seq), priority_class, deadline)
+        heapq.heappush(res.heap, waiter)
+        res.queued[priority_class] = res.queued.get(priority_class, 0) + 1
+        self.counters["queued"] += 1
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters["expired"] += 1
+                    raise self._reject(503, "deadline", resource, priority_class, self.retry_after(resource))
+                wait = min(remaining, self.poll_seconds) if is_disconnected is not None else remaining
+                done, _ = await asyncio.wait({waiter.future}, timeout=None if math.isinf(wait) else wait)
+                if done:
+                    return waiter.future.result()
+                if is_disconnected is not None and await is_disconnected():
+                    raise self._reject(499, "client_gone", resource, priority_class, 0)
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                self.release(waiter.future.result())  # slot accordé pendant l'annulation
+            else:
+                self._forget(res, waiter)
+                if not waiter.future.done():
+                    waiter.future.cancel()
+            raise
+
+    def release(self, ticket: Ticket):
+        if ticket.released:
+            return
+        ticket.released = True
+        res = self._resources[ticket.resource]
+        res.active -= 1
+        res.hold_seconds = 0.8 * res.hold_seconds + 0.2 * (time.monotonic() - ticket.granted_at)
+        self._dispatch(res)
+
+    @asynccontextmanager
+    async def slot(self, resource: str, priority_class: str, timeout: Optional[float] = None):
+        ticket = await self.acquire(resource, priority_class, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    async def admit(
+            self,
+            client: Optional[str],
+            priority_class: str,
+            resource: Optional[str] = None,
+            timeout: Optional[float] = None,
+            is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    ) -> Lease:
+        """Entrée du client puis, si `resource`, attente d'un slot ; Lease.release() rend les deux."""
+        self.enter(client, priority_class)
+        try:
+            ticket = await self.acquire(resource, priority_class, timeout, is_disconnected) if resource else None
+        except BaseException:
+            self.leave(client)
+            raise
+        return Lease(self, client, ticket)
+
+    # --- état ---
+
+    def queue_depth(self, resource: str, priority_class: Optional[str] = None) -> int:
+        queued = self._resources[resource].queued
+        return sum(queued.values()) if priority_class is None else queued.get(priority_class, 0)
+
+    def active(self, resource: str) -> int:
+        return self._resources[resource].active
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "clients": len(self._clients),
+            "resources": {
+                name: {"slots": res.slots, "active": res.active, "queued": dict(res.queued),
+                       "hold_seconds": round(res.hold_seconds, 3), "retry_after": self.retry_after(name)}
+                for name, res in self._resources.items()
+            },
+        }
@@ -0,0 +1,116 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+def estimate_tokens(text: str) -> int:
+    # Approximation suffisante pour borner l'historique (~4 caractères par token)
+    return len(text) // 4 + 1
+
+
+@dataclass
+class Session:
+    session_id: str
+    history: list[dict] = field(default_factory=list)  # [{"role": "user"|"assistant", "content": ...}]
+    ollama_context: Optional[list[int]] = None  # `context` renvoyé par /api/generate au tour précédent
+    last_used: float = field(default_factory=time.monotonic)
+    turns: int = 0
+    prompt_evals: list[dict] = field(default_factory=list)  # mesures Ollama des derniers tours
+
+    def add_turn(self, user_text: str, assistant_text: str, ollama_context: Optional[list[int]] = None):
+        """
+        `ollama_context` : contexte /api/generate couvrant ce tour (/discuss). Un tour ajouté sans contexte
+        (/ask, agent) l'invalide : le tour /discuss suivant repart de l'historique complet.
+        """
+        self.history.append({"role": "user", "content": user_text})
+        self.history.append({"role": "assistant", "content": assistant_text})
+        self.ollama_context = ollama_context
+        self.turns += 1
+
+    def record_prompt_eval(self, data: dict) -> Optional[dict]:
+        """Conserve prompt_eval_count / prompt_eval_duration du dernier chunk Ollama (done=True)."""
+        if "prompt_eval_duration" not in data and "prompt_eval_count" not in data:
+            return None
+        measure = {
+            "turn": self.turns + 1,
+            "prompt_eval_count": data.get("prompt_eval_count"),
+            "prompt_eval_ms": round(data.get("prompt_eval_duration", 0) / 1e6, 1),
+        }
+        self.prompt_evals = (self.prompt_evals + [measure])[-20:]
+        return measure
+
+
+class SessionStore:
+    """
+    Sessions de conversation côté serveur, indexées par session_id.
+
+    - éviction LRU au-delà de `max_sessions`, expiration après `idle_ttl_seconds` d'inactivité
+    - historique tronqué (messages les plus anciens d'abord) à `history_token_budget` tokens estimés
+    - le `context` Ollama est réutilisé tant qu'il tient dans `context_token_budget`, ce qui évite
+      de réévaluer le préfixe commun (prompt système + historique) à chaque tour
+    """
+
+    def __init__(self, max_sessions: int = 500, idle_ttl_seconds: float = 1800.0, history_token_budget: int = 2048,
+                 context_token_budget: int = 4096):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.history_token_budget = history_token_budget
+        self.context_token_budget = context_token_budget
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.counters = {"created": 0, "evicted": 0, "expired": 0}
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        return cls(
+            max_sessions=int(os.getenv("SESSION_MAX", "500")),
+            idle_ttl_seconds=float(os.getenv("SESSION_IDLE_TTL_SECONDS", "1800")),
+            history_token_budget=int(os.getenv("SESSION_HISTORY_TOKENS", "2048")),
+            context_token_budget=int(os.getenv("SESSION_CONTEXT_TOKENS", "4096")),
+        )
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used <= self.idle_ttl_seconds:
+                break
+            del self._sessions[session_id]
+            self.counters["expired"] += 1
+
+    def get(self, session_id: str) -> Session:
+        """Retourne la session (créée si besoin) et la marque comme la plus récemment utilisée."""
+        self._expire()
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = Session(session_id)
+            self._sessions[session_id] = session
+            self.counters["created"] += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.counters["evicted"] += 1
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def trim(self, session: Session):
+        total = sum(estimate_tokens(message["content"]) for message in session.history)
+        while session.history and total > self.history_token_budget:
+            total -= estimate_tokens(session.history.pop(0)["content"])
+        # L'historique commence toujours par un message utilisateur
+        while session.history and session.history[0]["role"] != "user":
+            session.history.pop(0)
+
+    def usable_context(self, session: Session) -> Optional[list[int]]:
+        context = session.ollama_context
+        if context and len(context) <= self.context_token_budget:
+            return context
+        session.ollama_context = None
+        return None
+
+    def stats(self) -> dict:
+        return {**self.counters, "active": len(self._sessions)}
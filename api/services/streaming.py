@@ -0,0 +1,200 @@
+import asyncio
+import json
+import logging
+import os
+from typing import AsyncIterator, Callable, Optional
+
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+from api.services import metrics
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
+# Champ texte à concaténer si l'événement est un delta fusionnable, sinon None
+DeltaField = Callable[[dict], Optional[str]]
+
+_END = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def no_delta(event: dict) -> Optional[str]:
+    return None
+
+
+def error_event(error: BaseException) -> dict:
+    return {"type": "error", "content": str(error) or type(error).__name__}
+
+
+def encode(event: dict, fmt: str) -> bytes:
+    data = json.dumps(event, ensure_ascii=False, separators=(",", ":"))
+    if fmt == "ndjson":
+        return f"{data}\n".encode()
+    return f"data: {data}\n\n".encode()
+
+
+class EventStreamResponse(StreamingResponse):
+    """
+    Réponse streamée qui surveille elle-même la déconnexion du client, quelle que soit la version ASGI
+    du serveur : le stream est annulé dès la déconnexion, ce qui ferme le générateur d'événements et
+    donc la requête Ollama en cours (plus aucun token généré pour un client parti).
+    """
+
+    def __init__(self, *args, endpoint: str = "", on_close: Optional[Callable[[], None]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.endpoint = endpoint
+        self.on_close = on_close  # appelé à la fin du stream, même interrompu (ex : rendre un slot)
+
+    async def __call__(self, scope, receive, send):
+        stream = asyncio.create_task(self.stream_response(send))
+        disconnect = asyncio.create_task(self.listen_for_disconnect(receive))
+        try:
+            await asyncio.wait({stream, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (stream, disconnect):
+                task.cancel()
+            await asyncio.gather(stream, disconnect, return_exceptions=True)
+            if self.on_close is not None:
+                self.on_close()
+
+        if not stream.cancelled() and stream.exception() is not None:
+            raise stream.exception()
+        if stream.cancelled():
+            metrics.STREAM_DISCONNECTS_TOTAL.inc(endpoint=self.endpoint)
+            logger.info("Client déconnecté, stream annulé", extra={"endpoint": self.endpoint})
+            return
+        if self.background is not None:
+            await self.background()
+
+
+class EventStreamer:
+    """
+    Couche commune des réponses streamées (/translate, /discuss, /ask) :
+
+    - format `sse` (`data: {...}\\n\\n`) ou `ndjson` (`{...}\\n`), choisi par `?format=` ou l'en-tête
+      Accept (`application/x-ndjson`), sinon `default_format`
+    - les deltas consécutifs (tokens) sont fusionnés en un seul événement, envoyé au plus tard
+      `flush_interval_seconds` après le premier token en attente ou dès `flush_bytes` octets
+    - les autres événements sont envoyés immédiatement, dans l'ordre
+    - une erreur après l'envoi des en-têtes termine le stream par un événement {"type": "error", "content"}
+      dans le format négocié : le client distingue un échec d'une fin normale
+    """
+
+    def __init__(self, default_format: str = "sse", flush_interval_seconds: float = 0.05, flush_bytes: int = 256,
+                 queue_size: int = 64):
+        if default_format not in FORMATS:
+            raise ValueError(f"Format de stream inconnu: {default_format}")
+        self.default_format = default_format
+        self.flush_interval_seconds = flush_interval_seconds
+        self.flush_bytes = flush_bytes
+        self.queue_size = queue_size
+
+    @classmethod
+    def from_env(cls) -> "EventStreamer":
+        return cls(
+            default_format=os.getenv("STREAM_FORMAT", "sse"),
+            flush_interval_seconds=float(os.getenv("STREAM_FLUSH_MS", "50")) / 1000,
+            flush_bytes=int(os.getenv("STREAM_FLUSH_BYTES", "256")),
+        )
+
+    def negotiate(self, request: Request) -> str:
+        fmt = request.query_params.get("format")
+        if fmt in FORMATS:
+            return fmt
+        if "application/x-ndjson" in request.headers.get("accept", ""):
+            return "ndjson"
+        return self.default_format
+
+    def response(self, request: Request, events: AsyncIterator[dict], delta_field: DeltaField = no_delta,
+                 endpoint: str = "", on_close: Optional[Callable[[], None]] = None) -> EventStreamResponse:
+        fmt = self.negotiate(request)
+        headers = {
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Pour nginx reverse proxy
+        }
+        return EventStreamResponse(self.frames(events, fmt, delta_field, endpoint), media_type=FORMATS[fmt],
+                                   headers=headers, endpoint=endpoint, on_close=on_close)
+
+    async def _produce(self, events: AsyncIterator[dict], queue: asyncio.Queue):
+        # Le générateur tourne entièrement dans cette tâche (contextes httpx liés à la tâche)
+        try:
+            async for event in events:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put(_Failure(e))
+        else:
+            await queue.put(_END)
+        finally:
+            aclose = getattr(events, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    async def frames(self, events: AsyncIterator[dict], fmt: str, delta_field: DeltaField = no_delta,
+                     endpoint: str = "") -> AsyncIterator[bytes]:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        producer = asyncio.create_task(self._produce(events, queue))
+        pending: Optional[dict] = None  # delta en cours de fusion
+        pending_field = ""
+        pending_parts: list[str] = []
+        pending_bytes = 0
+        deadline = 0.0
+
+        def flush() -> bytes:
+            nonlocal pending, pending_parts, pending_bytes
+            event = {**pending, pending_field: "".join(pending_parts)}
+            pending, pending_parts, pending_bytes = None, [], 0
+            metrics.STREAM_FRAMES_TOTAL.inc(endpoint=endpoint)
+            return encode(event, fmt)
+
+        try:
+            while True:
+                if pending is None:
+                    item = await queue.get()
+                else:
+                    try:
+                        item = await asyncio.wait_for(queue.get(), max(0.0, deadline - loop.time()))
+                    except asyncio.TimeoutError:
+                        yield flush()
+                        continue
+
+                if item is _END or isinstance(item, _Failure):
+                    if pending is not None:
+                        yield flush()
+                    if isinstance(item, _Failure):
+                        metrics.STREAM_ERRORS_TOTAL.inc(endpoint=endpoint)
+                        error = f"{type(item.error).__name__}: {item.error}"
+                        logger.warning("Stream interrompu par une erreur", exc_info=item.error,
+                                       extra={"endpoint": endpoint, "error": error})
+                        metrics.STREAM_FRAMES_TOTAL.inc(endpoint=endpoint)
+                        yield encode(error_event(item.error), fmt)
+                    return
+
+                field = delta_field(item)
+                if pending is not None and not (
+                        field == pending_field and {k: v for k, v in item.items() if k != field} ==
+                        {k: v for k, v in pending.items() if k != field}):
+                    yield flush()
+
+                if field is None or self.flush_interval_seconds <= 0:
+                    metrics.STREAM_FRAMES_TOTAL.inc(endpoint=endpoint)
+                    yield encode(item, fmt)
+                    continue
+
+                if pending is None:
+                    pending, pending_field = item, field
+                    deadline = loop.time() + self.flush_interval_seconds
+                text = item.get(field) or ""
+                pending_parts.append(text)
+                pending_bytes += len(text.encode())
+                if pending_bytes >= self.flush_bytes:
+                    yield flush()
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Optional
+
+from llama_index.core.tools import AsyncBaseTool, ToolMetadata, ToolOutput
+
+from api.services import metrics
+from api.services.config import parse_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class ToolRunner:
+    """
+    Exécution des outils MCP avec un délai maximal par outil : un appareil Kasa ou un appel
+    OpenWeather bloqué est annulé au bout de son délai et l'agent reçoit une erreur d'outil
+    au lieu d'attendre indéfiniment. Chaque appel est chronométré individuellement.
+    """
+
+    def __init__(self, default_timeout_seconds: float = 20.0, timeouts: Optional[dict[str, float]] = None):
+        self.default_timeout_seconds = default_timeout_seconds
+        self.timeouts = timeouts or {}
+        self.counters = {"calls": 0, "errors": 0, "timed_out": 0}
+
+    @classmethod
+    def from_env(cls) -> "ToolRunner":
+        return cls(
+            default_timeout_seconds=float(os.getenv("TOOL_TIMEOUT_SECONDS", "20")),
+            timeouts=parse_seconds(os.getenv("TOOL_TIMEOUTS", "")),
+        )
+
+    def timeout_for(self, tool_name: str) -> float:
+        return self.timeouts.get(tool_name, self.default_timeout_seconds)
+
+    async def call(self, tool: AsyncBaseTool, kwargs: dict, route: str) -> ToolOutput:
+        name = tool.metadata.get_name()
+        timeout = self.timeout_for(name)
+        started = time.perf_counter()
+        self.counters["calls"] += 1
+        try:
+            output = await asyncio.wait_for(tool.acall(**kwargs), timeout)
+            status = "error" if output.is_error else "ok"
+        except asyncio.TimeoutError as e:
+            status = "timeout"
+            logger.warning("Outil trop lent, appel annulé", extra={"tool": name, "timeout_seconds": timeout,
+                                                                  "route": route})
+            output = ToolOutput(content=f"Tool {name} timed out after {timeout:g} seconds", tool_name=name,
+                                raw_input=kwargs, raw_output=None, is_error=True, exception=e)
+        except Exception as e:
+            status = "error"
+            output = ToolOutput(content=str(e), tool_name=name, raw_input=kwargs, raw_output=str(e),
+                                is_error=True, exception=e)
+        if status == "timeout":
+            self.counters["timed_out"] += 1
+        elif status == "error":
+            self.counters["errors"] += 1
+        metrics.TOOL_CALL_SECONDS.observe(time.perf_counter() - started, tool=name, route=route)
+        metrics.TOOL_CALLS_TOTAL.inc(tool=name, route=route, status=status)
+        return output
+
+    def wrap(self, tools: list, route: str = "agent") -> list:
+        return [TimedTool(tool, self, route) for tool in tools]
+
+    def stats(self) -> dict:
+        return {**self.counters, "default_timeout_seconds": self.default_timeout_seconds, "timeouts": self.timeouts}
+
+
+class TimedTool(AsyncBaseTool):
+    """
+    Outil donné à l'agent : mêmes métadonnées que l'outil MCP, appel via ToolRunner.call.
+    FunctionAgent exécute déjà les appels d'un même tour en parallèle (étape call_tool à plusieurs
+    workers) et publie chaque résultat dès qu'il est prêt ; ce wrapper y ajoute délai et mesure.
+    """
+
+    def __init__(self, tool: AsyncBaseTool, runner: ToolRunner, route: str):
+        self.tool = tool
+        self.runner = runner
+        self.route = route
+
+    @property
+    def metadata(self) -> ToolMetadata:
+        return self.tool.metadata
+
+    def call(self, *args: Any, **kwargs: Any) -> ToolOutput:
+        return self.tool.call(*args, **kwargs)
+
+    async def acall(self, **kwargs: Any) -> ToolOutput:
+        return await self.runner.call(self.tool, kwargs, self.route)
@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Optional
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def cache_key(model: str, source_lang: str, target_lang: str, text: str) -> str:
+    raw = "\x1f".join((model, source_lang.strip().casefold(), target_lang.strip().casefold(), normalize_text(text)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _SqliteStore:
+    """Stockage local optionnel : le cache survit aux redémarrages. Appelé via asyncio.to_thread."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str, ttl_seconds: float) -> Optional[tuple[dict, float]]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM translations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[1] > ttl_seconds:
+                self._conn.execute("DELETE FROM translations WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: dict, created: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO translations (key, value, created) VALUES (?, ?, ?)",
+                (key, json.dumps(value), created),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _Flight:
+    """Génération en cours partagée : chaque abonné rejoue les événements déjà produits puis suit la suite."""
+
+    def __init__(self):
+        self.events: list[dict] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, event: Optional[dict] = None, done: bool = False, error: Optional[BaseException] = None):
+        async with self._changed:
+            if event is not None:
+                self.events.append(event)
+            if done:
+                self.done = True
+                self.error = error
+            self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[dict]:
+        position = 0
+        while True:
+            async with self._changed:
+                while position >= len(self.events) and not self.done:
+                    await self._changed.wait()
+                batch = self.events[position:]
+                position = len(self.events)
+                finished, error = self.done, self.error
+            for event in batch:
+                yield event
+            if finished:
+                if error is not None:
+                    raise error
+                return
+
+
+class TranslationCache:
+    """
+    Cache des résultats de /translate, clé = (modèle, langue source, langue cible, texte normalisé).
+
+    - LRU en mémoire bornée en taille, avec TTL
+    - stockage SQLite optionnel (db_path) pour survivre aux redémarrages
+    - single-flight : des requêtes identiques simultanées partagent une seule génération upstream
+    - un hit est rejoué sous forme des mêmes deltas {"field", "delta"} qu'une génération live
+    - seule une génération terminée normalement (le générateur lève une exception sur un statut d'erreur,
+      une ligne {"error"} ou un stream coupé avant le chunk final) et avec une traduction non vide est
+      mise en cache ; sinon les abonnés reçoivent l'erreur et rien n'est stocké
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 86400.0, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[dict, float]]" = OrderedDict()
+        self._flights: dict[str, _Flight] = {}
+        self._store = _SqliteStore(db_path) if db_path else None
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "stores": 0, "rejected": 0}
+
+    @classmethod
+    def from_env(cls) -> "TranslationCache":
+        return cls(
+            max_entries=int(os.getenv("TRANSLATION_CACHE_SIZE", "1024")),
+            ttl_seconds=float(os.getenv("TRANSLATION_CACHE_TTL_SECONDS", "86400")),
+            db_path=os.getenv("TRANSLATION_CACHE_DB") or None,
+        )
+
+    def _remember(self, key: str, value: dict, created: float):
+        self._entries[key] = (value, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if time.time() - entry[1] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[0]
+            del self._entries[key]
+
+        if self._store is not None:
+            stored = await asyncio.to_thread(self._store.get, key, self.ttl_seconds)
+            if stored is not None:
+                self._remember(key, *stored)
+                self.counters["disk_hits"] += 1
+                return stored[0]
+        return None
+
+    def peek(self, key: str) -> bool:
+        """Résultat disponible sans nouvelle génération : entrée valide en mémoire ou génération déjà en cours."""
+        if key in self._flights:
+            return True
+        entry = self._entries.get(key)
+        return entry is not None and time.time() - entry[1] <= self.ttl_seconds
+
+    async def set(self, key: str, value: dict):
+        created = time.time()
+        self._remember(key, value, created)
+        self.counters["stores"] += 1
+        if self._store is not None:
+            await asyncio.to_thread(self._store.set, key, value, created)
+
+    @staticmethod
+    def replay(value: dict) -> list[dict]:
+        return [{"field": field, "delta": delta} for field, delta in value.items() if delta]
+
+    async def _produce(self, key: str, flight: _Flight, generate: Callable[[], AsyncIterator[dict]]):
+        values: dict[str, str] = {}
+        try:
+            async for event in generate():
+                values[event["field"]] = values.get(event["field"], "") + event["delta"]
+                await flight.publish(event)
+        except asyncio.CancelledError:
+            await flight.publish(done=True, error=ConnectionAbortedError("Génération annulée"))
+            raise
+        except Exception as e:
+            await flight.publish(done=True, error=e)
+        else:
+            if values.get("translation", "").strip():
+                await self.set(key, values)
+                await flight.publish(done=True)
+            else:
+                self.counters["rejected"] += 1
+                await flight.publish(done=True, error=ValueError("Traduction vide : résultat non mis en cache"))
+        finally:
+            self._flights.pop(key, None)
+
+    async def stream(self, key: str, generate: Callable[[], AsyncIterator[dict]]) -> AsyncIterator[dict]:
+        cached = await self.get(key)
+        if cached is not None:
+            for event in self.replay(cached):
+                yield event
+            return
+
+        flight = self._flights.get(key)
+        if flight is None:
+            self.counters["misses"] += 1
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._produce(key, flight, generate))
+        else:
+            self.counters["coalesced"] += 1
+
+        flight.subscribers += 1
+        try:
+            async for event in flight.subscribe():
+                yield event
+        finally:
+            flight.subscribers -= 1
+            # Plus personne n'écoute : inutile de continuer à générer
+            if flight.subscribers == 0 and flight.task and not flight.task.done():
+                flight.task.cancel()
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["disk_hits"] + self.counters["misses"] + self.counters["coalesced"]
+        return {
+            **self.counters,
+            "entries": len(self._entries),
+            "in_flight": len(self._flights),
+            "hit_ratio": round((self.counters["hits"] + self.counters["disk_hits"]) / lookups, 3) if lookups else None,
+            "persistent": self._store is not None,
+        }
@@ -0,0 +1,87 @@
+from typing import Optional
+
+SEPARATOR = "|||"
+FIELDS = ("translation", "language", "explanation", "correction")
+
+
+class TranslationStreamParser:
+    """
+    Tokenizer incrémental du protocole de /translate : quatre champs séparés par "|||"
+    (traduction, langue, explication, correction).
+
+    `feed()` reçoit les morceaux de texte tels qu'Ollama les stream et retourne des deltas
+    compacts {"field": ..., "delta": ...}. Un séparateur peut être coupé entre deux morceaux
+    ("|" puis "||") : les "|" en fin de morceau sont retenus jusqu'à savoir s'ils forment un
+    séparateur. Les espaces et retours à la ligne autour des séparateurs sont supprimés.
+    """
+
+    def __init__(self, fields: tuple = FIELDS, separator: str = SEPARATOR):
+        self.fields = fields
+        self.separator = separator
+        self.index = 0
+        self.values = {name: "" for name in fields}  # valeurs complètes reconstituées
+        self._held = ""  # préfixe potentiel d'un séparateur, en attente du morceau suivant
+        self._trailing_ws = ""  # espaces retenus : supprimés s'ils précèdent un séparateur
+        self._at_field_start = True
+
+    @property
+    def field(self) -> Optional[str]:
+        return self.fields[self.index]
+
+    def _held_suffix_length(self, text: str) -> int:
+        for size in range(min(len(self.separator) - 1, len(text)), 0, -1):
+            if self.separator.startswith(text[-size:]):
+                return size
+        return 0
+
+    def _push(self, delta: str, events: list):
+        self.values[self.field] += delta
+        if events and events[-1]["field"] == self.field:
+            events[-1]["delta"] += delta
+        else:
+            events.append({"field": self.field, "delta": delta})
+
+    def _append(self, text: str, events: list):
+        if self._at_field_start:
+            text = text.lstrip()
+        if not text:
+            return
+        self._at_field_start = False
+        body = text.rstrip()
+        if body:
+            self._push(self._trailing_ws + body, events)
+            self._trailing_ws = text[len(body):]
+        else:
+            self._trailing_ws += text
+
+    def _next_field(self):
+        # Au-delà du dernier champ, les séparateurs superflus sont ignorés
+        if self.index < len(self.fields) - 1:
+            self.index += 1
+            self._at_field_start = True
+        self._trailing_ws = ""
+
+    def feed(self, chunk: str) -> list[dict]:
+        events: list[dict] = []
+        parts = (self._held + chunk).split(self.separator)
+        self._held = ""
+        for part in parts[:-1]:
+            self._append(part, events)
+            self._next_field()
+
+        last = parts[-1]
+        held = self._held_suffix_length(last)
+        if held:
+            self._held = last[-held:]
+            last = last[:-held]
+        self._append(last, events)
+        return events
+
+    def finish(self) -> list[dict]:
+        """Fin du flux : les "|" retenus n'étaient pas un séparateur, on les rend au champ courant."""
+        events: list[dict] = []
+        if self._held:
+            self._append(self._held, events)
+            self._held = ""
+        self._trailing_ws = ""
+        return events
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import time
+from typing import AsyncGenerator, Awaitable, Callable, Optional
+
+import numpy as np
+
+from api.services import metrics
+from api.services.asr import OverlapJoiner, StreamingSegmenter
+
+logger = logging.getLogger(__name__)
+
+Transcribe = Callable[[np.ndarray, bool], Awaitable[str]]
+RunAgent = Callable[[str], AsyncGenerator[dict, None]]
+Send = Callable[[dict], Awaitable[None]]
+
+
+class VoiceSession:
+    """
+    Session vocale /ws/speak en pipeline : réception -> ASR -> agent -> envoi, chaque étape dans sa
+    propre tâche et reliée à la suivante par une file bornée. Le découpage et la transcription de
+    l'énoncé suivant avancent pendant que l'agent répond au précédent. Un énoncé long découpé en segments
+    ("cut") n'est transmis à l'agent qu'une fois, en entier, à la fin de parole.
+
+    Barge-in : un début de parole pendant une réponse annule la réponse en cours (flux LLM et appels
+    d'outils en attente) ; les événements déjà en file pour cette réponse ne sont pas envoyés.
+    """
+
+    # Sessions ouvertes, pour les jauges de profondeur des files (agrégées sur /metrics)
+    active: set["VoiceSession"] = set()
+    counters = {"sessions": 0, "utterances": 0, "barge_ins": 0, "dropped_partials": 0}
+
+    def __init__(
+            self,
+            segmenter: StreamingSegmenter,
+            transcribe: Transcribe,
+            run_agent: RunAgent,
+            send: Send,
+            queue_size: int = 4,
+            send_queue_size: int = 64,
+            placeholder: Optional[dict] = None,
+            session_id: str = "",
+    ):
+        self.segmenter = segmenter
+        self.transcribe = transcribe
+        self.run_agent = run_agent
+        self.send = send
+        # Événement d'attente envoyé avant la réponse : pas compté comme première réponse
+        self.placeholder = placeholder
+        self.session_id = session_id
+
+        # Files bornées entre les étapes : (kind, audio, fin de parole) / (texte, fin de parole) / (run, événement)
+        self.asr_queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.agent_queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.send_queue: asyncio.Queue = asyncio.Queue(send_queue_size)
+
+        self.overlap = OverlapJoiner()  # recouvrement retiré seulement après un segment découpé de force
+        self.cut_texts: list[str] = []  # segments découpés de l'énoncé en cours, envoyés à l'agent avec le final
+        self._run_id = 0
+        self._agent_run: Optional[asyncio.Task] = None
+        self._interrupted: set[int] = set()  # réponses annulées : leurs événements en file sont ignorés
+        self._tasks: list[asyncio.Task] = []
+
+    # --- cycle de vie ---
+
+    def start(self):
+        self._tasks = [
+            asyncio.create_task(self._asr_stage()),
+            asyncio.create_task(self._agent_stage()),
+            asyncio.create_task(self._send_stage()),
+        ]
+        VoiceSession.active.add(self)
+        VoiceSession.counters["sessions"] += 1
+
+    async def close(self):
+        VoiceSession.active.discard(self)
+        tasks = [t for t in (*self._tasks, self._agent_run) if t and not t.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def wait_closed(self):
+        """Termine quand une étape s'arrête (ex : envoi impossible, client parti)."""
+        await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+
+    # --- étape réception ---
+
+    async def feed(self, chunk: bytes):
+        """Découpage VAD du chunk reçu ; attend seulement si la file ASR est pleine d'énoncés finaux."""
+        for kind, audio in self.segmenter.feed(chunk):
+            if kind == "start":
+                self.barge_in()
+            elif kind == "partial":
+                # Hypothèses partielles facultatives : abandonnées si l'ASR a déjà du retard
+                if self.asr_queue.full():
+                    VoiceSession.counters["dropped_partials"] += 1
+                else:
+                    self.asr_queue.put_nowait((kind, audio, None))
+            else:
+                await self.asr_queue.put((kind, audio, time.perf_counter()))
+
+    def barge_in(self):
+        if self._agent_run is None or self._agent_run.done():
+            return
+        self._interrupted.add(self._run_id)
+        self._agent_run.cancel()
+        VoiceSession.counters["barge_ins"] += 1
+        metrics.VOICE_BARGE_INS_TOTAL.inc()
+        logger.info("Réponse interrompue par l'utilisateur", extra={"session_id": self.session_id})
+
+    # --- étape ASR ---
+
+    async def _asr_stage(self):
+        while True:
+            kind, audio, ended_at = await self.asr_queue.get()
+            try:
+                if kind == "partial":
+                    await self._partial(audio)
+                else:
+                    await self._final(kind, audio, ended_at)
+            except Exception as e:
+                logger.exception("Transcription échouée", extra={"session_id": self.session_id, "error": str(e)})
+
+    async def _partial(self, audio: np.ndarray):
+        if not self.asr_queue.empty():
+            return  # dépassée par un segment plus récent
+        text = await self.transcribe(audio, False)
+        if text:
+            await self._send({"type": "partial_transcription", "content": text})
+
+    async def _final(self, kind: str, audio: np.ndarray, ended_at: float):
+        text = self.overlap.join(kind, await self.transcribe(audio, True))
+        if kind == "cut":
+            # Énoncé long découpé : l'utilisateur parle encore, l'agent attend la fin de parole
+            if text:
+                self.cut_texts.append(text)
+                await self._send({"type": "partial_transcription", "content": " ".join(self.cut_texts)})
+            return
+        transcription = " ".join([*self.cut_texts, text]).strip()
+        self.cut_texts = []
+        logger.debug("Transcription", extra={"session_id": self.session_id, "content": transcription})
+        if not transcription:
+            return
+        metrics.VOICE_LATENCY_SECONDS.observe(time.perf_counter() - ended_at, stage="transcription")
+        await self._send({"type": "transcription", "content": transcription})
+        await self.agent_queue.put((transcription, ended_at))
+
+    # --- étape agent ---
+
+    async def _agent_stage(self):
+        while True:
+            transcription, ended_at = await self.agent_queue.get()
+            self._run_id += 1
+            VoiceSession.counters["utterances"] += 1
+            self._agent_run = asyncio.create_task(self._respond(self._run_id, transcription, ended_at))
+            # asyncio.wait n'annule pas l'étape quand la réponse est annulée (barge-in)
+            await asyncio.wait({self._agent_run})
+            if self._agent_run.cancelled():
+                await self._send({"type": "interrupted", "content": transcription})
+            elif self._agent_run.exception():
+                error = self._agent_run.exception()
+                logger.error("Réponse de l'agent échouée", exc_info=error,
+                             extra={"session_id": self.session_id, "error": str(error)})
+
+    async def _respond(self, run_id: int, transcription: str, ended_at: float):
+        first = True
+        events = self.run_agent(transcription)
+        try:
+            async for event in events:
+                if first and event != self.placeholder:
+                    first = False
+                    metrics.VOICE_LATENCY_SECONDS.observe(time.perf_counter() - ended_at, stage="first_response")
+                await self._send(event, run_id)
+        finally:
+            # Fermeture immédiate du générateur en cas d'annulation : il arrête lui-même le workflow
+            await events.aclose()
+        await self._send({"content": transcription}, run_id)
+
+    # --- étape envoi ---
+
+    async def _send(self, event: dict, run_id: Optional[int] = None):
+        await self.send_queue.put((run_id, event))
+
+    async def _send_stage(self):
+        while True:
+            run_id, event = await self.send_queue.get()
+            if run_id in self._interrupted:
+                continue
+            await self.send(event)
+
+    # --- état ---
+
+    def depths(self) -> dict:
+        return {"asr": self.asr_queue.qsize(), "agent": self.agent_queue.qsize(), "send": self.send_queue.qsize()}
+
+    @classmethod
+    def total_depth(cls, stage: str) -> int:
+        return sum(session.depths()[stage] for session in list(cls.active))
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {**cls.counters, "open": len(cls.active),
+                "queues": {stage: cls.total_depth(stage) for stage in ("asr", "agent", "send")}}
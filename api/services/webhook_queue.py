@@ -0,0 +1,275 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional
+
+import httpx
+
+from api.services import metrics
+from api.services.n8n_upload import webhook_body
+
+logger = logging.getLogger(__name__)
+
+PENDING = ("queued", "sending", "retrying")
+# Réponses n8n qui ne changeront pas en réessayant
+PERMANENT_STATUS_CODES = {400, 401, 403, 404, 405, 410, 413, 415, 422}
+
+
+class WebhookDeliveryError(Exception):
+    def __init__(self, detail: str, status_code: Optional[int] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+
+    @property
+    def permanent(self) -> bool:
+        return self.status_code in PERMANENT_STATUS_CODES
+
+
+class WebhookQueue:
+    """
+    Envoi asynchrone des images au webhook n8n.
+
+    - `enqueue()` copie le fichier dans le répertoire de spool et retourne un identifiant de job ;
+      l'envoi se fait en tâche de fond par `concurrency` workers
+    - les échecs temporaires (timeout, erreur réseau, 5xx, 429) sont réessayés avec un backoff exponentiel
+    - chaque job est décrit par <job_id>.json (+ <job_id>.bin tant qu'il n'est pas envoyé) : les jobs
+      en attente sont repris au redémarrage, les statuts terminés restent consultables
+    """
+
+    def __init__(
+            self,
+            url: Optional[str],
+            client: Callable[[], httpx.AsyncClient],
+            spool_dir: str = "spool/n8n",
+            concurrency: int = 2,
+            max_attempts: int = 6,
+            backoff_seconds: float = 2.0,
+            max_backoff_seconds: float = 300.0,
+            max_tracked: int = 1000,
+    ):
+        self.url = url
+        self._client = client
+        self.spool_dir = Path(spool_dir)
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.max_tracked = max_tracked
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self._retries: set[asyncio.Task] = set()
+        self._jobs: "OrderedDict[str, dict]" = OrderedDict()
+        self.counters = {"enqueued": 0, "delivered": 0, "failed": 0, "retries": 0, "recovered": 0}
+
+    @classmethod
+    def from_env(cls, url: Optional[str], client: Callable[[], httpx.AsyncClient]) -> "WebhookQueue":
+        return cls(
+            url=url,
+            client=client,
+            spool_dir=os.getenv("N8N_SPOOL_DIR", "spool/n8n"),
+            concurrency=int(os.getenv("N8N_CONCURRENCY", "2")),
+            max_attempts=int(os.getenv("N8N_MAX_ATTEMPTS", "6")),
+            backoff_seconds=float(os.getenv("N8N_BACKOFF_SECONDS", "2")),
+            max_backoff_seconds=float(os.getenv("N8N_MAX_BACKOFF_SECONDS", "300")),
+        )
+
+    # --- spool ---
+
+    def _meta_path(self, job_id: str) -> Path:
+        return self.spool_dir / f"{job_id}.json"
+
+    def _data_path(self, job_id: str) -> Path:
+        return self.spool_dir / f"{job_id}.bin"
+
+    def _save(self, job: dict):
+        # Écriture atomique : un arrêt brutal ne laisse jamais un .json à moitié écrit
+        path = self._meta_path(job["job_id"])
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(job))
+        os.replace(tmp, path)
+
+    def _persist(self, job: dict, remove_data: bool):
+        self._save(job)
+        if remove_data:
+            self._data_path(job["job_id"]).unlink(missing_ok=True)
+
+    async def _update(self, job_id: str, remove_data: bool = False, **fields) -> dict:
+        job = self._jobs[job_id]
+        saved = {**job, **fields, "updated_at": time.time()}
+        # Écriture dans un thread : un disque lent ne bloque pas la boucle (streams, WebSocket) ;
+        # le statut en mémoire ne change qu'une fois le spool à jour
+        await asyncio.to_thread(self._persist, saved, remove_data)
+        job.update(saved)
+        self._jobs.move_to_end(job_id)
+        return job
+
+    def _forget_old(self) -> list[Path]:
+        """Oublie les plus vieux jobs terminés au-delà de max_tracked ; retourne leurs fichiers à supprimer."""
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] not in PENDING]
+        forgotten = finished[:max(0, len(self._jobs) - self.max_tracked)]
+        for job_id in forgotten:
+            del self._jobs[job_id]
+        return [self._meta_path(job_id) for job_id in forgotten]
+
+    @staticmethod
+    def _unlink(paths: list[Path]):
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+    def _recover(self) -> list[str]:
+        """Relit le spool (dans un thread) ; retourne les jobs à renvoyer."""
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        pending = []
+        jobs = []
+        for path in self.spool_dir.glob("*.json"):
+            try:
+                jobs.append(json.loads(path.read_text()))
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("Job n8n illisible dans le spool", extra={"path": str(path), "error": str(e)})
+        for job in sorted(jobs, key=lambda j: j.get("updated_at", 0)):
+            self._jobs[job["job_id"]] = job
+            if job["status"] in PENDING:
+                if self._data_path(job["job_id"]).exists():
+                    job.update(status="queued", retry_in_seconds=None)
+                    pending.append(job["job_id"])
+                else:
+                    job.update(status="failed", error="Fichier absent du spool")
+                self._save(job)
+        self._unlink(self._forget_old())
+        return pending
+
+    # --- API ---
+
+    async def start(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            for job_id in await asyncio.to_thread(self._recover):
+                self._queue.put_nowait(job_id)
+                self.counters["recovered"] += 1
+        while len(self._workers) < self.concurrency:
+            self._workers.append(asyncio.create_task(self._run()))
+
+    async def enqueue(self, source: BinaryIO, fields: dict, attachment: dict, size: int) -> dict:
+        """Copie le fichier dans le spool (par morceaux) et planifie l'envoi. Retourne le statut du job."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {"job_id": job_id, "status": "queued", "attempts": 0, "error": None, "webhook_response": None,
+               "fields": fields, "attachment": attachment, "size": size, "created_at": now, "updated_at": now}
+
+        def write():
+            source.seek(0)
+            with open(self._data_path(job_id), "wb") as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            self._save(job)
+
+        await asyncio.to_thread(write)
+        self._jobs[job_id] = job
+        await asyncio.to_thread(self._unlink, self._forget_old())
+        self.counters["enqueued"] += 1
+        self._queue.put_nowait(job_id)
+        return self.status(job_id)
+
+    def status(self, job_id: str) -> Optional[dict]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        public = {key: value for key, value in job.items() if key not in ("fields", "attachment", "size")}
+        public["file_info"] = {"filename": job["attachment"].get("filename"), "size": job["size"],
+                               "mime_type": job["attachment"].get("contentType")}
+        return public
+
+    def queue_depth(self) -> int:
+        return sum(1 for job in self._jobs.values() if job["status"] in PENDING)
+
+    def stats(self) -> dict:
+        return {**self.counters, "pending": self.queue_depth(), "workers": len(self._workers),
+                "spool_dir": str(self.spool_dir)}
+
+    async def close(self):
+        # Les jobs en cours restent dans le spool et seront repris au prochain démarrage
+        for task in [*self._workers, *self._retries]:
+            if not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._workers.clear()
+
+    # --- envoi ---
+
+    async def _deliver(self, job: dict):
+        if not self.url:
+            raise WebhookDeliveryError("N8N_WEBHOOK_URL non configuré", status_code=404)
+        data_path = self._data_path(job["job_id"])
+        with open(data_path, "rb") as file:
+            content_length, body = webhook_body(job["fields"], job["attachment"], job["size"], lambda: file)
+            started = time.perf_counter()
+            try:
+                response = await self._client().post(
+                    self.url,
+                    content=body(),
+                    headers={"Content-Type": "application/json", "Content-Length": str(content_length)},
+                )
+            except httpx.HTTPError as e:
+                metrics.N8N_WEBHOOK_SECONDS.observe(time.perf_counter() - started, status="error")
+                raise WebhookDeliveryError(f"{type(e).__name__}: {e}") from e
+        metrics.N8N_WEBHOOK_SECONDS.observe(time.perf_counter() - started, status=str(response.status_code))
+        if response.status_code >= 300:
+            raise WebhookDeliveryError(f"Erreur webhook n8n: {response.status_code} - {response.text[:200]}",
+                                       status_code=response.status_code)
+        return response.status_code
+
+    async def _retry_later(self, job_id: str, delay: float):
+        await asyncio.sleep(delay)
+        self._queue.put_nowait(job_id)
+
+    async def _fail_or_retry(self, job_id: str, attempts: int, error: str, status_code: Optional[int] = None,
+                       permanent: bool = False):
+        if permanent or attempts >= self.max_attempts:
+            await self._finish(job_id, "failed", error=error, webhook_response=status_code)
+            self.counters["failed"] += 1
+            return
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (attempts - 1))
+        await self._update(job_id, status="retrying", error=error, webhook_response=status_code, retry_in_seconds=delay)
+        self.counters["retries"] += 1
+        retry = asyncio.create_task(self._retry_later(job_id, delay))
+        self._retries.add(retry)
+        retry.add_done_callback(self._retries.discard)
+
+    async def _run(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] not in PENDING:
+                continue
+            attempts = job["attempts"] + 1
+            try:
+                await self._update(job_id, status="sending", attempts=attempts, retry_in_seconds=None)
+                status_code = await self._deliver(job)
+            except WebhookDeliveryError as e:
+                await self._fail_or_retry(job_id, attempts, str(e), e.status_code, e.permanent)
+                logger.warning("Envoi webhook n8n échoué", extra={"job_id": job_id, "attempt": attempts, "error": str(e)})
+            except OSError as e:
+                await self._finish(job_id, "failed", error=str(e))
+                self.counters["failed"] += 1
+                logger.warning("Job n8n illisible", extra={"job_id": job_id, "error": str(e)})
+            except Exception as e:
+                # Erreur inattendue (client n8n pas encore ouvert, URL invalide...) : le worker doit survivre,
+                # sinon les jobs restent bloqués en "sending" et plus rien n'est envoyé
+                await self._fail_or_retry(job_id, attempts, f"{type(e).__name__}: {e}")
+                logger.exception("Envoi webhook n8n en erreur inattendue",
+                                 extra={"job_id": job_id, "attempt": attempts, "error": str(e)})
+            else:
+                await self._finish(job_id, "delivered", error=None, webhook_response=status_code)
+                self.counters["delivered"] += 1
+
+    async def _finish(self, job_id: str, status: str, **fields):
+        await self._update(job_id, remove_data=True, status=status, **fields)
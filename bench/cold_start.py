@@ -0,0 +1,134 @@
+"""
+Démarrage à froid de l'API : temps d'import de api.main, délai avant que /healthz réponde et délai
+avant que chaque capacité de /readyz soit prête, face aux substituts locaux (faux Ollama, faux MCP).
+
+    python -m bench.cold_start --runs 3
+    python -m bench.cold_start --import-budget 1.5 --ready-budget 30
+
+Code de sortie 1 si un budget est dépassé (médiane des essais).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from bench.run import ROOT, free_port, start, wait_http
+
+IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import api.main; "
+    "print(round(time.perf_counter() - t, 3), api.main.IMPORT_SECONDS)"
+)
+
+
+def measure_import(env: dict) -> dict:
+    """Import de api.main dans un processus neuf (aucun module en cache)."""
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env={**os.environ, **env},
+                            capture_output=True, text=True, check=True).stdout.split()
+    return {"process_seconds": float(output[0]), "module_seconds": float(output[1])}
+
+
+async def measure_ready(env: dict, timeout: float) -> dict:
+    """Lance uvicorn et interroge /healthz et /readyz toutes les 50 ms jusqu'à ce que tout soit prêt."""
+    port = free_port()
+    started = time.monotonic()
+    api = start([sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port), "--log-level", "warning"], env)
+    result = {"healthz_seconds": None, "capabilities": {}, "subsystems": {}}
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+            while time.monotonic() - started < timeout:
+                if api.poll() is not None:
+                    raise RuntimeError(f"l'API s'est arrêtée (code {api.returncode})")
+                elapsed = round(time.monotonic() - started, 3)
+                try:
+                    if result["healthz_seconds"] is None and (await client.get("/healthz")).status_code == 200:
+                        result["healthz_seconds"] = elapsed
+                    report = (await client.get("/readyz")).json()
+                except httpx.HTTPError:
+                    await asyncio.sleep(0.05)
+                    continue
+                for name, ready in report["capabilities"].items():
+                    if ready:
+                        result["capabilities"].setdefault(name, elapsed)
+                if report["ready"]:
+                    result["ready_seconds"] = elapsed
+                    result["import_seconds"] = report["import_seconds"]
+                    result["subsystems"] = {name: s["ready_after_seconds"] for name, s in report["subsystems"].items()}
+                    return result
+                await asyncio.sleep(0.05)
+        raise TimeoutError(f"API non prête après {timeout} s : {result}")
+    finally:
+        api.terminate()
+        try:
+            api.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            api.kill()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--import-budget", type=float, default=float(os.getenv("IMPORT_BUDGET_SECONDS", "1.5")))
+    parser.add_argument("--ready-budget", type=float, default=float(os.getenv("READY_BUDGET_SECONDS", "30")))
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    ollama_port, mcp_port = free_port(), free_port()
+    processes = [
+        start([sys.executable, "-m", "uvicorn", "bench.stand_ins:app", "--port", str(ollama_port), "--log-level",
+               "warning"], {}),
+        start([sys.executable, "-m", "bench.fake_mcp", "--port", str(mcp_port)], {}),
+    ]
+    env = {
+        "MCP_PORT": str(mcp_port),
+        "OLLAMA_HOST": f"http://127.0.0.1:{ollama_port}",
+        "N8N_WEBHOOK_URL": f"http://127.0.0.1:{ollama_port}/webhook",
+    }
+    try:
+        await wait_http(f"http://127.0.0.1:{ollama_port}/", processes[0])
+        await asyncio.sleep(1.0)  # laisser le serveur MCP ouvrir son port
+
+        imports = [measure_import(env) for _ in range(args.runs)]
+        readies = [await measure_ready(env, args.timeout) for _ in range(args.runs)]
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def median(values):
+        values = [v for v in values if v is not None]
+        return round(statistics.median(values), 3) if values else None
+
+    summary = {
+        "import_seconds": median(i["module_seconds"] for i in imports),
+        "import_process_seconds": median(i["process_seconds"] for i in imports),
+        "healthz_seconds": median(r["healthz_seconds"] for r in readies),
+        "ready_seconds": median(r["ready_seconds"] for r in readies),
+        "capabilities": {name: median(r["capabilities"].get(name) for r in readies)
+                         for name in readies[0]["capabilities"]},
+        "subsystems": {name: median(r["subsystems"].get(name) for r in readies) for name in readies[0]["subsystems"]},
+        "budgets": {"import_seconds": args.import_budget, "ready_seconds": args.ready_budget},
+    }
+    print(json.dumps(summary, indent=2))
+
+    over = []
+    if summary["import_seconds"] > args.import_budget:
+        over.append(f"import {summary['import_seconds']} s > {args.import_budget} s")
+    if summary["ready_seconds"] > args.ready_budget:
+        over.append(f"prêt {summary['ready_seconds']} s > {args.ready_budget} s")
+    if over:
+        print("Budget dépassé : " + ", ".join(over), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
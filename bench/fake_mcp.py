@@ -0,0 +1,60 @@
+"""
+Serveur MCP de substitution : mêmes outils (noms, paramètres) que mcp_server.py, réponses fixes,
+sans OpenWeatherMap, Kasa ni SMTP. Latence simulée par BENCH_TOOL_DELAY_SECONDS (BENCH_WEATHER_DELAYS par ville).
+
+    python -m bench.fake_mcp --port 8765
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from mcp.server import FastMCP
+
+TOOL_DELAY_SECONDS = float(os.getenv("BENCH_TOOL_DELAY_SECONDS", "0.02"))
+# Délai propre à certaines villes ("Paris=3,Lyon=0.5") : appels lents ou bloqués
+WEATHER_DELAYS = {city.strip(): float(delay) for city, _, delay in
+                  (part.partition("=") for part in os.getenv("BENCH_WEATHER_DELAYS", "").split(",") if part)}
+
+
+def build_server(port: int) -> FastMCP:
+    mcp = FastMCP("discuss", port=port)
+
+    @mcp.tool("weather", "Get the weather in a location. Optional: hours (forecast range, default 24), compact (default true)")
+    async def get_weather(location: str, hours: int = 24, compact: bool = True):
+        await asyncio.sleep(WEATHER_DELAYS.get(location, TOOL_DELAY_SECONDS))
+        entry = {"dt": int(time.time()), "main": {"temp": 291.2}, "weather": [{"description": "ciel dégagé"}],
+                 "wind": {"speed": 3.1}, "pop": 0}
+        return json.dumps({"type": "raw_weather_data", "location": location, "data": [entry] * max(1, hours // 3)})
+
+    @mcp.tool("time", "Get the current time")
+    def get_time():
+        return f"Le temps est {time.strftime('%H:%M:%S')}"
+
+    @mcp.tool("home_automation_toggle_device", "Toggle the state of a device (like an electrical outlet), on or off")
+    async def home_automation_toggle_device(device_name, state):
+        await asyncio.sleep(TOOL_DELAY_SECONDS)
+        return {"result": {"status": "success", "message": f"{device_name} switched {state.lower()}"}}
+
+    @mcp.tool("home_automation_status", "Get the on/off state of a device, a group ('all') or a comma-separated list of devices")
+    async def home_automation_status(device_name):
+        await asyncio.sleep(TOOL_DELAY_SECONDS)
+        return {"result": {"status": "success", "states": {device_name: True}}}
+
+    @mcp.tool("send_email", "Send an email via Gmail SMTP")
+    def send_email(to_email: str, subject: str, body: str):
+        return json.dumps({"status": "queued", "message_id": "bench", "message": f"Email en cours d'envoi à {to_email}"})
+
+    @mcp.tool("email_status", "Get the delivery status of an email queued by send_email")
+    def email_status(message_id: str):
+        return json.dumps({"message_id": message_id, "status": "sent"})
+
+    return mcp
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(build_server(args.port).run_sse_async())
@@ -0,0 +1,94 @@
+"""
+Latence d'un appel d'outil MCP selon le transport : SSE (serveur séparé, BasicMCPClient) ou inprocess
+(outils FastMCP appelés directement, api/services/inprocess_mcp.py). Les deux modes utilisent les outils
+de bench/fake_mcp.py sans latence simulée : seule la différence de transport est mesurée.
+
+    python -m bench.mcp_latency --calls 200 --concurrency 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+from bench.run import free_port, start, wait_http
+
+# Aucune latence simulée côté outils (lu à l'import de bench.fake_mcp)
+os.environ["BENCH_TOOL_DELAY_SECONDS"] = "0"
+
+from bench.fake_mcp import build_server  # noqa: E402
+
+CALLS = [
+    ("time", {}),
+    ("weather", {"location": "Paris", "hours": 6}),
+    ("home_automation_toggle_device", {"device_name": "salon", "state": "on"}),
+]
+
+
+def percentiles(samples: list[float]) -> dict:
+    samples = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 3)
+
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "mean": round(statistics.mean(samples) * 1000, 3)}
+
+
+async def measure(spec, calls: int, concurrency: int) -> dict:
+    started = time.perf_counter()
+    tools = {tool.metadata.name: tool for tool in await spec.to_tool_list_async()}
+    result = {"list_tools_ms": round((time.perf_counter() - started) * 1000, 3)}
+
+    for name, kwargs in CALLS:
+        samples = []
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                t = time.perf_counter()
+                output = await tools[name].acall(**kwargs)
+                samples.append(time.perf_counter() - t)
+                if output.is_error:
+                    raise RuntimeError(f"{name}: {output.content}")
+
+        await tools[name].acall(**kwargs)  # premier appel (connexions, imports) hors mesure
+        await asyncio.gather(*(one() for _ in range(calls)))
+        result[name] = percentiles(samples)
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    from llama_index.tools.mcp import BasicMCPClient, McpToolSpec
+
+    from api.services.inprocess_mcp import InProcessToolSpec
+
+    port = free_port()
+    server = start([sys.executable, "-m", "bench.fake_mcp", "--port", str(port)], {"BENCH_TOOL_DELAY_SECONDS": "0"})
+    try:
+        await wait_http(f"http://127.0.0.1:{port}/", server, timeout=30)  # 404 : le serveur écoute
+        report = {
+            "calls": args.calls,
+            "concurrency": args.concurrency,
+            "sse": await measure(McpToolSpec(client=BasicMCPClient(f"http://127.0.0.1:{port}/sse")),
+                                 args.calls, args.concurrency),
+            "inprocess": await measure(InProcessToolSpec(build_server(0)), args.calls, args.concurrency),
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    print(json.dumps(report, indent=2))
+    for name, _ in CALLS:
+        sse, local = report["sse"][name]["p50"], report["inprocess"][name]["p50"]
+        print(f"{name:32s} p50 sse={sse:8.3f} ms  inprocess={local:8.3f} ms  (x{sse / local:.0f})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
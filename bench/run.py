@@ -0,0 +1,322 @@
+"""
+Benchmark hors ligne de l'API : démarre api/main.py face aux substituts locaux (Ollama + n8n, MCP),
+envoie des requêtes concurrentes et mesure le surcoût propre à l'API.
+
+    python -m bench.run --scenarios translate,discuss,ask,upload,speak --concurrency 8 --requests 40
+    python -m bench.run --compare bench/results/<précédent>.json
+
+Mesures par scénario : temps jusqu'au premier événement, événements/s, latence p50/p95/p99,
+CPU et RSS du processus API. Les résultats sont écrits en JSON dans bench/results/.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+SAMPLE_RATE = 16000
+
+
+# --- données synthétiques ---
+
+def synthetic_pcm(speech_seconds: float = 1.5, silence_seconds: float = 1.0) -> bytes:
+    """Silence, une « phrase » (somme de sinus modulée), puis silence : assez pour déclencher la VAD."""
+    samples = []
+    for i in range(int(SAMPLE_RATE * silence_seconds)):
+        samples.append(0)
+    for i in range(int(SAMPLE_RATE * speech_seconds)):
+        t = i / SAMPLE_RATE
+        envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 3 * t)
+        value = envelope * (0.3 * math.sin(2 * math.pi * 180 * t) + 0.2 * math.sin(2 * math.pi * 420 * t))
+        samples.append(int(value * 32767))
+    for i in range(int(SAMPLE_RATE * silence_seconds)):
+        samples.append(0)
+    return struct.pack(f"<{len(samples)}h", *samples)
+
+
+def tiny_png(width: int = 64, height: int = 64) -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    raw = b"".join(b"\x00" + bytes((x * 4) % 256 for x in range(width * 3)) for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+
+# --- processus ---
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start(cmd: list[str], env: dict) -> subprocess.Popen:
+    return subprocess.Popen(cmd, cwd=ROOT, env={**os.environ, **env},
+                            stdout=subprocess.DEVNULL if os.getenv("BENCH_QUIET") else None,
+                            stderr=subprocess.DEVNULL if os.getenv("BENCH_QUIET") else None)
+
+
+async def wait_http(url: str, process: Optional[subprocess.Popen] = None, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"le processus servant {url} s'est arrêté (code {process.returncode})")
+            try:
+                if (await client.get(url, timeout=2.0)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise TimeoutError(f"{url} ne répond pas")
+
+
+class ProcessSampler:
+    """Échantillonne CPU (utime+stime) et RSS d'un processus via /proc (Linux)."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self.rss_peak_mb = 0.0
+
+    def cpu_seconds(self) -> Optional[float]:
+        try:
+            fields = Path(f"/proc/{self.pid}/stat").read_text().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / self.ticks
+        except OSError:
+            return None
+
+    def rss_mb(self) -> Optional[float]:
+        try:
+            for line in Path(f"/proc/{self.pid}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+        except OSError:
+            return None
+        return None
+
+    async def watch(self, stop: asyncio.Event):
+        while not stop.is_set():
+            self.rss_peak_mb = max(self.rss_peak_mb, self.rss_mb() or 0.0)
+            await asyncio.sleep(0.2)
+
+
+# --- requêtes ---
+
+async def sse_request(client: httpx.AsyncClient, path: str, payload: dict) -> dict:
+    started = time.perf_counter()
+    first = None
+    events = 0
+    buffer = ""
+    async with client.stream("POST", path, json=payload) as response:
+        async for text in response.aiter_text():
+            buffer += text
+            frames = buffer.split("\n\n")
+            buffer = frames.pop()
+            for frame in frames:
+                if frame.strip():
+                    events += 1
+                    first = first if first is not None else time.perf_counter() - started
+    if buffer.strip():
+        events += 1
+    return {"ttfe": first, "events": events, "latency": time.perf_counter() - started, "ok": response.status_code < 400}
+
+
+async def upload_request(client: httpx.AsyncClient, image: bytes) -> dict:
+    started = time.perf_counter()
+    response = await client.post("/upload-image", files={"file": ("bench.png", image, "image/png")},
+                                 data={"message_text": "bench"})
+    latency = time.perf_counter() - started
+    return {"ttfe": latency, "events": 1, "latency": latency, "ok": response.status_code < 400}
+
+
+async def speak_request(ws_url: str, pcm: bytes, realtime: bool) -> dict:
+    import websockets
+
+    chunk = SAMPLE_RATE * 2 // 10  # 100 ms
+    started = time.perf_counter()
+    async with websockets.connect(ws_url, max_size=None) as ws:
+        for offset in range(0, len(pcm), chunk):
+            await ws.send(pcm[offset:offset + chunk])
+            if realtime:
+                await asyncio.sleep(0.1)
+        end_of_audio = time.perf_counter()
+        first = None
+        events = 0
+        try:
+            while True:
+                message = json.loads(await asyncio.wait_for(ws.recv(), timeout=60))
+                events += 1
+                first = first if first is not None else time.perf_counter() - end_of_audio
+                if message.get("type") == "final_response" and message.get("content") != "Thinking...\n":
+                    break
+        except asyncio.TimeoutError:
+            return {"ttfe": first, "events": events, "latency": time.perf_counter() - started, "ok": False}
+    return {"ttfe": first, "events": events, "latency": time.perf_counter() - started, "ok": events > 0}
+
+
+# --- scénarios ---
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+
+async def run_scenario(name: str, base_url: str, concurrency: int, requests: int, realtime_audio: bool) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    image = tiny_png()
+    pcm = synthetic_pcm()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        async def one(i: int) -> dict:
+            async with semaphore:
+                try:
+                    if name == "translate":
+                        return await sse_request(client, "/translate", {
+                            "source_lang": "français", "target_lang": "anglais", "text": f"Bonjour le monde {i}"})
+                    if name == "discuss":
+                        return await sse_request(client, "/discuss", {"text": f"Raconte une histoire {i}"})
+                    if name == "ask":
+                        return await sse_request(client, "/ask", {"text": f"Explique la photosynthèse {i}"})
+                    if name == "upload":
+                        return await upload_request(client, image)
+                    if name == "speak":
+                        return await speak_request(base_url.replace("http", "ws") + "/ws/speak", pcm, realtime_audio)
+                    raise ValueError(name)
+                except Exception as e:
+                    return {"ttfe": None, "events": 0, "latency": 0.0, "ok": False, "error": str(e)}
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(requests)))
+        wall = time.perf_counter() - started
+
+    ok = [r for r in results if r["ok"]]
+    ttfe = [r["ttfe"] for r in ok if r["ttfe"] is not None]
+    latencies = [r["latency"] for r in ok]
+    events = sum(r["events"] for r in ok)
+    errors = sorted({r["error"] for r in results if r.get("error")})
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "succeeded": len(ok),
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(len(ok) / wall, 2) if wall else None,
+        "events_per_second": round(events / wall, 2) if wall else None,
+        "ttfe_ms": {"p50": percentile(ttfe, 0.5), "p95": percentile(ttfe, 0.95), "p99": percentile(ttfe, 0.99)},
+        "latency_ms": {"p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95),
+                       "p99": percentile(latencies, 0.99)},
+        "errors": errors[:5],
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline_path: str):
+    baseline = json.loads(Path(baseline_path).read_text())
+    print(f"\nComparaison avec {baseline_path} ({baseline.get('revision')}) :")
+    for name, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        for metric in ("ttfe_ms", "latency_ms"):
+            old, new = before[metric]["p95"], result[metric]["p95"]
+            if old and new:
+                print(f"  {name:10s} {metric} p95 : {old:9.1f} -> {new:9.1f} ({(new - old) / old * 100:+.1f} %)")
+        old, new = before.get("events_per_second"), result.get("events_per_second")
+        if old and new:
+            print(f"  {name:10s} events/s   : {old:9.1f} -> {new:9.1f} ({(new - old) / old * 100:+.1f} %)")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default="translate,discuss,ask,upload,speak")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--token-rate", type=float, default=100.0, help="tokens/s du faux Ollama")
+    parser.add_argument("--realtime-audio", action="store_true", help="envoyer l'audio au rythme réel")
+    parser.add_argument("--output", help="fichier JSON de sortie (défaut: bench/results/<date>-<commit>.json)")
+    parser.add_argument("--compare", help="résultats précédents à comparer")
+    args = parser.parse_args()
+
+    ollama_port, mcp_port, api_port = free_port(), free_port(), free_port()
+    stand_in_env = {"BENCH_TOKEN_RATE": str(args.token_rate)}
+    processes = [
+        start([sys.executable, "-m", "uvicorn", "bench.stand_ins:app", "--port", str(ollama_port), "--log-level",
+               "warning"], stand_in_env),
+        start([sys.executable, "-m", "bench.fake_mcp", "--port", str(mcp_port)], {}),
+    ]
+    api = None
+    try:
+        await wait_http(f"http://127.0.0.1:{ollama_port}/", processes[0])
+        await asyncio.sleep(1.0)  # laisser le serveur MCP ouvrir son port
+        api = start([sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(api_port), "--log-level",
+                     "warning"], {
+            "MCP_PORT": str(mcp_port),
+            "OLLAMA_HOST": f"http://127.0.0.1:{ollama_port}",
+            "N8N_WEBHOOK_URL": f"http://127.0.0.1:{ollama_port}/webhook",
+            # Tout le trafic vient d'un seul client : pas de limite par client pendant la mesure
+            "SCHED_CLIENT_RATE": "0",
+            "SCHED_CLIENT_CONCURRENCY": "1000",
+        })
+        processes.append(api)
+        base_url = f"http://127.0.0.1:{api_port}"
+        await wait_http(f"{base_url}/readyz", api)  # 503 tant que les sous-systèmes démarrent
+
+        sampler = ProcessSampler(api.pid)
+        report = {"revision": git_revision(), "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  "token_rate": args.token_rate, "scenarios": {}}
+        for name in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+            stop = asyncio.Event()
+            watcher = asyncio.create_task(sampler.watch(stop))
+            cpu_before = sampler.cpu_seconds()
+            result = await run_scenario(name, base_url, args.concurrency, args.requests, args.realtime_audio)
+            cpu_after = sampler.cpu_seconds()
+            stop.set()
+            await watcher
+            result["server_cpu_seconds"] = round(cpu_after - cpu_before, 3) if cpu_before is not None else None
+            result["server_rss_peak_mb"] = round(sampler.rss_peak_mb, 1)
+            report["scenarios"][name] = result
+            print(f"{name:10s} ok={result['succeeded']}/{result['requests']} "
+                  f"ttfe p50={result['ttfe_ms']['p50']} ms  latence p95={result['latency_ms']['p95']} ms  "
+                  f"{result['events_per_second']} ev/s  cpu={result['server_cpu_seconds']} s  "
+                  f"rss={result['server_rss_peak_mb']} Mo")
+
+        output = Path(args.output) if args.output else RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{report['revision']}.json"
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        print(f"\nRésultats écrits dans {output}")
+        if args.compare:
+            compare(report, args.compare)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,222 @@
+"""
+Serveurs de substitution pour les benchmarks hors ligne : Ollama (/api/generate, /api/chat, /api/show, /api/ps, /api/tags)
+et le webhook n8n. Les tokens sont streamés à un débit configurable (BENCH_TOKEN_RATE, tokens/s).
+
+    uvicorn bench.stand_ins:app --port 11434
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, Request
+from starlette.responses import JSONResponse, StreamingResponse
+
+TOKEN_RATE = float(os.getenv("BENCH_TOKEN_RATE", "100"))
+RESPONSE_TOKENS = int(os.getenv("BENCH_RESPONSE_TOKENS", "60"))
+LOAD_DELAY_SECONDS = float(os.getenv("BENCH_LOAD_DELAY_SECONDS", "0"))
+N8N_DELAY_SECONDS = float(os.getenv("BENCH_N8N_DELAY_SECONDS", "0.05"))
+# Les N premiers appels au webhook répondent 503 (test des retries)
+N8N_FAILURES = int(os.getenv("BENCH_N8N_FAILURES", "0"))
+# Coût fixe d'évaluation du prompt par génération, et générations simultanées (0 = illimité) comme OLLAMA_NUM_PARALLEL
+PROMPT_EVAL_SECONDS = float(os.getenv("BENCH_PROMPT_EVAL_SECONDS", "0"))
+PARALLEL = int(os.getenv("BENCH_PARALLEL", "0"))
+
+TRANSLATION_TOKENS = ["Hello", " world", " |||", " ANGLAIS", " |||", " C'est", " une", " salutation", ".", " |||",
+                      " Bonjour", " le", " monde"]
+
+# Prompt groupé de /translate/batch : une ligne "[n] ..." par phrase
+PACKED_LINE = re.compile(r"^\[(\d+)\] ", re.MULTILINE)
+
+app = FastAPI()
+parallel = asyncio.Semaphore(PARALLEL) if PARALLEL > 0 else None
+loaded_models: dict[str, float] = {}  # modèle -> expiration (time.time), comme keep_alive côté Ollama
+load_calls: dict[str, int] = {}
+# Générations streamées : interrompues = client (l'API) parti avant la fin
+generations = {"started": 0, "completed": 0, "aborted": 0, "tokens": 0}
+webhook_calls = {"received": 0, "delivered": 0}
+
+
+def now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def response_tokens(prompt: str) -> list[str]:
+    numbers = PACKED_LINE.findall(prompt) if "|||" in prompt else []
+    if numbers:
+        return [token for number in numbers for token in (f"[{number}] ", *TRANSLATION_TOKENS, "\n")]
+    if "|||" in prompt:
+        return TRANSLATION_TOKENS
+    return [f" mot{i}" for i in range(RESPONSE_TOKENS)]
+
+
+def keep_alive_seconds(value) -> float:
+    if value is None:
+        return 300.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    units = {"s": 1, "m": 60, "h": 3600}
+    return float(value[:-1]) * units[value[-1]] if value[-1] in units else float(value)
+
+
+def loaded() -> list[str]:
+    for model in [m for m, expires in loaded_models.items() if expires <= time.time()]:
+        del loaded_models[model]
+    return list(loaded_models)
+
+
+async def ensure_loaded(model: str, keep_alive=None):
+    if model not in loaded():
+        load_calls[model] = load_calls.get(model, 0) + 1
+        if LOAD_DELAY_SECONDS:
+            await asyncio.sleep(LOAD_DELAY_SECONDS)
+    loaded_models[model] = time.time() + keep_alive_seconds(keep_alive)
+
+
+async def paced(tokens: list[str]):
+    interval = 1.0 / TOKEN_RATE if TOKEN_RATE > 0 else 0
+    if parallel is not None:
+        await parallel.acquire()
+    try:
+        if PROMPT_EVAL_SECONDS and tokens:
+            await asyncio.sleep(PROMPT_EVAL_SECONDS)
+        for token in tokens:
+            if interval:
+                await asyncio.sleep(interval)
+            yield token
+    finally:
+        if parallel is not None:
+            parallel.release()
+
+
+@app.post("/api/generate")
+async def generate(request: Request):
+    body = await request.json()
+    model = body.get("model", "bench")
+    prompt = body.get("prompt", "")
+    started = time.perf_counter_ns()
+    await ensure_loaded(model, body.get("keep_alive"))
+    tokens = response_tokens(prompt) if prompt else []
+    num_predict = (body.get("options") or {}).get("num_predict")
+    if num_predict is not None and num_predict >= 0:
+        tokens = tokens[:num_predict]
+
+    if body.get("stream") is False:
+        tokens = [token async for token in paced(tokens)]
+        return {"model": model, "created_at": now(), "response": "".join(tokens), "done": True,
+                "done_reason": "load" if not prompt else "stop", "total_duration": time.perf_counter_ns() - started}
+
+    async def stream():
+        generations["started"] += 1
+        try:
+            async for token in paced(tokens):
+                generations["tokens"] += 1
+                yield json.dumps({"model": model, "created_at": now(), "response": token, "done": False}) + "\n"
+        except BaseException:
+            generations["aborted"] += 1
+            raise
+        generations["completed"] += 1
+        context = list(body.get("context") or []) + list(range(len(prompt) // 4 + 1))
+        yield json.dumps({
+            "model": model, "created_at": now(), "response": "", "done": True, "done_reason": "stop",
+            "context": context, "prompt_eval_count": len(prompt) // 4 + 1,
+            "prompt_eval_duration": 1_000_000 * (len(prompt) // 4 + 1),
+            "total_duration": time.perf_counter_ns() - started,
+        }) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+def requested_tool_calls(body: dict) -> list[dict]:
+    """Appels d'outils simulés au premier tour : « météo à Paris et Lyon » -> un appel weather par ville."""
+    messages = body.get("messages") or []
+    if not body.get("tools") or not messages or messages[-1].get("role") != "user":
+        return []
+    text = messages[-1].get("content") or ""
+    if "météo" not in text.casefold():
+        return []
+    return [{"function": {"name": "weather", "arguments": {"location": city}}}
+            for city in re.findall(r"(?:à|et)\s+([A-ZÉ][\w-]+)", text)]
+
+
+@app.post("/api/chat")
+async def chat(request: Request):
+    body = await request.json()
+    model = body.get("model", "bench")
+    await ensure_loaded(model, body.get("keep_alive"))
+    tool_calls = requested_tool_calls(body)
+
+    async def stream():
+        if tool_calls:
+            yield json.dumps({"model": model, "created_at": now(),
+                              "message": {"role": "assistant", "content": "", "tool_calls": tool_calls},
+                              "done": False}) + "\n"
+            yield json.dumps({"model": model, "created_at": now(), "message": {"role": "assistant", "content": ""},
+                              "done": True, "done_reason": "stop", "eval_count": len(tool_calls)}) + "\n"
+            return
+        async for token in paced(response_tokens("")):
+            yield json.dumps({"model": model, "created_at": now(),
+                              "message": {"role": "assistant", "content": token}, "done": False}) + "\n"
+        yield json.dumps({"model": model, "created_at": now(), "message": {"role": "assistant", "content": ""},
+                          "done": True, "done_reason": "stop", "prompt_eval_count": 10,
+                          "prompt_eval_duration": 10_000_000, "eval_count": RESPONSE_TOKENS}) + "\n"
+
+    if body.get("stream", True):
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+    return JSONResponse({"model": model, "created_at": now(), "done": True,
+                         "message": {"role": "assistant", "content": "".join(response_tokens(""))}})
+
+
+@app.get("/api/ps")
+async def ps():
+    return {"models": [{"name": name, "model": name,
+                        "expires_at": datetime.fromtimestamp(loaded_models[name], timezone.utc).isoformat()}
+                       for name in loaded()]}
+
+
+@app.get("/api/ps/stats")
+async def ps_stats():
+    """Nombre de chargements (à froid) par modèle."""
+    return load_calls
+
+
+@app.get("/api/generate/stats")
+async def generate_stats():
+    return generations
+
+
+@app.post("/api/show")
+async def show():
+    return {"modelfile": "", "parameters": "", "template": "", "details": {"family": "bench"},
+            "model_info": {"general.architecture": "bench", "bench.context_length": 8192}}
+
+
+@app.get("/api/tags")
+async def tags():
+    return {"models": [{"name": name, "model": name} for name in loaded()]}
+
+
+@app.get("/")
+async def root():
+    return "Ollama is running"
+
+
+@app.post("/webhook")
+async def n8n_webhook(request: Request):
+    body = b""
+    async for chunk in request.stream():
+        body += chunk
+    await asyncio.sleep(N8N_DELAY_SECONDS)
+    webhook_calls["received"] += 1
+    if webhook_calls["received"] <= N8N_FAILURES:
+        return JSONResponse({"error": "indisponible"}, status_code=503)
+    payload = json.loads(body)  # vérifie que le JSON streamé est valide
+    webhook_calls["delivered"] += 1
+    return {"received_bytes": len(body), "attachments": len(payload.get("attachments", []))}
+
+
+@app.get("/webhook/stats")
+async def n8n_webhook_stats():
+    return webhook_calls
@@ -0,0 +1,120 @@
+"""
+Débit de traduction : N phrases envoyées une par une à /translate (séquentiel, comme les jobs actuels) puis en un
+seul appel à /translate/batch (générations concurrentes, phrases courtes regroupées). Faux Ollama avec un coût fixe
+d'évaluation du prompt et un nombre de générations simultanées limité, comme OLLAMA_NUM_PARALLEL.
+
+    python -m bench.translate_batch --texts 64 --targets anglais,espagnol
+    python -m bench.translate_batch --pack-size 1      # concurrence seule, sans regroupement
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+
+import httpx
+
+from bench.run import free_port, start, wait_http
+
+
+def sentences(count: int, tag: str) -> list[str]:
+    # Textes distincts par mode : aucun résultat servi par le cache de traduction
+    return [f"Phrase {tag} numéro {i} à traduire." for i in range(count)]
+
+
+async def sequential(client: httpx.AsyncClient, texts: list[str], targets: list[str]) -> dict:
+    started = time.perf_counter()
+    done = 0
+    for target in targets:
+        for text in texts:
+            async with client.stream("POST", "/translate", params={"format": "ndjson"},
+                                     json={"source_lang": "français", "target_lang": target, "text": text}) as response:
+                response.raise_for_status()
+                async for _ in response.aiter_lines():
+                    pass
+            done += 1
+    elapsed = time.perf_counter() - started
+    return {"translations": done, "seconds": round(elapsed, 3), "per_second": round(done / elapsed, 2)}
+
+
+async def batch(client: httpx.AsyncClient, texts: list[str], targets: list[str]) -> dict:
+    started = time.perf_counter()
+    first = None
+    results, summary = 0, {}
+    async with client.stream("POST", "/translate/batch", params={"format": "ndjson"},
+                             json={"source_lang": "français", "target_langs": targets, "texts": texts}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event.get("type") == "done":
+                summary = event
+            elif "translation" in event:
+                results += 1
+                first = first if first is not None else time.perf_counter() - started
+    elapsed = time.perf_counter() - started
+    return {"translations": results, "seconds": round(elapsed, 3), "per_second": round(results / elapsed, 2),
+            "first_result_seconds": round(first, 3) if first is not None else None,
+            "prompts": summary.get("prompts"), "errors": summary.get("errors")}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, default=64)
+    parser.add_argument("--targets", default="anglais")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="tokens/s du faux Ollama")
+    parser.add_argument("--prompt-eval", type=float, default=0.15, help="coût fixe par prompt (s)")
+    parser.add_argument("--parallel", type=int, default=4, help="générations simultanées du faux Ollama")
+    parser.add_argument("--concurrency", type=int, default=4, help="TRANSLATE_BATCH_CONCURRENCY")
+    parser.add_argument("--pack-size", type=int, default=8, help="TRANSLATE_PACK_SIZE")
+    args = parser.parse_args()
+    targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+
+    ollama_port, api_port = free_port(), free_port()
+    processes = [start([sys.executable, "-m", "uvicorn", "bench.stand_ins:app", "--port", str(ollama_port),
+                        "--log-level", "warning"], {
+        "BENCH_TOKEN_RATE": str(args.token_rate),
+        "BENCH_PROMPT_EVAL_SECONDS": str(args.prompt_eval),
+        "BENCH_PARALLEL": str(args.parallel),
+    })]
+    try:
+        await wait_http(f"http://127.0.0.1:{ollama_port}/", processes[0])
+        api = start([sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(api_port), "--log-level",
+                     "warning"], {
+            "OLLAMA_HOST": f"http://127.0.0.1:{ollama_port}",
+            "MCP_TRANSPORT": "inprocess",
+            "TRANSLATE_BATCH_CONCURRENCY": str(args.concurrency),
+            "TRANSLATE_PACK_SIZE": str(args.pack_size),
+            "SCHED_CLIENT_RATE": "0",
+        })
+        processes.append(api)
+        base_url = f"http://127.0.0.1:{api_port}"
+        await wait_http(f"{base_url}/readyz", api)
+
+        async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+            report = {
+                "texts": args.texts, "targets": targets, "token_rate": args.token_rate,
+                "prompt_eval_seconds": args.prompt_eval, "ollama_parallel": args.parallel,
+                "concurrency": args.concurrency, "pack_size": args.pack_size,
+                "sequential": await sequential(client, sentences(args.texts, "seq"), targets),
+                "batch": await batch(client, sentences(args.texts, "lot"), targets),
+            }
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    print(json.dumps(report, indent=2))
+    speedup = report["batch"]["per_second"] / report["sequential"]["per_second"]
+    print(f"séquentiel {report['sequential']['per_second']} trad/s  lot {report['batch']['per_second']} trad/s  "
+          f"(x{speedup:.1f}, {report['batch']['prompts']} prompts)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""
+Mémoire utilisée pour préparer le corps du webhook n8n d'une image : ancienne méthode (lecture complète,
+copie base64, dict JSON sérialisé) contre l'encodage en flux de api/services/n8n_upload.py.
+
+    python -m bench.upload_memory --size-mb 10 --concurrency 8
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import tempfile
+import tracemalloc
+
+from api.services.n8n_upload import webhook_body
+
+FIELDS = {"hasAttachment": True, "messageText": "", "timestamp": "2025-01-01T00:00:00", "source": "bench"}
+ATTACHMENT = {"filename": "bench.png", "contentType": "image/png"}
+
+
+async def legacy(path: str) -> int:
+    with open(path, "rb") as f:
+        content = f.read()
+    data = {**FIELDS, "attachments": [{**ATTACHMENT, "content": base64.b64encode(content).decode("utf-8"),
+                                       "size": len(content)}]}
+    return len(json.dumps(data).encode())
+
+
+async def streamed(path: str) -> int:
+    with open(path, "rb") as f:
+        content_length, body = webhook_body(FIELDS, ATTACHMENT, os.path.getsize(path), lambda: f)
+        sent = 0
+        async for chunk in body():
+            sent += len(chunk)
+            await asyncio.sleep(0)  # laisse les autres envois avancer, comme httpx
+    assert sent == content_length
+    return sent
+
+
+async def measure(method, path: str, concurrency: int) -> float:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    await asyncio.gather(*(method(path) for _ in range(concurrency)))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix=".png") as f:
+        f.write(os.urandom(int(args.size_mb * 1024 * 1024)))
+        f.flush()
+
+        # Les deux méthodes produisent exactement le même JSON
+        with open(f.name, "rb") as source:
+            _, body = webhook_body(FIELDS, ATTACHMENT, os.path.getsize(f.name), lambda: source)
+            payload = json.loads(b"".join([chunk async for chunk in body()]))
+        assert base64.b64decode(payload["attachments"][0]["content"]) == open(f.name, "rb").read()
+
+        for name, method in (("ancienne méthode", legacy), ("flux", streamed)):
+            peak = await measure(method, f.name, args.concurrency)
+            print(f"{name:17s} : pic {peak:8.1f} Mo pour {args.concurrency} envois de {args.size_mb} Mo")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
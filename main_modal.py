@@ -1,14 +1,33 @@
+import os
+
 import modal
 
-app = modal.App("example-get-started")
+# Jobs déportés par l'API (api/services/offload.py) quand ses files débordent : transcription Whisper
+# d'un segment, génération d'un prompt de traduction par lot.
+app = modal.App(os.getenv("OFFLOAD_MODAL_APP", "myaibackend-offload"))
+
+image = (
+    modal.Image.debian_slim(python_version="3.13")
+    .pip_install("faster-whisper", "numpy", "httpx")
+    .add_local_python_source("api")
+)
+
 
+@app.function(image=image, cpu=4.0, memory=4096, timeout=600, gpu=os.getenv("OFFLOAD_MODAL_GPU") or None)
+def run_job(job: str, payload: dict):
+    # Le modèle Whisper reste chargé dans le conteneur entre deux appels
+    from api.services.offload import run_job as execute
+    return execute(job, payload)
 
-@app.function()
-def square(x):
-    print("This code is running on a remote worker!")
-    return x**2
 
-##Run with "modal run main_modal.py"
+##Déployer avec "modal deploy main_modal.py", tester avec "modal run main_modal.py"
 @app.local_entrypoint()
 def main():
-    print("the square is", square.remote(42))
\ No newline at end of file
+    import numpy as np
+
+    from api.services.offload import encode_audio
+
+    silence = encode_audio(np.zeros(16000, dtype=np.float32))
+    payload = {"audio": silence, "model_size": os.getenv("ASR_MODEL_SIZE", "small"),
+               "compute_type": os.getenv("ASR_COMPUTE_TYPE", "int8"), "language": os.getenv("ASR_LANGUAGE", "fr")}
+    print("transcription d'une seconde de silence :", repr(run_job.remote("transcribe", payload)))
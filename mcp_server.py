@@ -1,58 +1,61 @@
 import argparse
 import json
-import sys
+import logging
 import time
 import os
+import re
 from typing import Annotated
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
 
-import requests
-from kasa import Discover
+import anyio
+import httpx
 from llama_index.core.tools import ToolMetadata
 from mcp.server import FastMCP
 
+from mcp_tools.email_outbox import EmailOutbox
+from mcp_tools.kasa_registry import KasaRegistry, build_device_map
+from mcp_tools.weather import LocationNotFound, WeatherClient, compact_forecast
+
 load_dotenv()
 
+logger = logging.getLogger("mcp_tools.server")
+
 mcp = FastMCP("discuss")
 
-@mcp.tool("weather", "Get the weather in a location")
-def get_weather(location):
-    API_KEY = os.getenv("OPENWEATHER_API_KEY")
+weather_client = WeatherClient.from_env()
+
+# Mode compact par défaut : seules les prochaines heures et les champs utiles partent dans le contexte du LLM
+WEATHER_COMPACT = os.getenv("WEATHER_COMPACT", "true").casefold() == "true"
+WEATHER_HOURS = int(os.getenv("WEATHER_HOURS", "24"))
+
+@mcp.tool("weather", "Get the weather in a location. Optional: hours (forecast range, default 24), compact (default true)")
+async def get_weather(location: str, hours: int = WEATHER_HOURS, compact: bool = WEATHER_COMPACT):
     """First use geocoding to get the latitude and longitude"""
-    geocoding_url = f"http://api.openweathermap.org/geo/1.0/direct?q={location}&appid={API_KEY}"
-    geocoding_response = requests.get(geocoding_url)
-    geocoding_data = geocoding_response.json()
-    lat = geocoding_data[0]["lat"]
-    lon = geocoding_data[0]["lon"]
-
-    base_url = "http://api.openweathermap.org/data/2.5/forecast"
-    params = {
-        "lat": lat,
-        "lon": lon,
-        "appid": API_KEY,
-        "lang": "fr"  # Get response in French
-    }
     try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
-        data = response.json()
+        lat, lon = await weather_client.geocode(location)
+        data = await weather_client.forecast(lat, lon)
 
-        if data.get("cod") == "200":  # Check if the request was successful
-            result = data["list"]
+        if str(data.get("cod")) == "200":  # Check if the request was successful
+            result = data["list"]  # La météo sur 5 jours par tranche de 3 heures
+            if compact:
+                result = compact_forecast(result, hours)
             return json.dumps({
                 "type": "raw_weather_data",
                 "location": location,
-                "data": result  # C’est une liste, la météo sur 5 jours par tranche de 3 heures
+                "data": result
             })
-        elif data.get("cod") == "404":
+        elif str(data.get("cod")) == "404":
             return f"Désolé, je n'ai pas pu trouver la météo pour {location}. Veuillez vérifier le nom de la ville."
         else:
             return f"Une erreur s'est produite lors de la récupération de la météo pour {location}: {data.get('message', 'Unknown error')}"
 
-    except requests.exceptions.RequestException as e:
+    except LocationNotFound:
+        return f"Désolé, je n'ai pas pu trouver la météo pour {location}. Veuillez vérifier le nom de la ville."
+    except httpx.TimeoutException:
+        return f"L'API météo n'a pas répondu à temps pour {location}."
+    except httpx.HTTPError as e:
         return f"Impossible de se connecter à l'API météo : {e}"
     except json.JSONDecodeError:
         return "Erreur de décodage JSON de la réponse de l'API météo."
@@ -67,93 +70,118 @@ def get_time():
     return f"Le temps est {time.strftime('%H:%M:%S')}"
 
 
-deviceMap = {
-    "salon": os.getenv("KASA_FIRST_DEVICE_IP"),#192.168.1.40
-    "Salon Light": os.getenv("KASA_FIRST_DEVICE_IP"),
-    "Lumière du salon": os.getenv("KASA_FIRST_DEVICE_IP"),
-    "Salon Lumière": os.getenv("KASA_FIRST_DEVICE_IP"),
-    "chambre": os.getenv("KASA_SECOND_DEVICE_IP"),
-    "Room Light": os.getenv("KASA_SECOND_DEVICE_IP"),
-    "Lumière de la chambre": os.getenv("KASA_SECOND_DEVICE_IP"),
-    "Chambre Lumière": os.getenv("KASA_SECOND_DEVICE_IP"),
-}
+deviceMap = build_device_map()
+
+# Appareils découverts et authentifiés une fois, handles réutilisés d'une commande à l'autre
+kasa_registry = KasaRegistry.from_env(deviceMap)
 
-@mcp.tool("home_automation_toggle_device", "Toggle the state of a device (like an electrical outlet), on or off")
+@mcp.tool("home_automation_toggle_device", "Toggle the state of a device (like an electrical outlet), on or off. "
+                                           "device_name can also be a group ('all' / 'toutes les lumières') "
+                                           "or a comma-separated list of devices, switched in parallel")
 async def home_automation_toggle_device(device_name, state):
     #print("Device name : ", device_name)
     #print("State : ", state)
-    dev = await Discover.discover_single(deviceMap[device_name], username=os.getenv("KASA_USERNAME"), password=os.getenv("KASA_PASSWORD"))
-    if state.casefold() == "on":
-        await dev.turn_on()
-    elif state.casefold() == "off":
-        await dev.turn_off()
+    if state.casefold() not in ("on", "off"):
+        return {"result": {"status": "error", "message": f"Unknown state {state}, expected on or off"}}
+    try:
+        results = await kasa_registry.set_state(device_name, state.casefold() == "on")
+    except KeyError as e:
+        return {"result": {"status": "error", "message": f"Unknown device {e}"}}
 
+    failed = {host: result for host, result in results.items() if result != "success"}
     message = {
         "result": {
-            "status": "success",
-            "message": f"{device_name} switched {state.lower()}"
+            "status": "success" if not failed else "error",
+            "message": f"{device_name} switched {state.lower()}" if not failed else f"{device_name}: {failed}"
         }
     }
-    sys.stdout.write(json.dumps(message) + "\n")
-    sys.stdout.flush()
+    # Pas d'écriture sur stdout : c'est le transport MCP en mode stdio
+    logger.debug("Kasa: commande exécutée", extra={"device": device_name, "result": message["result"]})
     return message
 
-@mcp.tool("send_email", "Send an email via Gmail SMTP")
+@mcp.tool("home_automation_status", "Get the on/off state of a device, a group ('all') or a comma-separated list of devices")
+async def home_automation_status(device_name):
+    try:
+        states = await kasa_registry.get_state(device_name)
+    except KeyError as e:
+        return {"result": {"status": "error", "message": f"Unknown device {e}"}}
+    return {"result": {"status": "success", "states": states}}
+
+# Envois en tâche de fond sur une session SMTP gardée ouverte (SMTP_SERVER / SMTP_PORT configurables)
+email_outbox = EmailOutbox.from_env()
+
+EMAIL_ADDRESS = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+@mcp.tool("send_email", "Send an email via Gmail SMTP. The email is queued and sent in the background; "
+                        "use email_status with the returned message_id to check delivery")
 def send_email(to_email: str, subject: str, body: str):
     """
-    Send an email using Gmail SMTP.
+    Queue an email for delivery through Gmail SMTP.
 
     Args:
         to_email: Recipient email address
         subject: Email subject
         body: Email body content
     """
-    # Configuration Gmail SMTP
-    SMTP_SERVER = "smtp.gmail.com"
-    SMTP_PORT = 587
-    GMAIL_USER = os.getenv("GMAIL_USER")
-    GMAIL_APP_PASSWORD = os.getenv("GMAIL_APP_PASSWORD")
+    if not EMAIL_ADDRESS.match(to_email.strip()):
+        return json.dumps({
+            "status": "error",
+            "message": f"Adresse email invalide: {to_email}"
+        })
 
     try:
         # Créer le message
         msg = MIMEMultipart()
-        msg['From'] = GMAIL_USER
-        msg['To'] = to_email
+        msg['From'] = email_outbox.user
+        msg['To'] = to_email.strip()
         msg['Subject'] = subject
 
         # Ajouter le corps du message
         msg.attach(MIMEText(body, 'plain'))
 
-        # Connexion au serveur SMTP
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()  # Activer le chiffrement TLS
-        server.login(GMAIL_USER, GMAIL_APP_PASSWORD)
-
-        # Envoyer l'email
-        server.send_message(msg)
-        server.quit()
+        message_id = email_outbox.enqueue(msg)
 
         return json.dumps({
-            "status": "success",
-            "message": f"Email envoyé avec succès à {to_email}"
+            "status": "queued",
+            "message_id": message_id,
+            "message": f"Email en cours d'envoi à {to_email}"
         })
 
-    except smtplib.SMTPAuthenticationError:
-        return json.dumps({
-            "status": "error",
-            "message": "Erreur d'authentification SMTP. Vérifiez vos identifiants."
-        })
-    except smtplib.SMTPException as e:
-        return json.dumps({
-            "status": "error",
-            "message": f"Erreur SMTP: {str(e)}"
-        })
     except Exception as e:
         return json.dumps({
             "status": "error",
             "message": f"Erreur lors de l'envoi de l'email: {str(e)}"
         })
 
+@mcp.tool("email_status", "Get the delivery status of an email queued by send_email")
+def email_status(message_id: str):
+    status = email_outbox.status(message_id)
+    if status is None:
+        return json.dumps({"status": "error", "message": f"Email inconnu: {message_id}"})
+    return json.dumps(status)
+
+def use_kasa_registry(registry: KasaRegistry):
+    """Mode inprocess : les outils utilisent le registre Kasa de l'API au lieu d'ouvrir leurs propres connexions."""
+    global kasa_registry
+    kasa_registry = registry
+
+async def aclose():
+    """Ferme les clients des outils (météo, SMTP) ; le registre Kasa est fermé par son propriétaire."""
+    await weather_client.aclose()
+    await email_outbox.close()
+
+async def serve(server_type: str):
+    # Découverte Kasa une seule fois au démarrage, avant d'accepter les connexions MCP
+    await kasa_registry.start()
+    try:
+        if server_type == "sse":
+            await mcp.run_sse_async()
+        else:
+            await mcp.run_stdio_async()
+    finally:
+        await kasa_registry.close()
+        await aclose()
+
 if __name__ == "__main__":
     # Start the server
     #print("🚀Starting server... ")
@@ -170,4 +198,4 @@ if __name__ == "__main__":
     )
 
     args = parser.parse_args()
-    mcp.run(args.server_type)
\ No newline at end of file
+    anyio.run(serve, args.server_type)
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+import smtplib
+import time
+import uuid
+from collections import OrderedDict
+from email.message import Message
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Erreurs définitives : inutile de réessayer
+PERMANENT_ERRORS = (smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)
+
+
+class EmailOutbox:
+    """
+    File d'envoi d'emails asynchrone.
+
+    - `enqueue()` retourne immédiatement un identifiant ; l'envoi se fait en tâche de fond
+    - un seul worker garde une session SMTP authentifiée ouverte et l'utilise pour les messages suivants,
+      la session est fermée après `idle_timeout_seconds` sans message
+    - les échecs temporaires sont réessayés avec un backoff exponentiel
+    - le statut de chaque message est consultable via `status()`
+    """
+
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            user: Optional[str],
+            password: Optional[str],
+            starttls: bool = True,
+            max_attempts: int = 5,
+            backoff_seconds: float = 2.0,
+            idle_timeout_seconds: float = 120.0,
+            timeout_seconds: float = 30.0,
+            max_tracked: int = 1000,
+            smtp_factory: Optional[Callable[..., smtplib.SMTP]] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.timeout_seconds = timeout_seconds
+        self.max_tracked = max_tracked
+        self._smtp_factory = smtp_factory or smtplib.SMTP
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._session: Optional[smtplib.SMTP] = None
+        self._messages: dict[str, Message] = {}
+        self._retries: set[asyncio.Task] = set()
+        self._statuses: "OrderedDict[str, dict]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> "EmailOutbox":
+        return cls(
+            host=os.getenv("SMTP_SERVER", "smtp.gmail.com"),
+            port=int(os.getenv("SMTP_PORT", "587")),
+            user=os.getenv("GMAIL_USER"),
+            password=os.getenv("GMAIL_APP_PASSWORD"),
+            starttls=os.getenv("SMTP_STARTTLS", "true").casefold() == "true",
+            max_attempts=int(os.getenv("SMTP_MAX_ATTEMPTS", "5")),
+            idle_timeout_seconds=float(os.getenv("SMTP_IDLE_TIMEOUT_SECONDS", "120")),
+        )
+
+    def _ensure_worker(self):
+        # Créé à la première utilisation, dans la boucle d'événements du serveur MCP
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    def _set_status(self, message_id: str, **fields):
+        entry = self._statuses.setdefault(message_id, {"message_id": message_id})
+        entry.update(fields, updated_at=time.time())
+        self._statuses.move_to_end(message_id)
+        while len(self._statuses) > self.max_tracked:
+            old_id, _ = self._statuses.popitem(last=False)
+            self._messages.pop(old_id, None)
+
+    def enqueue(self, message: Message) -> str:
+        self._ensure_worker()
+        message_id = uuid.uuid4().hex
+        self._messages[message_id] = message
+        self._set_status(message_id, status="queued", to=message["To"], subject=message["Subject"], attempts=0,
+                         error=None)
+        self._queue.put_nowait(message_id)
+        return message_id
+
+    def status(self, message_id: str) -> Optional[dict]:
+        entry = self._statuses.get(message_id)
+        return dict(entry) if entry else None
+
+    # --- session SMTP (appelée dans un thread, jamais en parallèle) ---
+
+    def _open_session(self) -> smtplib.SMTP:
+        session = self._smtp_factory(self.host, self.port, timeout=self.timeout_seconds)
+        if self.starttls:
+            session.starttls()  # Activer le chiffrement TLS
+        if self.user:
+            session.login(self.user, self.password)
+        return session
+
+    def _session_alive(self) -> bool:
+        try:
+            return self._session is not None and self._session.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def _send_sync(self, message: Message):
+        if not self._session_alive():
+            self._close_sync()
+            self._session = self._open_session()
+        try:
+            self._session.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self._close_sync()
+            raise
+        except smtplib.SMTPException:
+            # Refus propre au message (destinataire, DATA) : smtplib a fait un RSET, la session reste utilisable.
+            # SMTPException hérite d'OSError, d'où ce cas avant celui des erreurs de connexion
+            raise
+        except OSError:
+            self._close_sync()  # socket coupé, timeout
+            raise
+
+    def _close_sync(self):
+        session, self._session = self._session, None
+        if session is not None:
+            try:
+                session.quit()
+            except Exception:
+                pass
+
+    # --- worker ---
+
+    async def _retry_later(self, message_id: str, delay: float):
+        await asyncio.sleep(delay)
+        self._queue.put_nowait(message_id)
+
+    async def _run(self):
+        while True:
+            try:
+                message_id = await asyncio.wait_for(self._queue.get(), timeout=self.idle_timeout_seconds)
+            except asyncio.TimeoutError:
+                await asyncio.to_thread(self._close_sync)
+                continue
+
+            message = self._messages.get(message_id)
+            if message is None:
+                continue
+            attempts = self._statuses[message_id]["attempts"] + 1
+            self._set_status(message_id, status="sending", attempts=attempts)
+            try:
+                await asyncio.to_thread(self._send_sync, message)
+            except PERMANENT_ERRORS as e:
+                self._set_status(message_id, status="failed", error=str(e))
+                self._messages.pop(message_id, None)
+            except Exception as e:
+                if attempts >= self.max_attempts:
+                    self._set_status(message_id, status="failed", error=str(e))
+                    self._messages.pop(message_id, None)
+                else:
+                    delay = self.backoff_seconds * 2 ** (attempts - 1)
+                    self._set_status(message_id, status="retrying", error=str(e), retry_in_seconds=delay)
+                    retry = asyncio.create_task(self._retry_later(message_id, delay))
+                    self._retries.add(retry)
+                    retry.add_done_callback(self._retries.discard)
+                logger.warning("Envoi email échoué", extra={"message_id": message_id, "attempt": attempts, "error": str(e)})
+            else:
+                self._set_status(message_id, status="sent", error=None)
+                self._messages.pop(message_id, None)
+
+    async def close(self):
+        for task in [self._worker, *self._retries]:
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        await asyncio.to_thread(self._close_sync)
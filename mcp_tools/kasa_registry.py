@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def stale_errors() -> tuple:
+    """Erreurs qui indiquent une connexion périmée : on se reconnecte et on réessaie une fois."""
+    # python-kasa n'est importé qu'au premier usage (import lent, inutile tant qu'aucun appareil n'est piloté)
+    from kasa import KasaException
+    return KasaException, OSError, asyncio.TimeoutError
+
+
+def build_device_map() -> dict:
+    first = os.getenv("KASA_FIRST_DEVICE_IP")  # 192.168.1.40
+    second = os.getenv("KASA_SECOND_DEVICE_IP")
+    return {
+        "salon": first,
+        "Salon Light": first,
+        "Lumière du salon": first,
+        "Salon Lumière": first,
+        "chambre": second,
+        "Room Light": second,
+        "Lumière de la chambre": second,
+        "Chambre Lumière": second,
+    }
+
+
+def build_groups(device_map: dict) -> dict:
+    hosts = sorted({host for host in device_map.values() if host})
+    return {name: hosts for name in ("all", "tout", "lumières", "toutes les lumières", "lights", "all lights")}
+
+
+class DeviceHandle:
+    def __init__(self, host: str):
+        self.host = host
+        self.device = None
+        self.lock = asyncio.Lock()
+        self.is_on: Optional[bool] = None
+        self.updated_at = 0.0
+        self.last_error: Optional[str] = None
+
+
+class KasaRegistry:
+    """
+    Registre des appareils Kasa construit sur deviceMap.
+
+    - découverte et authentification une seule fois (au démarrage ou au premier usage)
+    - handles `kasa` conservés et réutilisés, reconnexion quand une commande échoue sur une connexion périmée
+    - état (allumé/éteint) mis en cache, rafraîchi au-delà de `state_ttl_seconds`
+    - commandes de groupe/lot exécutées en parallèle sur les appareils
+    """
+
+    def __init__(
+            self,
+            device_map: dict,
+            groups: Optional[dict] = None,
+            username: Optional[str] = None,
+            password: Optional[str] = None,
+            connect: Optional[Callable[[str], Awaitable]] = None,
+            state_ttl_seconds: float = 30.0,
+    ):
+        self.device_map = device_map
+        self.groups = groups if groups is not None else build_groups(device_map)
+        self.username = username
+        self.password = password
+        self.state_ttl_seconds = state_ttl_seconds
+        self._connect_fn = connect or self._discover
+        self._handles = {host: DeviceHandle(host) for host in set(device_map.values()) if host}
+        self._names = {name.casefold(): host for name, host in device_map.items() if host}
+        self._groups = {name.casefold(): hosts for name, hosts in self.groups.items()}
+
+    @classmethod
+    def from_env(cls, device_map: Optional[dict] = None) -> "KasaRegistry":
+        return cls(
+            device_map if device_map is not None else build_device_map(),
+            username=os.getenv("KASA_USERNAME"),
+            password=os.getenv("KASA_PASSWORD"),
+            state_ttl_seconds=float(os.getenv("KASA_STATE_TTL_SECONDS", "30")),
+        )
+
+    async def _discover(self, host: str):
+        from kasa import Discover, KasaException
+
+        device = await Discover.discover_single(host, username=self.username, password=self.password)
+        if device is None:
+            raise KasaException(f"Appareil introuvable: {host}")
+        return device
+
+    async def _connect(self, handle: DeviceHandle):
+        handle.device = await self._connect_fn(handle.host)
+        await handle.device.update()
+        handle.is_on = handle.device.is_on
+        handle.updated_at = time.monotonic()
+        handle.last_error = None
+
+    async def _drop(self, handle: DeviceHandle):
+        device, handle.device = handle.device, None
+        if device is not None:
+            try:
+                await device.disconnect()
+            except Exception:
+                pass
+
+    async def start(self):
+        """Découvre et authentifie tous les appareils en parallèle ; les échecs seront retentés au premier usage."""
+
+        async def connect(handle: DeviceHandle):
+            async with handle.lock:
+                if handle.device is not None:
+                    return
+                try:
+                    await self._connect(handle)
+                except Exception as e:
+                    handle.last_error = str(e)
+                    # stderr : stdout sert de transport au serveur MCP en mode stdio
+                    logger.warning("Kasa: connexion impossible", extra={"host": handle.host, "error": str(e)})
+
+        await asyncio.gather(*(connect(handle) for handle in self._handles.values()))
+
+    async def close(self):
+        await asyncio.gather(*(self._drop(handle) for handle in self._handles.values()))
+
+    def resolve(self, target: str) -> list[str]:
+        """Nom d'appareil, nom de groupe, ou liste séparée par des virgules -> liste d'hôtes."""
+        hosts: list[str] = []
+        for part in (p.strip().casefold() for p in target.split(",")):
+            if part in self._names:
+                candidates = [self._names[part]]
+            elif part in self._groups:
+                candidates = self._groups[part]
+            else:
+                raise KeyError(part)
+            hosts.extend(host for host in candidates if host not in hosts)
+        return hosts
+
+    async def _run(self, host: str, operation: Callable[[object], Awaitable]):
+        handle = self._handles[host]
+        async with handle.lock:
+            for attempt in range(2):
+                try:
+                    if handle.device is None:
+                        await self._connect(handle)
+                    return await operation(handle.device)
+                except stale_errors() as e:
+                    handle.last_error = str(e)
+                    await self._drop(handle)
+                    if attempt:
+                        raise
+
+    async def set_host_state(self, host: str, on: bool):
+        handle = self._handles[host]
+
+        async def apply(device):
+            await (device.turn_on() if on else device.turn_off())
+
+        await self._run(host, apply)
+        handle.is_on = on
+        handle.updated_at = time.monotonic()
+
+    async def set_state(self, target: str, on: bool) -> dict:
+        """Allume/éteint un appareil ou un groupe ; les appareils sont commandés en parallèle."""
+        hosts = self.resolve(target)
+        results = await asyncio.gather(*(self.set_host_state(host, on) for host in hosts), return_exceptions=True)
+        return {
+            host: "success" if not isinstance(result, BaseException) else f"error: {result}"
+            for host, result in zip(hosts, results)
+        }
+
+    async def get_state(self, target: str, refresh: bool = False) -> dict:
+        hosts = self.resolve(target)
+
+        async def state(host: str):
+            handle = self._handles[host]
+            if refresh or handle.is_on is None or time.monotonic() - handle.updated_at > self.state_ttl_seconds:
+                async def update(device):
+                    await device.update()
+                    return device.is_on
+
+                handle.is_on = await self._run(host, update)
+                handle.updated_at = time.monotonic()
+            return handle.is_on
+
+        results = await asyncio.gather(*(state(host) for host in hosts), return_exceptions=True)
+        return {host: None if isinstance(result, BaseException) else result for host, result in zip(hosts, results)}
+
+    def stats(self) -> dict:
+        return {
+            host: {"connected": handle.device is not None, "is_on": handle.is_on, "last_error": handle.last_error}
+            for host, handle in self._handles.items()
+        }
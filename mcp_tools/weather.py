@@ -0,0 +1,111 @@
+import os
+from typing import Optional
+
+import httpx
+
+from mcp_tools.ttl_cache import TTLCache
+
+GEOCODING_URL = "http://api.openweathermap.org/geo/1.0/direct"
+FORECAST_URL = "http://api.openweathermap.org/data/2.5/forecast"
+
+
+class LocationNotFound(Exception):
+    pass
+
+
+class WeatherClient:
+    """
+    Accès OpenWeatherMap asynchrone : client HTTP poolé avec timeouts,
+    cache long pour le géocodage (ville -> lat/lon), cache court pour les prévisions (par coordonnées).
+    """
+
+    def __init__(self, api_key: Optional[str], geocoding_ttl_seconds: float = 7 * 24 * 3600,
+                 forecast_ttl_seconds: float = 600, timeout_seconds: float = 10.0):
+        self.api_key = api_key
+        self.timeout_seconds = timeout_seconds
+        self.geocoding_cache = TTLCache(geocoding_ttl_seconds, max_entries=1024)
+        self.forecast_cache = TTLCache(forecast_ttl_seconds, max_entries=256)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def from_env(cls) -> "WeatherClient":
+        return cls(
+            api_key=os.getenv("OPENWEATHER_API_KEY"),
+            geocoding_ttl_seconds=float(os.getenv("WEATHER_GEOCODING_TTL_SECONDS", str(7 * 24 * 3600))),
+            forecast_ttl_seconds=float(os.getenv("WEATHER_FORECAST_TTL_SECONDS", "600")),
+            timeout_seconds=float(os.getenv("WEATHER_TIMEOUT_SECONDS", "10")),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Créé à la première utilisation, dans la boucle d'événements du serveur MCP
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout_seconds, connect=5.0),
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+            )
+        return self._client
+
+    async def geocode(self, location: str) -> tuple[float, float]:
+        key = " ".join(location.split()).casefold()
+        cached = self.geocoding_cache.get(key)
+        if cached is not None:
+            return cached
+
+        response = await self.client.get(GEOCODING_URL, params={"q": location, "limit": 1, "appid": self.api_key})
+        response.raise_for_status()
+        results = response.json()
+        if not results:
+            raise LocationNotFound(location)
+        coordinates = (results[0]["lat"], results[0]["lon"])
+        self.geocoding_cache.set(key, coordinates)
+        return coordinates
+
+    async def forecast(self, lat: float, lon: float) -> dict:
+        # Les coordonnées arrondies (~1 km) suffisent pour partager les prévisions entre requêtes
+        key = (round(lat, 2), round(lon, 2))
+        cached = self.forecast_cache.get(key)
+        if cached is not None:
+            return cached
+
+        response = await self.client.get(
+            FORECAST_URL, params={"lat": lat, "lon": lon, "appid": self.api_key, "lang": "fr"}
+        )
+        response.raise_for_status()
+        data = response.json()
+        if str(data.get("cod")) == "200":
+            self.forecast_cache.set(key, data)
+        return data
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {"geocoding": self.geocoding_cache.stats(), "forecast": self.forecast_cache.stats()}
+
+
+def compact_forecast(entries: list, hours: int) -> list:
+    """
+    Réduit la liste 5 jours / 3 heures aux `hours` prochaines heures et aux champs utiles,
+    en gardant la structure OpenWeatherMap (dt, main, weather, wind, pop) attendue par le client.
+    """
+    if hours <= 0 or not entries:
+        return []
+    limit = entries[0]["dt"] + hours * 3600
+    compact = []
+    for entry in entries:
+        if entry["dt"] >= limit:
+            break
+        main = entry.get("main", {})
+        weather = entry.get("weather") or [{}]
+        compact.append({
+            "dt": entry["dt"],
+            "dt_txt": entry.get("dt_txt"),
+            "main": {key: main[key] for key in ("temp", "feels_like", "temp_min", "temp_max", "humidity") if key in main},
+            "weather": [{key: weather[0][key] for key in ("main", "description", "icon") if key in weather[0]}],
+            "wind": {"speed": entry.get("wind", {}).get("speed")},
+            "pop": entry.get("pop"),
+        })
+    return compact
@@ -1,7 +1,12 @@
 #!/bin/bash
 
+# Modèles à télécharger et précharger (séparés par des espaces)
+OLLAMA_PRELOAD_MODELS="${OLLAMA_PRELOAD_MODELS:-mistral-small:latest}"
+OLLAMA_KEEP_ALIVE="${OLLAMA_KEEP_ALIVE:-30m}"
+
 # Lancer le serveur Ollama
 ollama serve &
+SERVER_PID=$!
 
 # Attendre que le serveur soit prêt
 until curl -s http://localhost:11434 > /dev/null; do
@@ -9,9 +14,16 @@ until curl -s http://localhost:11434 > /dev/null; do
   sleep 1
 done
 
-# Charger le modèle (déclenche le téléchargement si absent)
-echo "Préchargement du modèle mistral-small:latest..."
-ollama run mistral-small:latest --verbose
+for MODEL in $OLLAMA_PRELOAD_MODELS; do
+  # Téléchargement si absent (non interactif)
+  echo "Téléchargement du modèle $MODEL..."
+  ollama pull "$MODEL"
+
+  # Chargement en mémoire sans génération (prompt vide) ; l'API entretient ensuite la résidence du modèle
+  echo "Préchargement du modèle $MODEL..."
+  curl -s http://localhost:11434/api/generate \
+    -d "{\"model\": \"$MODEL\", \"prompt\": \"\", \"stream\": false, \"keep_alive\": \"$OLLAMA_KEEP_ALIVE\"}" > /dev/null
+done
 
 # Garde le container en vie
-wait
+wait $SERVER_PID
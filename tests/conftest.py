@@ -0,0 +1,20 @@
+import asyncio
+
+import pytest
+
+
+async def _wait_status(queue, item_id: str, *statuses: str, timeout: float = 5.0) -> dict:
+    """Attend qu'un job / message de `queue` (méthode status(id)) atteigne l'un des `statuses`."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        status = queue.status(item_id)
+        if status["status"] in statuses:
+            return status
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"statut {queue.status(item_id)} au lieu de {statuses}")
+
+
+@pytest.fixture
+def wait_status():
+    """File d'envoi en tâche de fond (EmailOutbox, WebhookQueue) : attente d'un statut."""
+    return _wait_status
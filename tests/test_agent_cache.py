@@ -0,0 +1,94 @@
+import asyncio
+from types import SimpleNamespace
+
+from api.services import metrics
+from api.services.agent_cache import AgentCache
+
+
+def tool(name: str, description: str = "") -> SimpleNamespace:
+    metadata = SimpleNamespace(name=name, description=description, get_parameters_dict=lambda: {"type": "object"})
+    return SimpleNamespace(metadata=metadata)
+
+
+class FakeMcp:
+    """Serveur MCP simulé : liste d'outils modifiable, appels comptés, réponse retardable."""
+
+    def __init__(self, *names: str, delay: float = 0.0):
+        self.tools = [tool(name) for name in names]
+        self.delay = delay
+        self.listed = 0
+        self.built: list[list[str]] = []
+
+    async def list_tools(self) -> list:
+        self.listed += 1
+        await asyncio.sleep(self.delay)
+        return list(self.tools)
+
+    def build_agent(self, tools: list) -> str:
+        self.built.append([t.metadata.name for t in tools])
+        return f"agent-{len(self.built)}"
+
+
+def cache(mcp: FakeMcp, ttl_seconds: float = 300.0) -> AgentCache:
+    return AgentCache(mcp.list_tools, mcp.build_agent, ttl_seconds=ttl_seconds, poll_interval_seconds=0)
+
+
+def served(status: str) -> float:
+    return metrics.AGENT_CACHE_TOTAL._values.get((status,), 0.0)
+
+
+def test_concurrent_first_calls_build_once():
+    mcp = FakeMcp("meteo", delay=0.05)
+    agents = cache(mcp)
+    before = {status: served(status) for status in ("hit", "rebuild")}
+
+    async def scenario():
+        return await asyncio.gather(*(agents.get() for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert mcp.listed == 1 and mcp.built == [["meteo"]]
+    assert sorted(status for _, status in results) == ["hit"] * 4 + ["rebuild"]
+    assert {agent for agent, _ in results} == {"agent-1"}
+    assert served("rebuild") - before["rebuild"] == 1 and served("hit") - before["hit"] == 4
+
+
+def test_expired_agent_is_served_stale_while_refreshing():
+    mcp = FakeMcp("meteo")
+    agents = cache(mcp, ttl_seconds=0.05)
+    before = served("stale")
+
+    async def scenario():
+        assert await agents.get() == ("agent-1", "rebuild")
+        assert await agents.get() == ("agent-1", "hit")
+        await asyncio.sleep(0.06)
+        assert await agents.get() == ("agent-1", "stale")
+        await agents._refresh_task
+        # Mêmes outils : agent conservé, durée de vie prolongée
+        assert await agents.get() == ("agent-1", "hit")
+
+    asyncio.run(scenario())
+    assert mcp.listed == 2 and len(mcp.built) == 1
+    assert agents.counters["background_refresh"] == 1 and agents.counters["background_rebuild"] == 0
+    assert served("stale") - before == 1
+
+
+def test_tool_change_rebuilds_the_agent():
+    mcp = FakeMcp("meteo")
+    agents = cache(mcp, ttl_seconds=0.05)
+
+    async def scenario():
+        await agents.get()
+        mcp.tools.append(tool("email"))
+        await asyncio.sleep(0.06)
+        assert await agents.get() == ("agent-1", "stale")
+        await agents._refresh_task
+        assert await agents.get() == ("agent-2", "hit")
+        # Description modifiée : même nom, mais signature différente
+        mcp.tools[0] = tool("meteo", "Prévisions sur 7 jours")
+        assert await agents.refresh() is True
+        assert await agents.refresh() is False
+
+    asyncio.run(scenario())
+    assert mcp.built == [["meteo"], ["meteo", "email"], ["meteo", "email"]]
+    assert agents.counters["background_rebuild"] == 1
+    assert agents.stats()["tools"] == ["meteo", "email"]
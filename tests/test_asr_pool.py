@@ -0,0 +1,154 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from api.services.asr_pool import AsrQueueFull, AsrWorkerPool
+
+
+class FakeWorker:
+    """Worker Whisper simulé : « transcrit » chaque segment par son étiquette, bloquable pour remplir la file."""
+
+    def __init__(self):
+        self.busy = False
+        self.batches: list[list[str]] = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def load(self):
+        pass
+
+    async def run(self, audios: list[np.ndarray], beam_size: int) -> list[str]:
+        labels = [LABELS[int(audio[0])] for audio in audios]
+        self.batches.append(labels)
+        await self.gate.wait()
+        return labels
+
+    def shutdown(self):
+        pass
+
+
+LABELS: list[str] = []
+
+
+def segment(label: str) -> np.ndarray:
+    LABELS.append(label)
+    return np.full(160, len(LABELS) - 1, dtype=np.float32)
+
+
+async def pool(**kwargs) -> tuple[AsrWorkerPool, FakeWorker]:
+    asr = AsrWorkerPool(**({"workers": 1, "batch_wait_ms": 0} | kwargs))
+    worker = FakeWorker()
+    asr.workers = [worker]
+    await asr.start()
+    return asr, worker
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_sessions_are_served_round_robin():
+    async def scenario():
+        asr, worker = await pool(max_batch=1)
+        worker.gate.clear()
+        first = asyncio.create_task(asr.transcribe(segment("a1"), "a"))
+        await settle()
+        # Pendant que a1 occupe le worker : une session bavarde puis deux autres
+        jobs = [asyncio.create_task(asr.transcribe(segment(label), label[0])) for label in ("a2", "a3", "b1", "c1")]
+        await settle()
+        worker.gate.set()
+        assert await asyncio.gather(first, *jobs) == ["a1", "a2", "a3", "b1", "c1"]
+        assert worker.batches == [["a1"], ["a2"], ["b1"], ["c1"], ["a3"]]
+        await asr.stop()
+
+    asyncio.run(scenario())
+
+
+def test_segments_of_different_sessions_are_batched():
+    async def scenario():
+        asr, worker = await pool(max_batch=3)
+        worker.gate.clear()
+        first = asyncio.create_task(asr.transcribe(segment("x"), "x"))
+        await settle()
+        jobs = [asyncio.create_task(asr.transcribe(segment(f"{s}1"), s)) for s in "abcd"]
+        await settle()
+        worker.gate.set()
+        await asyncio.gather(first, *jobs)
+        assert worker.batches == [["x"], ["a1", "b1", "c1"], ["d1"]]
+        assert asr.stats()["avg_batch_size"] == round(5 / 3, 2)
+        await asr.stop()
+
+    asyncio.run(scenario())
+
+
+def test_full_batch_does_not_wait_but_short_batch_does():
+    async def scenario():
+        asr, worker = await pool(max_batch=2, batch_wait_ms=300)
+        started = time.perf_counter()
+        first = asyncio.create_task(asr.transcribe(segment("a"), "a"))
+        await asyncio.sleep(0.02)
+        # Le deuxième segment complète le lot : la fenêtre d'attente est écourtée
+        await asyncio.gather(first, asr.transcribe(segment("b"), "b"))
+        assert time.perf_counter() - started < 0.2
+        assert worker.batches == [["a", "b"]]
+
+        started = time.perf_counter()
+        await asr.transcribe(segment("c"), "c")
+        assert time.perf_counter() - started >= 0.25  # seul : attend d'autres sessions
+        await asr.stop()
+
+    asyncio.run(scenario())
+
+
+def test_partials_are_refused_when_the_queue_is_full():
+    async def scenario():
+        asr, worker = await pool(max_batch=1, max_queue=2, max_pending_per_session=1)
+        worker.gate.clear()
+        running = asyncio.create_task(asr.transcribe(segment("a1"), "a"))
+        await settle()
+        queued = asyncio.create_task(asr.transcribe(segment("a2"), "a"))
+        await settle()
+
+        with pytest.raises(AsrQueueFull):  # file de la session pleine
+            await asr.transcribe(segment("a3"), "a", wait=False)
+        other = asyncio.create_task(asr.transcribe(segment("b1"), "b", wait=False))
+        await settle()
+        with pytest.raises(AsrQueueFull):  # file globale pleine
+            await asr.transcribe(segment("c1"), "c", wait=False)
+        assert asr.counters["rejected"] == 2
+
+        # Une transcription finale attend au lieu d'être refusée
+        final = asyncio.create_task(asr.transcribe(segment("c2"), "c"))
+        await settle()
+        assert not final.done() and asr.queue_depth() == 2
+        worker.gate.set()
+        assert await asyncio.gather(running, queued, other, final) == ["a1", "a2", "b1", "c2"]
+        await asr.stop()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_job_frees_space_for_waiting_producers():
+    async def scenario():
+        asr, worker = await pool(max_batch=1, max_queue=1)
+        worker.gate.clear()
+        running = asyncio.create_task(asr.transcribe(segment("a1"), "a"))
+        await settle()
+        queued = asyncio.create_task(asr.transcribe(segment("b1"), "b"))
+        await settle()
+        waiting = asyncio.create_task(asr.transcribe(segment("c1"), "c"))
+        await settle()
+        assert asr.queue_depth() == 1 and "c" not in asr._sessions
+
+        queued.cancel()
+        await settle()
+        # Sans notification, c1 resterait bloqué jusqu'à la fin de a1
+        assert "c" in asr._sessions and asr.queue_depth() == 1
+        worker.gate.set()
+        assert await asyncio.gather(running, waiting) == ["a1", "c1"]
+        await asr.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,141 @@
+import asyncio
+import re
+
+from api.services.batch_translation import BatchTranslator, parse_packed
+from api.services.translation_cache import TranslationCache, cache_key
+
+MODEL = "test-model"
+PACKED_INPUT = re.compile(r"^\[(\d+)\] (.*)$", re.M)
+SINGLE_INPUT = re.compile(r"la phrase en '[^']*' : \"(.*)\"\.\n")
+
+
+def reply(text: str) -> str:
+    return f"{text.upper()}|||FRANÇAIS|||Explication de {text}|||{text}"
+
+
+class FakeOllama:
+    """`complete` simulé : répond aux prompts groupés ligne par ligne et aux prompts simples."""
+
+    def __init__(self, omit=(), fail=(), delay: float = 0.0):
+        self.omit = set(omit)  # phrases absentes de la réponse groupée
+        self.fail = set(fail)  # phrases dont la traduction seule échoue
+        self.delay = delay
+        self.prompts: list[list[str]] = []  # phrases de chaque prompt
+        self.cancelled = 0
+
+    async def complete(self, prompt: str) -> str:
+        packed = PACKED_INPUT.findall(prompt)
+        texts = [text for _, text in packed] or [SINGLE_INPUT.search(prompt).group(1)]
+        self.prompts.append(texts)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if not packed:
+            if texts[0] in self.fail:
+                raise ConnectionError(f"Ollama injoignable pour {texts[0]}")
+            return reply(texts[0])
+        return "\n".join(f"[{number}] {reply(text)}" for number, text in packed if text not in self.omit)
+
+
+def translator(ollama: FakeOllama, cache: TranslationCache = None, **kwargs) -> BatchTranslator:
+    return BatchTranslator(ollama.complete, cache or TranslationCache(), MODEL, **kwargs)
+
+
+def run(batch: BatchTranslator, texts: list[str], target_langs=("anglais",)) -> tuple[dict, dict]:
+    async def collect():
+        return [event async for event in batch.run("français", list(target_langs), texts)]
+
+    events = asyncio.run(collect())
+    assert events[-1]["type"] == "done"
+    return {(e["index"], e["target_lang"]): e for e in events[:-1]}, events[-1]
+
+
+def test_parse_packed_skips_bad_lines():
+    text = "\n".join([
+        "[1] HELLO|||FRANÇAIS|||Salutation|||Bonjour",
+        "[1] DOUBLON|||FRANÇAIS|||x|||y",  # doublon : la première ligne est gardée
+        "[3] Trop court|||FRANÇAIS",  # séparateurs manquants
+        "[0] Hors limites|||A|||B|||C",
+        "[5] Hors limites|||A|||B|||C",
+        "Ligne sans numéro",
+        "  [4]   |||FRANÇAIS|||Vide|||",  # traduction vide
+        "  [2] WORLD ||| FRANÇAIS ||| Nom ||| Monde",
+    ])
+    parsed = parse_packed(text, 4)
+    assert sorted(parsed) == [0, 1]
+    assert parsed[0] == {"translation": "HELLO", "language": "FRANÇAIS", "explanation": "Salutation",
+                         "correction": "Bonjour"}
+    assert parsed[1]["translation"] == "WORLD" and parsed[1]["correction"] == "Monde"
+
+
+def test_short_texts_are_packed_and_missing_entries_fall_back_to_single_prompts():
+    ollama = FakeOllama(omit={"Salut"})
+    batch = translator(ollama, pack_size=8)
+    results, summary = run(batch, ["Bonjour", "Salut", "Merci"])
+    assert ollama.prompts == [["Bonjour", "Salut", "Merci"], ["Salut"]]
+    assert [results[(i, "anglais")]["translation"] for i in range(3)] == ["BONJOUR", "SALUT", "MERCI"]
+    assert summary["prompts"] == 2 and summary["errors"] == 0
+    assert batch.counters["unpacked_fallbacks"] == 1 and batch.counters["packed_prompts"] == 1
+
+
+def test_long_texts_are_translated_alone():
+    ollama = FakeOllama()
+    long_text = "Une phrase " + "très " * 40 + "longue"
+    results, _ = run(translator(ollama, pack_max_chars=50), ["Court", long_text])
+    assert sorted(ollama.prompts) == sorted([["Court"], [long_text]])
+    assert results[(1, "anglais")]["translation"] == long_text.upper()
+
+
+def test_repeated_texts_are_translated_once():
+    ollama = FakeOllama()
+    results, summary = run(translator(ollama), ["Bonjour", "Salut", "Bonjour"], ["anglais", "espagnol"])
+    assert ollama.prompts == [["Bonjour", "Salut"], ["Bonjour", "Salut"]]  # un prompt par langue
+    assert results[(0, "espagnol")]["translation"] == results[(2, "espagnol")]["translation"] == "BONJOUR"
+    assert summary["results"] == 6
+
+
+def test_cached_entries_are_replayed_without_generation():
+    cache = TranslationCache()
+    cached = {"translation": "HELLO (cache)", "language": "FRANÇAIS", "explanation": "", "correction": ""}
+    asyncio.run(cache.set(cache_key(MODEL, "français", "anglais", "Bonjour"), cached))
+    ollama = FakeOllama()
+    results, summary = run(translator(ollama, cache), ["Bonjour", "Merci"])
+    assert results[(0, "anglais")]["cached"] and results[(0, "anglais")]["translation"] == "HELLO (cache)"
+    assert not results[(1, "anglais")]["cached"]
+    assert ollama.prompts == [["Merci"]] and summary["cached"] == 1
+
+    # Le deuxième lot est entièrement servi par le cache
+    results, summary = run(translator(ollama, cache), ["Merci", "Bonjour"])
+    assert summary["cached"] == 2 and len(ollama.prompts) == 1
+
+
+def test_failed_fallback_keeps_the_other_results():
+    ollama = FakeOllama(omit={"Salut"}, fail={"Salut"})
+    cache = TranslationCache()
+    results, summary = run(translator(ollama, cache), ["Bonjour", "Salut", "Merci"])
+    assert results[(0, "anglais")]["translation"] == "BONJOUR"
+    assert results[(2, "anglais")]["translation"] == "MERCI"
+    assert results[(1, "anglais")]["error"].startswith("ConnectionError")
+    assert summary["errors"] == 1 and summary["results"] == 2
+    # Seules les traductions réussies sont mises en cache
+    assert asyncio.run(cache.get(cache_key(MODEL, "français", "anglais", "Salut"))) is None
+    assert asyncio.run(cache.get(cache_key(MODEL, "français", "anglais", "Merci")))["translation"] == "MERCI"
+
+
+def test_disconnect_cancels_pending_generations():
+    ollama = FakeOllama(delay=10)
+    batch = translator(ollama, pack_size=1, concurrency=4)
+
+    async def scenario():
+        events = batch.run("français", ["anglais"], ["Un", "Deux", "Trois"])
+        waiting = asyncio.create_task(anext(events))
+        await asyncio.sleep(0.05)
+        assert len(ollama.prompts) == 3
+        waiting.cancel()  # client parti pendant l'attente du premier résultat
+        await asyncio.gather(waiting, return_exceptions=True)
+        await events.aclose()
+
+    asyncio.run(scenario())
+    assert ollama.cancelled == 3
@@ -0,0 +1,13 @@
+import pytest
+
+from api.services.config import parse_seconds
+
+
+def test_parse_seconds():
+    assert parse_seconds("voice=10, batch=600 ,weather=2.5,") == {"voice": 10.0, "batch": 600.0, "weather": 2.5}
+    assert parse_seconds("") == {}
+
+
+def test_parse_seconds_rejects_missing_values():
+    with pytest.raises(ValueError):
+        parse_seconds("voice")
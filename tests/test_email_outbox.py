@@ -0,0 +1,168 @@
+import asyncio
+import json
+import socket
+from email.message import EmailMessage
+
+import pytest
+from aiosmtpd.controller import Controller
+
+import mcp_server
+from mcp_tools.email_outbox import EmailOutbox
+
+
+class StandInHandler:
+    """Serveur SMTP local : enregistre les messages, peut refuser un destinataire ou échouer temporairement."""
+
+    def __init__(self):
+        self.received: list[str] = []
+        self.temporary_failures = 0  # nombre de DATA refusés avec un 451
+        self.refused = {"inconnu@example.com"}
+        self.connections = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refused:
+            return "550 5.1.1 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.temporary_failures:
+            self.temporary_failures -= 1
+            return "451 4.3.0 Try again later"
+        self.received.append(envelope.content.decode())
+        return "250 Message accepted"
+
+
+@pytest.fixture
+def smtp():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    handler = StandInHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    yield handler, port
+    controller.stop()
+
+
+def outbox(port: int) -> EmailOutbox:
+    return EmailOutbox("127.0.0.1", port, user=None, password=None, starttls=False, max_attempts=3,
+                       backoff_seconds=0.05, timeout_seconds=5)
+
+
+def message(to: str, subject: str = "Test") -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = "myai@example.com"
+    msg["To"] = to
+    msg["Subject"] = subject
+    msg.set_content("Bonjour")
+    return msg
+
+
+def test_queued_then_sent_on_one_reused_session(smtp, wait_status):
+    handler, port = smtp
+
+    async def scenario():
+        box = outbox(port)
+        ids = [box.enqueue(message("alice@example.com", f"Message {i}")) for i in range(3)]
+        assert box.status(ids[0])["status"] == "queued"
+        for message_id in ids:
+            status = await wait_status(box, message_id, "sent")
+            assert status["attempts"] == 1 and status["error"] is None
+        await box.close()
+
+    asyncio.run(scenario())
+    assert len(handler.received) == 3
+    assert handler.connections == 1  # session SMTP gardée ouverte entre les messages
+
+
+def test_temporary_failure_is_retried(smtp, wait_status):
+    handler, port = smtp
+    handler.temporary_failures = 1
+
+    async def scenario():
+        box = outbox(port)
+        message_id = box.enqueue(message("alice@example.com"))
+        retrying = await wait_status(box, message_id, "retrying")
+        assert "451" in retrying["error"]
+        sent = await wait_status(box, message_id, "sent")
+        assert sent["attempts"] == 2
+        await box.close()
+
+    asyncio.run(scenario())
+    assert len(handler.received) == 1
+
+
+def test_temporary_failures_give_up_after_max_attempts(smtp, wait_status):
+    handler, port = smtp
+    handler.temporary_failures = 10
+
+    async def scenario():
+        box = outbox(port)
+        message_id = box.enqueue(message("alice@example.com"))
+        failed = await wait_status(box, message_id, "failed")
+        assert failed["attempts"] == 3
+        await box.close()
+
+    asyncio.run(scenario())
+    assert handler.received == []
+
+
+def test_refused_recipient_fails_without_retry(smtp, wait_status):
+    handler, port = smtp
+
+    async def scenario():
+        box = outbox(port)
+        message_id = box.enqueue(message("inconnu@example.com"))
+        failed = await wait_status(box, message_id, "failed")
+        assert failed["attempts"] == 1
+        assert "No such user" in failed["error"]
+        await box.close()
+
+    asyncio.run(scenario())
+
+
+def test_message_errors_keep_the_session_open(smtp, wait_status):
+    handler, port = smtp
+    handler.temporary_failures = 1
+
+    async def scenario():
+        box = outbox(port)
+        refused = box.enqueue(message("inconnu@example.com"))
+        await wait_status(box, refused, "failed")
+        retried = box.enqueue(message("alice@example.com", "Réessayé"))
+        await wait_status(box, retried, "sent")
+        sent = box.enqueue(message("bob@example.com"))
+        await wait_status(box, sent, "sent")
+        await box.close()
+
+    asyncio.run(scenario())
+    assert len(handler.received) == 2
+    assert handler.connections == 1  # ni le 550 ni le 451 ne ferment la session
+
+
+def test_email_status_tool(smtp, monkeypatch, wait_status):
+    handler, port = smtp
+
+    async def scenario():
+        box = outbox(port)
+        monkeypatch.setattr(mcp_server, "email_outbox", box)
+        queued = json.loads(mcp_server.send_email("alice@example.com", "Rappel", "Bonjour"))
+        assert queued["status"] == "queued"
+
+        await wait_status(box, queued["message_id"], "sent")
+        status = json.loads(mcp_server.email_status(queued["message_id"]))
+        assert status["status"] == "sent"
+        assert status["to"] == "alice@example.com" and status["subject"] == "Rappel"
+
+        assert json.loads(mcp_server.email_status("inconnu"))["status"] == "error"
+        assert json.loads(mcp_server.send_email("pas une adresse", "x", "y"))["status"] == "error"
+        await box.close()
+
+    asyncio.run(scenario())
+    assert "Subject: Rappel" in handler.received[0]
@@ -0,0 +1,90 @@
+import asyncio
+
+from mcp.server import FastMCP
+from mcp.types import CallToolResult, ImageContent, TextContent
+
+from api.services.inprocess_mcp import InProcessToolSpec, content_text
+from bench.fake_mcp import build_server
+
+
+def tools() -> dict:
+    return {tool.metadata.name: tool for tool in asyncio.run(InProcessToolSpec(build_server(0)).to_tool_list_async())}
+
+
+def test_same_tools_as_the_server():
+    assert sorted(tools()) == ["email_status", "home_automation_status", "home_automation_toggle_device",
+                               "send_email", "time", "weather"]
+
+
+def test_acall_returns_structured_results():
+    toggle, weather = tools()["home_automation_toggle_device"], tools()["weather"]
+
+    async def scenario():
+        output = await toggle.acall(device_name="salon", state="ON")
+        assert output.raw_output == {"result": {"status": "success", "message": "salon switched on"}}
+        assert not output.is_error
+
+        output = await weather.acall(location="Lyon", hours=6)
+        assert output.raw_output["type"] == "raw_weather_data" and len(output.raw_output["data"]) == 2
+
+    asyncio.run(scenario())
+
+
+def test_call_runs_outside_and_inside_an_event_loop():
+    time_tool = tools()["time"]
+    assert time_tool.call().content.startswith("Le temps est")
+
+    async def scenario():
+        # Boucle déjà active : asyncio_run exécute l'appel sur une boucle dédiée dans un thread
+        return time_tool.call()
+
+    assert asyncio.run(scenario()).raw_output.startswith("Le temps est")
+
+
+def test_invalid_arguments_are_tool_errors():
+    output = asyncio.run(tools()["weather"].acall())
+    assert output.is_error and "location" in output.content
+
+
+def test_content_blocks_conversion():
+    assert content_text([TextContent(type="text", text='{"a": 1}')]) == ('{"a": 1}', False)
+    assert content_text(([TextContent(type="text", text="ok")], {"result": "ok"})) == ("ok", False)
+    failed = CallToolResult(content=[TextContent(type="text", text="boom")], isError=True)
+    assert content_text(failed) == ("boom", True)
+    image = ImageContent(type="image", data="aGk=", mimeType="image/png")
+    assert '"mimeType":"image/png"' in content_text([image])[0]
+
+
+def test_tool_with_output_schema():
+    server = FastMCP("test")
+
+    @server.tool()
+    def add(a: int, b: int) -> int:
+        return a + b
+
+    tool = asyncio.run(InProcessToolSpec(server).to_tool_list_async())[0]
+    assert tool.call(a=2, b=3).raw_output == 5
+
+
+def test_real_server_matches_the_sse_spec():
+    import mcp_server
+    from llama_index.tools.mcp import McpToolSpec
+    from mcp.shared.memory import create_connected_server_and_client_session
+
+    from api.services.agent_cache import tools_signature
+
+    async def scenario():
+        inprocess = await InProcessToolSpec(mcp_server.mcp).to_tool_list_async()
+        # Client MCP réel (protocole complet, transport mémoire au lieu de SSE) sur le même serveur
+        async with create_connected_server_and_client_session(mcp_server.mcp._mcp_server) as session:
+            remote = await McpToolSpec(client=session).to_tool_list_async()
+        return inprocess, remote
+
+    inprocess, remote = asyncio.run(scenario())
+    assert [t.metadata.name for t in inprocess] == [t.metadata.name for t in remote]
+    assert {"weather", "send_email", "home_automation_toggle_device"} <= {t.metadata.name for t in remote}
+    for local, sse in zip(inprocess, remote):
+        assert local.metadata.description == sse.metadata.description
+        assert local.metadata.get_parameters_dict() == sse.metadata.get_parameters_dict(), local.metadata.name
+    # Même empreinte : basculer MCP_TRANSPORT ne reconstruit pas l'agent pour rien
+    assert tools_signature(inprocess) == tools_signature(remote)
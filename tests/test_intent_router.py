@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from api.services.intent_router import IntentRouter
+
+router = IntentRouter(["salon", "Lumière du salon", "chambre"])
+
+
+def test_device_reply_comes_from_the_tool_result():
+    intent = router.match("Allume le salon")
+    assert intent.tool_kwargs == {"device_name": "salon", "state": "on"}
+
+    success = {"result": {"status": "success", "message": "salon switched on"}}
+    assert intent.reply(success, json.dumps(success)) == "salon switched on"
+
+    failure = {"result": {"status": "error", "message": "salon: {'192.0.2.10': 'error: Host unreachable'}"}}
+    assert intent.reply(failure, json.dumps(failure)) == failure["result"]["message"]
+
+
+def test_tool_error_is_returned_as_is():
+    intent = router.match("éteins la lumière du salon")
+    message = "Tool home_automation_toggle_device timed out after 5 seconds"
+    assert intent.reply({"raw": message}, message, is_error=True) == message
+
+
+def test_weather_reply_depends_on_the_output():
+    intent = router.match("Quelle est la météo à Lyon ?")
+    assert intent.tool_kwargs == {"location": "Lyon"}
+
+    forecast = {"type": "raw_weather_data", "location": "Lyon", "data": []}
+    assert intent.reply(forecast, json.dumps(forecast)) == "Done"
+
+    not_found = "Désolé, je n'ai pas pu trouver la météo pour Lyon. Veuillez vérifier le nom de la ville."
+    assert intent.reply({"raw": not_found}, not_found) == not_found
+
+
+def test_time_reply_is_the_tool_text():
+    intent = router.match("Quelle heure est-il ?")
+    assert intent.reply({"raw": "Le temps est 09:12:00"}, "Le temps est 09:12:00") == "Le temps est 09:12:00"
+
+
+@pytest.mark.parametrize("text", [
+    "meteo pour demain", "Météo de la semaine", "quel temps fait-il aujourd'hui ?", "météo pour ce week-end",
+    "Quelle est la météo à Paris demain ?", "météo du jour", "météo ici", "weather for tomorrow",
+    "what's the weather in my city", "météo pour la semaine prochaine", "météo de lundi",
+])
+def test_weather_without_a_place_is_left_to_the_agent(text):
+    assert router.match(text) is None
+
+
+@pytest.mark.parametrize("text, city", [
+    ("météo à Saint-Étienne", "Saint-Etienne"), ("météo à La Rochelle", "La Rochelle"),
+    ("quel temps fait-il au Mans", "Mans"), ("weather in New York", "New York"),
+])
+def test_weather_for_a_place(text, city):
+    assert router.match(text).tool_kwargs == {"location": city}
+
+
+def test_ambiguous_requests_are_left_to_the_agent():
+    assert router.match("Allume le garage") is None
+    assert router.match("Peux-tu traduire bonjour en anglais ?") is None
@@ -0,0 +1,164 @@
+import asyncio
+import time
+
+import pytest
+from kasa import KasaException
+
+from mcp_tools.kasa_registry import KasaRegistry
+
+SALON, CHAMBRE = "192.0.2.10", "192.0.2.11"
+DEVICE_MAP = {"salon": SALON, "Lumière du salon": SALON, "chambre": CHAMBRE}
+
+
+class FakeDevice:
+    """Prise Kasa locale : mêmes méthodes que kasa.Device utilisées par le registre."""
+
+    def __init__(self, host: str, is_on: bool = False, delay: float = 0.0):
+        self.host = host
+        self.is_on = is_on
+        self.delay = delay
+        self.updates = 0
+        self.commands: list[str] = []
+        self.fail_next: list[Exception] = []  # erreurs levées par les prochaines commandes
+        self.disconnected = False
+
+    async def _command(self, name: str):
+        await asyncio.sleep(self.delay)
+        if self.fail_next:
+            raise self.fail_next.pop(0)
+        self.commands.append(name)
+
+    async def update(self):
+        self.updates += 1
+        await self._command("update")
+
+    async def turn_on(self):
+        await self._command("on")
+        self.is_on = True
+
+    async def turn_off(self):
+        await self._command("off")
+        self.is_on = False
+
+    async def disconnect(self):
+        self.disconnected = True
+
+
+class FakeNetwork:
+    """Découverte simulée : un appareil par hôte, hôtes hors ligne configurables."""
+
+    def __init__(self, delay: float = 0.0):
+        self.devices = {SALON: FakeDevice(SALON, delay=delay), CHAMBRE: FakeDevice(CHAMBRE, is_on=True, delay=delay)}
+        self.offline: set[str] = set()
+        self.connections: list[str] = []
+
+    async def connect(self, host: str):
+        self.connections.append(host)
+        if host in self.offline:
+            raise OSError(f"Host unreachable: {host}")
+        device = FakeDevice(host, self.devices[host].is_on, self.devices[host].delay)
+        self.devices[host] = device  # nouvelle connexion = nouveau handle
+        return device
+
+
+def registry(network: FakeNetwork, **kwargs) -> KasaRegistry:
+    return KasaRegistry(DEVICE_MAP, connect=network.connect, **kwargs)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_start_discovers_once_and_commands_reuse_handles():
+    async def scenario():
+        network = FakeNetwork()
+        kasa = registry(network)
+        await kasa.start()
+        assert sorted(network.connections) == [SALON, CHAMBRE]
+
+        assert await kasa.set_state("salon", True) == {SALON: "success"}
+        assert await kasa.set_state("Lumière du salon", False) == {SALON: "success"}
+        assert network.devices[SALON].commands == ["update", "on", "off"]
+        assert sorted(network.connections) == [SALON, CHAMBRE]  # aucune nouvelle découverte
+
+        await kasa.close()
+        assert network.devices[SALON].disconnected
+
+    run(scenario())
+
+
+def test_state_is_cached_until_ttl_or_refresh():
+    async def scenario():
+        network = FakeNetwork()
+        kasa = registry(network, state_ttl_seconds=60)
+        await kasa.start()
+        await kasa.set_state("chambre", False)
+
+        assert await kasa.get_state("chambre") == {CHAMBRE: False}
+        assert network.devices[CHAMBRE].updates == 1  # seulement la connexion initiale
+
+        network.devices[CHAMBRE].is_on = True  # changé depuis l'application Kasa
+        assert await kasa.get_state("chambre") == {CHAMBRE: False}
+        assert await kasa.get_state("chambre", refresh=True) == {CHAMBRE: True}
+        assert network.devices[CHAMBRE].updates == 2
+
+    run(scenario())
+
+
+def test_stale_connection_reconnects_and_retries_once():
+    async def scenario():
+        network = FakeNetwork()
+        kasa = registry(network)
+        await kasa.start()
+        stale = network.devices[SALON]
+        stale.fail_next.append(KasaException("Connection reset"))
+
+        assert await kasa.set_state("salon", True) == {SALON: "success"}
+        assert stale.disconnected
+        assert network.connections.count(SALON) == 2
+        assert network.devices[SALON].is_on
+
+    run(scenario())
+
+
+def test_offline_device_reports_error_without_blocking_the_group():
+    async def scenario():
+        network = FakeNetwork()
+        network.offline.add(CHAMBRE)
+        kasa = registry(network)
+        await kasa.start()  # l'échec de découverte n'empêche pas le démarrage
+        assert "unreachable" in kasa.stats()[CHAMBRE]["last_error"]
+
+        result = await kasa.set_state("all", True)
+        assert result[SALON] == "success"
+        assert result[CHAMBRE].startswith("error:")
+        assert await kasa.get_state("all", refresh=True) == {SALON: True, CHAMBRE: None}
+
+        # Appareil revenu : reconnecté au premier usage
+        network.offline.clear()
+        assert await kasa.set_state("chambre", False) == {CHAMBRE: "success"}
+        assert kasa.stats()[CHAMBRE] == {"connected": True, "is_on": False, "last_error": None}
+
+    run(scenario())
+
+
+def test_group_status_and_batch_commands_run_concurrently():
+    async def scenario():
+        network = FakeNetwork(delay=0.1)
+        kasa = registry(network)
+        await kasa.start()
+
+        started = time.perf_counter()
+        assert await kasa.set_state("toutes les lumières", False) == {SALON: "success", CHAMBRE: "success"}
+        assert time.perf_counter() - started < 0.18  # deux appareils à 0,1 s chacun, en parallèle
+
+        assert await kasa.get_state("lights") == {SALON: False, CHAMBRE: False}
+        assert await kasa.get_state("salon, chambre, salon") == {SALON: False, CHAMBRE: False}
+
+    run(scenario())
+
+
+def test_unknown_target_raises_key_error():
+    kasa = registry(FakeNetwork())
+    with pytest.raises(KeyError):
+        kasa.resolve("garage")
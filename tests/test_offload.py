@@ -0,0 +1,115 @@
+import asyncio
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+from api.services import offload
+from api.services.asr import pcm16_to_float32
+from api.services.offload import LocalBackend, ModalBackend, Offloader, encode_audio
+
+
+class FakeBackend:
+    """Backend simulé : répond avec son nom, ou échoue / bloque à la demande."""
+
+    interruptible = True
+
+    def __init__(self, name: str, error: BaseException = None, delay: float = 0.0):
+        self.name = name
+        self.error = error
+        self.delay = delay
+        self.pending = 0
+        self.jobs: list[str] = []
+
+    async def run(self, job: str, payload: dict):
+        self.jobs.append(job)
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return f"{self.name}:{job}"
+
+    def close(self):
+        pass
+
+
+def offloader(local=None, remote=None, **kwargs) -> Offloader:
+    return Offloader(local or FakeBackend("local"), remote, **kwargs)
+
+
+def test_accepts_only_above_the_threshold():
+    off = offloader(thresholds={"transcribe": 3, "translate": 2})
+    assert not off.accepts("transcribe", 2) and off.accepts("transcribe", 3)
+    assert not off.accepts("translate", 5)  # pas d'instance Ollama dédiée
+    assert offloader(thresholds={"translate": 2}, ollama_host="http://gpu:11434/").accepts("translate", 2)
+    assert not offloader().accepts("transcribe", 100)  # seuil 0 : jamais
+
+
+def test_backend_for_overflows_to_modal():
+    local, remote = FakeBackend("local"), FakeBackend("modal")
+    assert offloader(local).backend_for("transcribe") is local  # Modal désactivé
+    off = offloader(local, remote, remote_depth=2)
+    assert off.backend_for("transcribe") is local
+    local.pending = 2
+    assert off.backend_for("transcribe") is remote
+    assert off.queue_depth("modal") == 0 and off.queue_depth("local") == 2
+
+
+@pytest.mark.parametrize("remote", [FakeBackend("modal", error=RuntimeError("app non déployée")),
+                                    FakeBackend("modal", delay=1.0)])
+def test_modal_failure_falls_back_to_the_local_pool(remote):
+    local = FakeBackend("local")
+    off = offloader(local, remote, remote_depth=0, remote_timeout_seconds=0.05)
+    assert asyncio.run(off.run("transcribe", {})) == "local:transcribe"
+    assert remote.jobs == local.jobs == ["transcribe"]
+    assert off.counters["fallbacks"] == 1 and off.counters["modal"] == off.counters["local"] == 1
+    assert remote.pending == local.pending == 0
+
+
+def test_encode_audio_round_trip():
+    audio = np.linspace(-1.0, 1.0, 1001, dtype=np.float32)
+    data = encode_audio(audio)
+    assert len(data) == audio.size * 2
+    assert np.abs(pcm16_to_float32(data) - audio).max() <= 1 / 32768
+    # Saturation plutôt que débordement
+    assert pcm16_to_float32(encode_audio(np.array([1.5, -1.5], dtype=np.float32))).tolist() == [32767 / 32768, -1.0]
+
+
+def test_timed_out_local_job_stays_pending_until_it_finishes(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setitem(offload.JOBS, "transcribe", lambda payload: release.wait(5) and "tardif")
+    local = LocalBackend()
+    local._executor = ThreadPoolExecutor(1)  # à la place du pool de processus
+    off = offloader(local, ModalBackend("app"), remote_depth=1, local_timeout_seconds=0.05)
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await off.run("transcribe", {})
+        # Le worker est toujours occupé : compté, donc le job suivant déborde vers Modal
+        assert local.pending == 1 and off.backend_for("transcribe") is off.remote
+        release.set()
+        for _ in range(100):
+            if local.pending == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert local.pending == 0 and off.backend_for("transcribe") is local
+
+    asyncio.run(scenario())
+    assert off.counters["timeouts"] == 1
+    local.close()
+
+
+class BrokenExecutor(Executor):
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_exception(BrokenProcessPool("worker tué"))
+        return future
+
+
+def test_broken_pool_is_replaced_on_next_job():
+    local = LocalBackend()
+    local._executor = BrokenExecutor()
+    with pytest.raises(BrokenProcessPool):
+        asyncio.run(offloader(local).run("transcribe", {}))
+    assert local._executor is None and local.pending == 0
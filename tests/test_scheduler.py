@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+
+from api.services.scheduler import Rejected, Scheduler
+
+
+def scheduler(**kwargs) -> Scheduler:
+    options = {"slots": {"llm": 1}, "max_queue": 8, "client_rate": 0, "poll_seconds": 0.01} | kwargs
+    return Scheduler(**options)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_slots_are_granted_by_priority_then_arrival():
+    async def scenario():
+        sched = scheduler()
+        held = await sched.acquire("llm", "ask")
+        order = []
+
+        async def wait(priority_class, name):
+            ticket = await sched.acquire("llm", priority_class)
+            order.append(name)
+            sched.release(ticket)
+
+        waiters = [asyncio.create_task(wait(priority_class, name)) for priority_class, name in
+                   [("batch", "batch"), ("translate", "translate-1"), ("voice", "voice"),
+                    ("translate", "translate-2")]]
+        await settle()
+        assert sched.queue_depth("llm") == 4 and sched.queue_depth("llm", "translate") == 2
+        sched.release(held)
+        await asyncio.gather(*waiters)
+        assert order == ["voice", "translate-1", "translate-2", "batch"]
+        assert sched.active("llm") == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_evicts_the_lowest_class():
+    async def scenario():
+        sched = scheduler(max_queue=2)
+        held = await sched.acquire("llm", "ask")
+        batch = asyncio.create_task(sched.acquire("llm", "batch"))
+        translate = asyncio.create_task(sched.acquire("llm", "translate"))
+        await settle()
+
+        voice = asyncio.create_task(sched.acquire("llm", "voice"))
+        await settle()
+        with pytest.raises(Rejected) as evicted:
+            await batch
+        assert (evicted.value.status_code, evicted.value.reason) == (503, "evicted")
+
+        # File pleine de requêtes au moins aussi prioritaires : la nouvelle est refusée
+        with pytest.raises(Rejected) as refused:
+            await sched.acquire("llm", "translate")
+        assert refused.value.reason == "queue_full" and refused.value.retry_after >= 1
+
+        sched.release(held)
+        sched.release(await voice)
+        sched.release(await translate)
+        assert sched.counters["evicted"] == 1 and sched.counters["rejected"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_wait_expires_at_the_deadline():
+    async def scenario():
+        sched = scheduler(max_wait={"translate": 0.05})
+        held = await sched.acquire("llm", "ask")
+        with pytest.raises(Rejected) as expired:
+            await sched.acquire("llm", "translate")
+        assert (expired.value.status_code, expired.value.reason) == (503, "deadline")
+        with pytest.raises(Rejected):
+            await sched.acquire("llm", "ask", timeout=0.02)  # X-Request-Timeout du client
+        assert sched.queue_depth("llm") == 0
+        sched.release(held)
+        assert sched.active("llm") == 0
+
+    asyncio.run(scenario())
+
+
+def test_client_gone_while_waiting():
+    async def scenario():
+        sched = scheduler()
+        held = await sched.acquire("llm", "ask")
+
+        async def gone():
+            return True
+
+        with pytest.raises(Rejected) as left:
+            await sched.admit("client", "ask", "llm", is_disconnected=gone)
+        assert left.value.status_code == 499
+        assert sched.stats()["clients"] == 0 and sched.queue_depth("llm") == 0
+        sched.release(held)
+
+    asyncio.run(scenario())
+
+
+def test_client_concurrency_limit():
+    async def scenario():
+        sched = scheduler(client_concurrency=2)
+        leases = [await sched.admit("alice", "ask") for _ in range(2)]
+        with pytest.raises(Rejected) as limited:
+            await sched.admit("alice", "ask")
+        assert (limited.value.status_code, limited.value.reason) == (429, "client_concurrency")
+        await sched.admit("bob", "ask")  # autre client : non concerné
+
+        leases[0].release()
+        leases[0].release()  # idempotent
+        await sched.admit("alice", "ask")
+
+    asyncio.run(scenario())
+
+
+def test_client_rate_limit():
+    async def scenario():
+        sched = scheduler(client_rate=10, client_burst=3)
+        for _ in range(3):
+            (await sched.admit("alice", "ask")).release()
+        with pytest.raises(Rejected) as limited:
+            await sched.admit("alice", "ask")
+        assert (limited.value.status_code, limited.value.reason) == (429, "client_rate")
+        assert limited.value.retry_after == 1
+        await asyncio.sleep(0.12)  # un jeton regagné
+        (await sched.admit("alice", "ask")).release()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_releases_its_place_and_slot():
+    async def scenario():
+        sched = scheduler()
+        held = await sched.acquire("llm", "ask")
+        waiting = asyncio.create_task(sched.acquire("llm", "translate"))
+        await settle()
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert sched.queue_depth("llm") == 0
+
+        # Slot accordé puis requête annulée avant de le prendre : rendu aussitôt
+        granted = asyncio.create_task(sched.acquire("llm", "translate"))
+        await settle()
+        sched.release(held)
+        granted.cancel()
+        await asyncio.gather(granted, return_exceptions=True)
+        assert sched.active("llm") == 0
+
+        async with sched.slot("llm", "ask"):
+            assert sched.active("llm") == 1
+        assert sched.active("llm") == 0
+
+    asyncio.run(scenario())
+
+
+def test_unknown_priority_class():
+    with pytest.raises(ValueError):
+        scheduler().try_acquire("llm", "inconnue")
@@ -0,0 +1,35 @@
+from api.services.sessions import SessionStore
+
+
+def test_discuss_turn_keeps_its_ollama_context():
+    store = SessionStore(context_token_budget=10)
+    session = store.get("s1")
+    session.add_turn("Bonjour", "Salut !", [1, 2, 3])
+    assert store.usable_context(session) == [1, 2, 3]
+
+
+def test_turn_without_context_invalidates_it():
+    store = SessionStore()
+    session = store.get("s1")
+    session.add_turn("Bonjour", "Salut !", [1, 2, 3])
+    # Tour /ask : absent du contexte Ollama, le /discuss suivant doit repartir de l'historique
+    session.add_turn("Allume le salon", "salon switched on")
+    assert store.usable_context(session) is None
+    assert [m["content"] for m in session.history] == ["Bonjour", "Salut !", "Allume le salon", "salon switched on"]
+
+
+def test_context_over_budget_is_dropped():
+    store = SessionStore(context_token_budget=2)
+    session = store.get("s1")
+    session.add_turn("Bonjour", "Salut !", [1, 2, 3])
+    assert store.usable_context(session) is None and session.ollama_context is None
+
+
+def test_history_is_trimmed_from_the_oldest_user_turn():
+    store = SessionStore(history_token_budget=8)
+    session = store.get("s1")
+    for i in range(4):
+        session.add_turn(f"question {i}", f"réponse {i}")
+    store.trim(session)
+    assert session.history[0]["role"] == "user"
+    assert session.history[-1]["content"] == "réponse 3"
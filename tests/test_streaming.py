@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+import pytest
+
+from api.services.llm_pool import GenerationFailed
+from api.services.streaming import EventStreamer, EventStreamResponse
+
+
+def delta(event: dict):
+    return "delta" if "field" in event else None
+
+
+def decode(frames: list[bytes], fmt: str) -> list[dict]:
+    text = b"".join(frames).decode()
+    if fmt == "ndjson":
+        return [json.loads(line) for line in text.splitlines()]
+    assert text.endswith("\n\n")
+    return [json.loads(block.removeprefix("data: ")) for block in text.split("\n\n") if block]
+
+
+async def collect(streamer: EventStreamer, events, fmt: str = "ndjson") -> list[dict]:
+    return decode([frame async for frame in streamer.frames(events, fmt, delta)], fmt)
+
+
+async def tokens(*items, delay: float = 0.0, error: BaseException = None):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+    if error is not None:
+        raise error
+
+
+def test_consecutive_deltas_are_coalesced_by_field():
+    streamer = EventStreamer(flush_interval_seconds=1.0, flush_bytes=1024)
+    events = tokens({"field": "translation", "delta": "Hel"}, {"field": "translation", "delta": "lo"},
+                    {"field": "explanation", "delta": "Sal"}, {"field": "explanation", "delta": "ut"},
+                    {"type": "done"}, {"field": "translation", "delta": "!"})
+    assert asyncio.run(collect(streamer, events)) == [
+        {"field": "translation", "delta": "Hello"},
+        {"field": "explanation", "delta": "Salut"},
+        {"type": "done"},
+        {"field": "translation", "delta": "!"},
+    ]
+
+
+def test_flush_on_bytes():
+    streamer = EventStreamer(flush_interval_seconds=1.0, flush_bytes=4)
+    events = tokens(*({"field": "translation", "delta": c} for c in "abcdef"))
+    assert [e["delta"] for e in asyncio.run(collect(streamer, events))] == ["abcd", "ef"]
+
+
+def test_flush_on_deadline():
+    streamer = EventStreamer(flush_interval_seconds=0.05, flush_bytes=1024)
+
+    async def scenario():
+        events = tokens({"field": "translation", "delta": "a"}, {"field": "translation", "delta": "b"},
+                        {"field": "translation", "delta": "c"}, delay=0.04)
+        frames = streamer.frames(events, "ndjson", delta)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        first = json.loads(await anext(frames))
+        # Premier delta envoyé à l'échéance, sans attendre la fin du stream
+        assert first["delta"] in ("a", "ab") and loop.time() - started < 0.12
+        rest = [json.loads(frame) async for frame in frames]
+        assert first["delta"] + "".join(e["delta"] for e in rest) == "abc"
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("fmt", ["sse", "ndjson"])
+def test_failure_ends_with_an_error_frame(fmt):
+    streamer = EventStreamer(flush_interval_seconds=1.0)
+    events = tokens({"field": "translation", "delta": "Hel"},
+                    error=GenerationFailed("Ollama 500: model crashed"))
+    assert asyncio.run(collect(streamer, events, fmt)) == [
+        {"field": "translation", "delta": "Hel"},
+        {"type": "error", "content": "Ollama 500: model crashed"},
+    ]
+
+
+def test_error_without_message_uses_the_exception_name():
+    events = tokens(error=TimeoutError())
+    assert asyncio.run(collect(EventStreamer(), events)) == [{"type": "error", "content": "TimeoutError"}]
+
+
+def test_disconnect_cancels_the_generator_and_calls_on_close():
+    streamer = EventStreamer(flush_interval_seconds=0)
+    state = {"closed": False, "on_close": 0}
+
+    async def endless():
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield {"field": "translation", "delta": "x"}
+        finally:
+            state["closed"] = True
+
+    async def scenario():
+        sent = []
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if sum(1 for m in sent if m["type"] == "http.response.body") == 3:
+                disconnected.set()
+
+        response = EventStreamResponse(streamer.frames(endless(), "ndjson", delta), media_type="application/x-ndjson",
+                                       endpoint="test", on_close=lambda: state.__setitem__("on_close", 1))
+        await asyncio.wait_for(response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send), 2)
+        return sent
+
+    sent = asyncio.run(scenario())
+    assert sent[0]["type"] == "http.response.start"
+    assert state == {"closed": True, "on_close": 1}
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from api.services.llm_pool import GenerationFailed
+from api.services.translation_cache import TranslationCache, cache_key
+
+KEY = cache_key("llama3.2", "français", "anglais", "Bonjour")
+VALUES = {"translation": "Hello", "language": "FRANÇAIS", "explanation": "Salutation.", "correction": "Bonjour"}
+
+
+def generator(events, error=None, calls=None):
+    async def generate():
+        if calls is not None:
+            calls.append(1)
+        for event in events:
+            await asyncio.sleep(0)
+            yield event
+        if error is not None:
+            raise error
+    return generate
+
+
+async def collect(cache, generate):
+    return [event async for event in cache.stream(KEY, generate)]
+
+
+def test_completed_generation_is_cached_and_replayed(tmp_path):
+    async def scenario():
+        cache = TranslationCache(db_path=str(tmp_path / "cache.db"))
+        calls = []
+        events = await collect(cache, generator(TranslationCache.replay(VALUES), calls=calls))
+        assert events == TranslationCache.replay(VALUES)
+        assert await cache.get(KEY) == VALUES
+        assert await collect(cache, generator([], calls=calls)) == events
+        assert len(calls) == 1
+        cache.close()
+        # Relu depuis SQLite après redémarrage
+        reopened = TranslationCache(db_path=str(tmp_path / "cache.db"))
+        assert await reopened.get(KEY) == VALUES
+        reopened.close()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("error", [GenerationFailed("Ollama 500: model not found"),
+                                   GenerationFailed("Stream Ollama interrompu avant le chunk final")])
+def test_failed_or_cut_generation_is_not_cached(tmp_path, error):
+    async def scenario():
+        cache = TranslationCache(db_path=str(tmp_path / "cache.db"))
+        partial = [{"field": "translation", "delta": "Hel"}]
+        with pytest.raises(GenerationFailed):
+            await collect(cache, generator(partial, error=error))
+        assert await cache.get(KEY) is None
+        assert not cache.peek(KEY)
+        # La requête suivante relance une génération
+        assert await collect(cache, generator(TranslationCache.replay(VALUES))) == TranslationCache.replay(VALUES)
+        cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_empty_translation_is_not_cached():
+    async def scenario():
+        cache = TranslationCache()
+        with pytest.raises(ValueError):
+            await collect(cache, generator([{"field": "language", "delta": "FRANÇAIS"}]))
+        assert await cache.get(KEY) is None
+        assert cache.stats()["rejected"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_requests_share_one_generation_and_its_error():
+    async def scenario():
+        cache = TranslationCache()
+        calls = []
+        generate = generator([{"field": "translation", "delta": "Hel"}], error=GenerationFailed("coupé"), calls=calls)
+        results = await asyncio.gather(collect(cache, generate), collect(cache, generate), return_exceptions=True)
+        assert all(isinstance(result, GenerationFailed) for result in results)
+        assert len(calls) == 1
+        assert cache.stats()["coalesced"] == 1
+        assert await cache.get(KEY) is None
+
+    asyncio.run(scenario())
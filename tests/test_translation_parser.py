@@ -0,0 +1,103 @@
+"""
+Rejoue des streams Ollama (/api/generate, NDJSON) enregistrés dans tests/fixtures/ollama à travers
+TranslationStreamParser, découpés de plusieurs façons : le résultat doit toujours être le même.
+"""
+import json
+import random
+from pathlib import Path
+
+import pytest
+
+from api.services.translation_parser import FIELDS, SEPARATOR, TranslationStreamParser
+
+FIXTURES = Path(__file__).parent / "fixtures" / "ollama"
+EXPECTED = json.loads((FIXTURES / "expected.json").read_text(encoding="utf-8"))
+
+
+def recorded_tokens(name: str) -> list[str]:
+    lines = [json.loads(line) for line in (FIXTURES / name).read_text(encoding="utf-8").splitlines() if line]
+    assert lines[-1]["done"], "stream enregistré sans chunk final"
+    return [line["response"] for line in lines if line["response"]]
+
+
+def replay(chunks: list[str]) -> tuple[dict, list[dict]]:
+    parser = TranslationStreamParser()
+    events = []
+    for chunk in chunks:
+        events += parser.feed(chunk)
+    events += parser.finish()
+    return parser.values, events
+
+
+def rebuilt(events: list[dict]) -> dict:
+    values = {name: "" for name in FIELDS}
+    for event in events:
+        values[event["field"]] += event["delta"]
+    return values
+
+
+def split_at(text: str, cuts: set[int]) -> list[str]:
+    bounds = [0, *sorted(c for c in cuts if 0 < c < len(text)), len(text)]
+    return [text[a:b] for a, b in zip(bounds, bounds[1:]) if a < b]
+
+
+def separator_cuts(text: str) -> set[int]:
+    """Coupures avant, dans et après chaque "|||"."""
+    cuts = set()
+    start = text.find(SEPARATOR)
+    while start != -1:
+        cuts.update(range(start, start + len(SEPARATOR) + 1))
+        start = text.find(SEPARATOR, start + 1)
+    return cuts
+
+
+@pytest.fixture(params=sorted(EXPECTED))
+def recording(request):
+    return request.param, recorded_tokens(request.param)
+
+
+def test_recorded_tokens(recording):
+    name, tokens = recording
+    values, events = replay(tokens)
+    assert values == EXPECTED[name]
+    assert rebuilt(events) == values
+
+
+def test_single_chunk(recording):
+    name, tokens = recording
+    assert replay(["".join(tokens)])[0] == EXPECTED[name]
+
+
+def test_one_character_per_chunk(recording):
+    name, tokens = recording
+    assert replay(list("".join(tokens)))[0] == EXPECTED[name]
+
+
+def test_cut_inside_separators(recording):
+    name, tokens = recording
+    text = "".join(tokens)
+    cuts = sorted(separator_cuts(text))
+    for cut in cuts:
+        assert replay(split_at(text, {cut}))[0] == EXPECTED[name], f"coupure à {cut}"
+    assert replay(split_at(text, set(cuts)))[0] == EXPECTED[name]
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_random_chunk_boundaries(recording, seed):
+    name, tokens = recording
+    text = "".join(tokens)
+    rng = random.Random(seed)
+    cuts = set(rng.sample(range(1, len(text)), k=rng.randint(1, min(40, len(text) - 1))))
+    values, events = replay(split_at(text, cuts))
+    assert values == EXPECTED[name]
+    assert rebuilt(events) == values
+
+
+def test_deltas_are_compact(recording):
+    _, tokens = recording
+    _, events = replay(tokens)
+    assert all(event["delta"] for event in events)
+    assert all(SEPARATOR not in event["delta"] for event in events)
+    # Un seul événement par champ pour un morceau donné
+    events = TranslationStreamParser().feed("".join(tokens))
+    assert len(events) == len({event["field"] for event in events})
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+import numpy as np
+
+from api.services.asr import OverlapJoiner
+from api.services.voice_session import VoiceSession
+
+
+def replay(segments: list[tuple[str, str]]) -> tuple[list[dict], list[str]]:
+    """Rejoue des segments (kind, texte Whisper) dans une session ; retourne (événements envoyés, textes de l'agent)."""
+    texts = iter(text for _, text in segments)
+    sent = []
+    agent = []
+
+    async def transcribe(audio, final):
+        return next(texts)
+
+    async def run_agent(text):
+        agent.append(text)
+        return
+        yield
+
+    async def send(event):
+        sent.append(event)
+
+    async def scenario():
+        session = VoiceSession(None, transcribe, run_agent, send)
+        session.start()
+        for kind, _ in segments:
+            await session.asr_queue.put((kind, np.zeros(160, dtype=np.float32), time.perf_counter()))
+        while not (session.asr_queue.empty() and session.agent_queue.empty() and session.send_queue.empty()):
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        await session.close()
+
+    asyncio.run(scenario())
+    return sent, agent
+
+
+def transcriptions(segments: list[tuple[str, str]]) -> list[str]:
+    sent, agent = replay(segments)
+    assert [event["content"] for event in sent if event.get("type") == "transcription"] == agent
+    return agent
+
+
+def test_repeated_commands_after_normal_finals_are_kept():
+    assert transcriptions([("final", "Oui."), ("final", "Oui."), ("final", "Allume le salon."),
+                           ("final", "Allume le salon.")]) == ["Oui.", "Oui.", "Allume le salon.", "Allume le salon."]
+
+
+def test_cut_segments_reach_the_agent_as_one_utterance():
+    segments = [("cut", "Peux-tu me donner la météo à"), ("cut", "météo à Lyon pour demain et"),
+                ("final", "demain et après-demain"), ("final", "après-demain")]
+    sent, agent = replay(segments)
+    # Recouvrement retiré seulement après un découpage ; un seul énoncé pour la phrase découpée
+    assert agent == ["Peux-tu me donner la météo à Lyon pour demain et après-demain", "après-demain"]
+    partials = [event["content"] for event in sent if event.get("type") == "partial_transcription"]
+    assert partials == ["Peux-tu me donner la météo à", "Peux-tu me donner la météo à Lyon pour demain et"]
+
+
+def test_empty_final_after_cuts_still_sends_the_utterance():
+    assert transcriptions([("cut", "Allume la lumière"), ("final", "")]) == ["Allume la lumière"]
+
+
+def test_joiner_resets_after_an_empty_cut():
+    joiner = OverlapJoiner()
+    assert joiner.join("cut", "bonjour tout") == "bonjour tout"
+    assert joiner.join("cut", "") == ""
+    assert joiner.join("final", "tout le monde") == "tout le monde"
@@ -0,0 +1,140 @@
+import asyncio
+
+import httpx
+import pytest
+
+from mcp_tools import ttl_cache
+from mcp_tools.ttl_cache import TTLCache
+from mcp_tools.weather import FORECAST_URL, GEOCODING_URL, LocationNotFound, WeatherClient, compact_forecast
+
+START = 1_760_600_000  # premier créneau des prévisions
+
+
+def entry(step: int, **extra) -> dict:
+    dt = START + step * 3 * 3600
+    return {
+        "dt": dt,
+        "dt_txt": f"créneau {step}",
+        "main": {"temp": 12.5 + step, "feels_like": 11.0, "temp_min": 10.0, "temp_max": 14.0, "humidity": 70,
+                 "pressure": 1015, "sea_level": 1015, "grnd_level": 990},
+        "weather": [{"id": 500, "main": "Rain", "description": "légère pluie", "icon": "10d"}],
+        "clouds": {"all": 90},
+        "wind": {"speed": 4.2, "deg": 250, "gust": 8.1},
+        "visibility": 10000,
+        "pop": 0.6,
+        "sys": {"pod": "d"},
+        **extra,
+    }
+
+
+class StandInOpenWeather:
+    """API OpenWeatherMap locale (httpx.MockTransport) : compte les appels de géocodage et de prévisions."""
+
+    def __init__(self, cod: str = "200"):
+        self.cod = cod
+        self.calls = {"geocoding": 0, "forecast": 0}
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url.copy_with(query=None))
+        if url == GEOCODING_URL:
+            self.calls["geocoding"] += 1
+            if request.url.params["q"] == "Nullepart":
+                return httpx.Response(200, json=[])
+            return httpx.Response(200, json=[{"name": "Lyon", "lat": 45.7578137, "lon": 4.8320114, "country": "FR"}])
+        assert url == FORECAST_URL and request.url.params["lang"] == "fr"
+        self.calls["forecast"] += 1
+        return httpx.Response(200, json={"cod": self.cod, "list": [entry(step) for step in range(8)]})
+
+
+def weather(api: StandInOpenWeather, **kwargs) -> WeatherClient:
+    client = WeatherClient("test-key", **kwargs)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(api.handle))
+    return client
+
+
+def test_compact_forecast_keeps_the_requested_hours_and_fields():
+    entries = [entry(step) for step in range(8)]
+    compact = compact_forecast(entries, 7)
+    assert [e["dt"] for e in compact] == [START, START + 3 * 3600, START + 6 * 3600]
+    assert compact[0] == {
+        "dt": START,
+        "dt_txt": "créneau 0",
+        "main": {"temp": 12.5, "feels_like": 11.0, "temp_min": 10.0, "temp_max": 14.0, "humidity": 70},
+        "weather": [{"main": "Rain", "description": "légère pluie", "icon": "10d"}],
+        "wind": {"speed": 4.2},
+        "pop": 0.6,
+    }
+    assert len(compact_forecast(entries, 6)) == 2  # créneau à +6 h exclu
+    assert compact_forecast(entries, 0) == [] and compact_forecast([], 24) == []
+
+
+def test_compact_forecast_tolerates_missing_fields():
+    sparse = {"dt": START}
+    assert compact_forecast([sparse], 3) == [
+        {"dt": START, "dt_txt": None, "main": {}, "weather": [{}], "wind": {"speed": None}, "pop": None}]
+
+
+def test_ttl_cache_expiry_and_eviction(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ttl_cache.time, "monotonic", lambda: now[0])
+    cache = TTLCache(ttl_seconds=10, max_entries=2)
+    cache.set("lyon", (45.76, 4.83))
+    now[0] += 9.9
+    assert cache.get("lyon") == (45.76, 4.83)
+    now[0] += 0.2
+    assert cache.get("lyon") is None
+    assert cache.stats() == {"entries": 0, "hits": 1, "misses": 1}
+
+    # Au-delà de max_entries, l'entrée la moins récemment utilisée part
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+def test_geocoding_is_cached_by_normalised_name():
+    api = StandInOpenWeather()
+
+    async def scenario():
+        client = weather(api)
+        first = await client.geocode("Lyon")
+        assert await client.geocode("  lyon ") == first == (45.7578137, 4.8320114)
+        with pytest.raises(LocationNotFound):
+            await client.geocode("Nullepart")
+        await client.aclose()
+        return client
+
+    client = asyncio.run(scenario())
+    assert api.calls["geocoding"] == 2  # Lyon une fois, Nullepart (non mis en cache)
+    assert client.stats()["geocoding"] == {"entries": 1, "hits": 1, "misses": 2}
+
+
+def test_forecast_is_shared_by_nearby_coordinates_until_it_expires():
+    api = StandInOpenWeather()
+
+    async def scenario():
+        client = weather(api, forecast_ttl_seconds=0.05)
+        data = await client.forecast(45.7578137, 4.8320114)
+        assert len(data["list"]) == 8
+        assert await client.forecast(45.7591, 4.8349) is data  # même case de ~1 km
+        await client.forecast(45.8, 4.83)
+        await asyncio.sleep(0.06)
+        await client.forecast(45.7578137, 4.8320114)
+        await client.aclose()
+
+    asyncio.run(scenario())
+    assert api.calls["forecast"] == 3
+
+
+def test_failed_forecast_is_not_cached():
+    api = StandInOpenWeather(cod="401")
+
+    async def scenario():
+        client = weather(api)
+        for _ in range(2):
+            assert (await client.forecast(45.76, 4.83))["cod"] == "401"
+        await client.aclose()
+
+    asyncio.run(scenario())
+    assert api.calls["forecast"] == 2
@@ -0,0 +1,156 @@
+import asyncio
+import io
+import json
+import threading
+
+import httpx
+
+from api.services.webhook_queue import WebhookQueue
+
+URL = "http://n8n.test/webhook/upload"
+
+
+class StandInN8n:
+    """Webhook n8n local (httpx.MockTransport) ; le client peut être indisponible ou défaillant au départ."""
+
+    def __init__(self, unavailable: int = 0, broken: int = 0, status_code: int = 200):
+        self.unavailable = unavailable  # appels à client() qui lèvent RuntimeError (client pas encore ouvert)
+        self.broken = broken  # envois qui lèvent une erreur inattendue (hors httpx.HTTPError)
+        self.status_code = status_code
+        self.received: list[dict] = []
+        self._client = httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.received.append(json.loads(await request.aread()))
+        return httpx.Response(self.status_code)
+
+    def client(self) -> httpx.AsyncClient:
+        if self.unavailable:
+            self.unavailable -= 1
+            raise RuntimeError("Client HTTP n8n non ouvert")
+        if self.broken:
+            self.broken -= 1
+            raise ValueError("URL invalide")
+        return self._client
+
+
+def queue(n8n: StandInN8n, spool_dir, **kwargs) -> WebhookQueue:
+    options = {"concurrency": 1, "max_attempts": 3, "backoff_seconds": 0.01, "max_backoff_seconds": 0.05} | kwargs
+    return WebhookQueue(URL, n8n.client, spool_dir=str(spool_dir), **options)
+
+
+async def enqueue(webhook: WebhookQueue, content: bytes = b"image") -> str:
+    job = await webhook.enqueue(io.BytesIO(content), {"source": "test"},
+                                {"filename": "photo.jpg", "contentType": "image/jpeg"}, len(content))
+    return job["job_id"]
+
+
+def test_delivered(tmp_path, wait_status):
+    n8n = StandInN8n()
+
+    async def scenario():
+        webhook = queue(n8n, tmp_path)
+        await webhook.start()
+        job_id = await enqueue(webhook)
+        status = await wait_status(webhook, job_id, "delivered")
+        assert status["attempts"] == 1 and status["webhook_response"] == 200
+        assert not (tmp_path / f"{job_id}.bin").exists()
+        await webhook.close()
+
+    asyncio.run(scenario())
+    attachment = n8n.received[0]["attachments"][0]
+    assert attachment["filename"] == "photo.jpg" and attachment["content"] == "aW1hZ2U="
+
+
+def test_unexpected_error_is_retried_and_worker_survives(tmp_path, wait_status):
+    n8n = StandInN8n(unavailable=1, broken=1)
+
+    async def scenario():
+        webhook = queue(n8n, tmp_path)
+        await webhook.start()
+        job_id = await enqueue(webhook)
+        retrying = await wait_status(webhook, job_id, "retrying")
+        assert "RuntimeError" in retrying["error"]
+        delivered = await wait_status(webhook, job_id, "delivered")
+        assert delivered["attempts"] == 3
+
+        # Le même worker traite le job suivant
+        assert len(webhook._workers) == 1 and not webhook._workers[0].done()
+        second = await enqueue(webhook)
+        assert (await wait_status(webhook, second, "delivered"))["attempts"] == 1
+        assert webhook.counters["retries"] == 2
+        await webhook.close()
+
+    asyncio.run(scenario())
+    assert len(n8n.received) == 2
+
+
+def test_unexpected_errors_give_up_after_max_attempts(tmp_path, wait_status):
+    n8n = StandInN8n(unavailable=10)
+
+    async def scenario():
+        webhook = queue(n8n, tmp_path)
+        await webhook.start()
+        job_id = await enqueue(webhook)
+        failed = await wait_status(webhook, job_id, "failed")
+        assert failed["attempts"] == 3 and "non ouvert" in failed["error"]
+        assert not webhook._workers[0].done()
+        await webhook.close()
+
+    asyncio.run(scenario())
+    assert n8n.received == []
+
+
+def test_permanent_status_fails_without_retry(tmp_path, wait_status):
+    n8n = StandInN8n(status_code=413)
+
+    async def scenario():
+        webhook = queue(n8n, tmp_path)
+        await webhook.start()
+        job_id = await enqueue(webhook)
+        failed = await wait_status(webhook, job_id, "failed")
+        assert failed["attempts"] == 1 and failed["webhook_response"] == 413
+        await webhook.close()
+
+    asyncio.run(scenario())
+
+
+def test_pending_jobs_are_recovered_from_the_spool(tmp_path, wait_status):
+    n8n = StandInN8n()
+
+    async def scenario():
+        first = queue(n8n, tmp_path)
+        first._queue = asyncio.Queue()  # spool prêt, workers jamais démarrés (arrêt avant l'envoi)
+        job_id = await enqueue(first)
+
+        second = queue(n8n, tmp_path)
+        await second.start()
+        assert second.counters["recovered"] == 1
+        assert (await wait_status(second, job_id, "delivered"))["attempts"] == 1
+        await second.close()
+
+    asyncio.run(scenario())
+
+
+def test_spool_writes_run_off_the_event_loop(tmp_path, wait_status):
+    n8n = StandInN8n()
+    loop_thread = threading.get_ident()
+    writers = []
+
+    async def scenario():
+        webhook = queue(n8n, tmp_path, max_tracked=1)
+        save = webhook._save
+        webhook._save = lambda job: (writers.append(threading.get_ident()), save(job))
+        await webhook.start()
+        first = await enqueue(webhook)
+        await wait_status(webhook, first, "delivered")
+        second = await enqueue(webhook)
+        await wait_status(webhook, second, "delivered")
+        await enqueue(webhook)  # le plus vieux job terminé est oublié
+        await webhook.close()
+        return first
+
+    first = asyncio.run(scenario())
+    # enqueue + "sending" + "delivered" pour les deux premiers jobs, enqueue pour le troisième
+    assert len(writers) == 7 and loop_thread not in writers
+    assert not (tmp_path / f"{first}.json").exists()